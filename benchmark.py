@@ -0,0 +1,439 @@
+"""Banco de pruebas sin conexión para scraper.py.
+
+Levanta un servidor HTTP local que imita el catálogo de euromoto85.com (los
+mismos selectores #itipo/#imarca/#icc/#imodel, table.resultats, listados
+div.vista_fitxes > div.producte con div.paginacio y fichas .detalls), con
+latencia y errores configurables, y mide el scraper contra él:
+tareas/min, páginas/s y memoria máxima (RSS) de cada escenario.
+
+    python benchmark.py                          # todos los escenarios
+    python benchmark.py --escenarios refresco-http --latencia 20
+    python benchmark.py --guardar base.json      # guardar resultados de referencia
+    python benchmark.py --referencia base.json   # fallar si algo empeora más del 10%
+    python benchmark.py --solo-servidor --puerto 8000
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import scraper
+
+# --- CONFIGURACIÓN ---
+MARCAS_POR_TIPO = 3
+CCS_POR_MARCA = 2
+MODELOS_POR_CC = 2
+ANIOS_POR_MODELO = 3
+PAGINAS_POR_LISTADO = 3
+PRODUCTOS_POR_PAGINA = 12
+MODELOS_SIN_TABLA = 4  # Uno de cada N modelos muestra el listado directamente, sin tabla de años
+LATENCIA_MS = 50  # Retardo medio por respuesta
+LATENCIA_VARIACION_MS = 20  # Variación aleatoria (+/-) del retardo
+TASA_ERRORES = 0.0  # Fracción de respuestas que devuelven 503
+SEMILLA = 85
+ESCENARIOS = ["fase1-endpoints", "refresco-http", "fase2-http", "fase2-selenium"]
+TOLERANCIA_REGRESION = 0.10  # Empeoramiento máximo frente a --referencia
+
+NOMBRES_MARCAS = ["HONDA", "YAMAHA", "SUZUKI", "KAWASAKI", "DUCATI", "KTM", "BMW", "APRILIA", "PIAGGIO", "KYMCO"]
+CILINDRADAS = ["50", "125", "250", "400", "600", "750", "900", "1000"]
+MARCAS_PRODUCTO = ["NGK", "EBC", "HIFLO", "DID", "BREMBO", "MOTUL"]
+
+# --- CATÁLOGO SIMULADO ---
+def generar_catalogo():
+    """Árbol tipo → marca → CC → modelo, con los mismos valores que usaría la web."""
+    catalogo = {}
+    for tipo in scraper.TIPOS_VEHICULOS:
+        marcas = {}
+        for m in range(MARCAS_POR_TIPO):
+            marca_value = f"{tipo['value']}{m + 1:02d}"
+            ccs = {}
+            for c in range(CCS_POR_MARCA):
+                cc = CILINDRADAS[(m + c) % len(CILINDRADAS)]
+                ccs[cc] = [(f"{marca_value}{cc}{k + 1}", f"MODELO {k + 1} {cc}") for k in range(MODELOS_POR_CC)]
+            marcas[marca_value] = (NOMBRES_MARCAS[m % len(NOMBRES_MARCAS)], ccs)
+        catalogo[tipo['value']] = marcas
+    return catalogo
+
+def tareas_del_catalogo(catalogo):
+    """Las tareas que la Fase 1 debería encontrar, con el esquema de scraper.guardar_tareas."""
+    textos_tipo = {t['value']: t['text'] for t in scraper.TIPOS_VEHICULOS}
+    tareas = []
+    for tipo_value, marcas in catalogo.items():
+        for marca_value, (marca_text, ccs) in marcas.items():
+            for cc, modelos in ccs.items():
+                for modelo_value, modelo_text in modelos:
+                    tareas.append({
+                        'tipo_value': tipo_value, 'tipo_text': textos_tipo[tipo_value],
+                        'marca_value': marca_value, 'marca_text': marca_text,
+                        'cc_value': cc, 'cc_text': cc,
+                        'modelo_value': modelo_value, 'modelo_text': modelo_text
+                    })
+    return tareas
+
+def listados_del_catalogo(tareas, base_url):
+    """[(url_general, datos_moto)] de los listados de cada tarea, como los guarda procesar_listado."""
+    listados = []
+    for tarea in tareas:
+        modelo = tarea['modelo_value']
+        modelo_parseado, cc, _ = scraper.parsear_modelo_y_anio(tarea['modelo_text'], tarea['cc_text'])
+        if modelo.isdigit() and int(modelo) % MODELOS_SIN_TABLA == 0:
+            anios = [None]
+        else:
+            anios = range(2010, 2010 + ANIOS_POR_MODELO)
+        for anio in anios:
+            url = f"{base_url}/listado?" + urlencode({'modelo': modelo, **({'anio': anio} if anio else {})})
+            listados.append((url, {'tipo_text': tarea['tipo_text'], 'marca_text': tarea['marca_text'],
+                                   'modelo_parseado': modelo_parseado, 'cc_parseado': cc,
+                                   'anio': str(anio) if anio else "N/A", 'url_general': url}))
+    return listados
+
+def html_opciones(opciones):
+    filas = ['<option value="-1">- Seleccionar -</option>']
+    filas += [f'<option value="{valor}">{texto}</option>' for valor, texto in opciones]
+    return "".join(filas)
+
+PAGINA_INICIO = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>Catálogo</title>
+<link rel="stylesheet" href="/estilos.css"></head><body>
+<form id="buscador">
+<select id="itipo">%(tipos)s</select>
+<select id="imarca">%(vacio)s</select>
+<select id="icc">%(vacio)s</select>
+<select id="imodel">%(vacio)s</select>
+</form>
+<script>
+var niveles = ["itipo", "imarca", "icc", "imodel"], nombres = ["tipo", "marca", "cc", "modelo"];
+function seleccion(hasta) {
+    var q = [];
+    for (var i = 0; i <= hasta; i++) q.push(nombres[i] + "=" + encodeURIComponent(document.getElementById(niveles[i]).value));
+    return q.join("&");
+}
+niveles.forEach(function (id, i) {
+    document.getElementById(id).addEventListener("change", function () {
+        if (i === niveles.length - 1) { location.href = "/modelo?" + seleccion(i); return; }
+        for (var j = i + 1; j < niveles.length; j++) document.getElementById(niveles[j]).innerHTML = '%(vacio)s';
+        fetch("/ajax/opciones?nivel=" + nombres[i + 1] + "&" + seleccion(i))
+            .then(function (r) { return r.text(); })
+            .then(function (html) { document.getElementById(niveles[i + 1]).innerHTML = html; });
+    });
+});
+</script></body></html>"""
+
+def pagina_listado(modelo, anio, pagina, url_base):
+    """Listado paginado de un modelo; los mismos productos encajan en todos sus años."""
+    fichas = []
+    for j in range(PRODUCTOS_POR_PAGINA):
+        id_producto = f"{modelo}-{(pagina - 1) * PRODUCTOS_POR_PAGINA + j + 1}"
+        marca = MARCAS_PRODUCTO[j % len(MARCAS_PRODUCTO)]
+        fichas.append(f'<div class="producte"><a href="/producto?id={id_producto}">'
+                      f'<div class="nom_producte">{marca} PIEZA {id_producto}</div></a>'
+                      f'<div class="marca"><img class="marcaprod" src="/img/{marca}.png" title="{marca}"></div></div>')
+    enlaces = "".join(f'<a class="num" href="{url_base}&pag={p}">{p}</a>' for p in range(1, PAGINAS_POR_LISTADO + 1))
+    return (f'<html><body><h1>{modelo} {anio or ""}</h1><div class="vista_fitxes">{"".join(fichas)}</div>'
+            f'<div class="paginacio">{enlaces}</div></body></html>')
+
+def pagina_modelo(params):
+    modelo = params.get('modelo', '')
+    if modelo.isdigit() and int(modelo) % MODELOS_SIN_TABLA == 0:
+        return pagina_listado(modelo, None, 1, f"/listado?modelo={modelo}")
+    cc = params.get('cc', '')
+    filas = "".join(f'<tr><td><a href="/listado?modelo={modelo}&anio={anio}">MODELO {modelo[-1]} {cc} {anio}</a></td>'
+                    f'<td>{anio}</td></tr>' for anio in range(2010, 2010 + ANIOS_POR_MODELO))
+    return (f'<html><body><table class="resultats"><thead><tr><th>Modelo</th><th>Año</th></tr></thead>'
+            f'<tbody>{filas}</tbody></table></body></html>')
+
+def pagina_producto(id_producto):
+    return (f'<html><body><div class="detalls"><div class="nom_producte"><span>PIEZA {id_producto}</span></div>'
+            f'<div><span>Referencia:</span> REF-{id_producto}</div></div></body></html>')
+
+# --- SERVIDOR LOCAL ---
+class ContadorPeticiones:
+    """Peticiones servidas por tipo; el servidor atiende en varios hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.paginas = 0
+            self.ajax = 0
+            self.errores = 0
+            self.no_modificadas = 0
+
+    def sumar(self, campo):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+def crear_servidor(puerto=0, latencia_ms=LATENCIA_MS, variacion_ms=LATENCIA_VARIACION_MS, tasa_errores=TASA_ERRORES):
+    """Crea el servidor simulado (sin arrancarlo). Devuelve (servidor, contador)."""
+    catalogo = generar_catalogo()
+    contador = ContadorPeticiones()
+    aleatorio = random.Random(SEMILLA)
+    lock_aleatorio = threading.Lock()
+
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # Sin esto cada respuesta keep-alive tarda ~40 ms extra
+
+        def log_message(self, *args):
+            pass
+
+        def responder(self, estado, cuerpo, tipo="text/html; charset=utf-8"):
+            datos = cuerpo.encode('utf-8')
+            # Validador como el de un servidor real: las peticiones condicionales reciben 304
+            etag = '"%s"' % hashlib.md5(datos).hexdigest()
+            if estado == 200 and self.headers.get('If-None-Match') == etag:
+                contador.sumar('no_modificadas')
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(estado)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(datos)))
+            if estado == 200:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            with lock_aleatorio:
+                retardo = max(0.0, latencia_ms + aleatorio.uniform(-variacion_ms, variacion_ms)) / 1000
+                fallo = aleatorio.random() < tasa_errores
+            time.sleep(retardo)
+            if fallo and url.path != "/":
+                contador.sumar('errores')
+                return self.responder(503, "Servicio no disponible")
+
+            if url.path == "/ajax/opciones":
+                contador.sumar('ajax')
+                marcas = catalogo.get(params.get('tipo'), {})
+                if params.get('nivel') == 'marca':
+                    opciones = [(valor, nombre) for valor, (nombre, _) in marcas.items()]
+                elif params.get('nivel') == 'cc':
+                    opciones = [(cc, cc) for cc in marcas.get(params.get('marca'), ("", {}))[1]]
+                else:
+                    opciones = marcas.get(params.get('marca'), ("", {}))[1].get(params.get('cc'), [])
+                return self.responder(200, html_opciones(opciones))
+
+            contador.sumar('paginas')
+            if url.path == "/":
+                tipos = [(t['value'], t['text']) for t in scraper.TIPOS_VEHICULOS]
+                return self.responder(200, PAGINA_INICIO % {'tipos': html_opciones(tipos), 'vacio': html_opciones([])})
+            if url.path == "/modelo":
+                return self.responder(200, pagina_modelo(params))
+            if url.path == "/listado":
+                base = "/listado?" + urlencode({k: v for k, v in params.items() if k != 'pag'})
+                return self.responder(200, pagina_listado(params.get('modelo', ''), params.get('anio'),
+                                                          int(params.get('pag', 1)), base))
+            if url.path == "/producto":
+                return self.responder(200, pagina_producto(params.get('id', '')))
+            return self.responder(404, "No encontrado")
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), Manejador)
+    servidor.daemon_threads = True
+    return servidor, contador
+
+def plantillas_endpoints(base_url):
+    """ENDPOINTS_FILE equivalente al que grabaría grabar_endpoints_selectores contra el servidor simulado."""
+    plantillas = {}
+    niveles = [nivel for nivel, _ in scraper.NIVELES_SELECTORES]
+    for i, siguiente in enumerate(niveles[1:], start=1):
+        plantillas[siguiente] = {
+            'metodo': 'GET',
+            'url': f"{base_url}/ajax/opciones",
+            'query': [['nivel', siguiente]] + [[nivel, '{' + nivel + '}'] for nivel in niveles[:i]],
+            'cabeceras': {},
+            'cuerpo': None,
+            'formato_cuerpo': None
+        }
+    return plantillas
+
+# --- ESCENARIOS ---
+def refresco_sin_navegador(tareas, estado, base_url):
+    """--refrescar con el motor HTTP, sin Chrome: los listados de las tareas se siembran
+    con una huella que no coincide, así que refrescar_listados entra en todos los
+    detalles, y después se reintentan los que fallaron (reintentar_detalles_pendientes)."""
+    for url_general, datos_moto in listados_del_catalogo(tareas, base_url):
+        estado.guardar_huella(url_general, "sin-huella", [], datos_moto)
+    estado.confirmar()
+    scraper.refrescar_listados(estado.listados_guardados(), estado)
+    scraper.reintentar_detalles_pendientes(estado)
+
+def ejecutar_escenario(nombre, base_url, tareas, workers, cola):
+    """Se ejecuta en un proceso propio, en un directorio temporal, para aislar archivos y memoria."""
+    directorio = tempfile.mkdtemp(prefix=f"benchmark-{nombre}-")
+    os.chdir(directorio)
+    scraper.BASE_URL = base_url
+    scraper.REQUESTS_PER_SECOND = 1000  # El servidor simulado ya impone su latencia
+    scraper.RATE_LIMIT_BURST = 1000
+    scraper.LOG_LEVEL = "WARNING"
+    scraper.FETCH_BACKEND = "selenium" if nombre == "fase2-selenium" else "http"
+    resultado = {'escenario': nombre, 'tareas': 0, 'filas': 0}
+    try:
+        inicio = time.time()
+        if nombre == "fase1-endpoints":
+            with open(scraper.ENDPOINTS_FILE, 'w', encoding='utf-8') as f:
+                json.dump(plantillas_endpoints(base_url), f)
+            resultado['tareas'] = len(scraper.recopilar_tareas_por_endpoints())
+        else:
+            if nombre != "refresco-http":
+                driver = scraper.configurar_driver()
+                if not driver:
+                    raise RuntimeError("no se pudo iniciar Chrome")
+                scraper.cerrar_driver(driver)
+                inicio = time.time()
+            estado = scraper.EstadoSQLite()
+            if nombre == "refresco-http":
+                refresco_sin_navegador(tareas, estado, base_url)
+            elif workers > 1:
+                scraper.ejecutar_fase2_paralela(tareas, estado, workers)
+            else:
+                scraper.ejecutar_fase2_secuencial(tareas, estado)
+            resultado['tareas'] = len(tareas)
+            resultado['filas'] = len(estado)
+            estado.cerrar()
+        resultado['segundos'] = time.time() - inicio
+    except Exception as e:
+        resultado['error'] = str(e)
+    finally:
+        scraper.detener_log()
+        shutil.rmtree(directorio, ignore_errors=True)
+    cola.put(resultado)
+
+def rss_arbol(pid):
+    """RSS en bytes de un proceso y todos sus descendientes (Chrome incluido). Lee /proc, solo Linux."""
+    hijos = {}
+    for entrada in os.listdir('/proc'):
+        if not entrada.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entrada}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            hijos.setdefault(ppid, []).append(int(entrada))
+        except (OSError, ValueError, IndexError):
+            continue
+    total = 0
+    pendientes = [pid]
+    while pendientes:
+        actual = pendientes.pop()
+        try:
+            with open(f'/proc/{actual}/statm') as f:
+                total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            pass
+        pendientes.extend(hijos.get(actual, []))
+    return total
+
+def medir_escenario(nombre, base_url, contador, tareas, workers):
+    """Lanza el escenario en otro proceso y muestrea su memoria mientras dura."""
+    contador.reiniciar()
+    # fork, igual que los trabajadores de scraper: el escenario parte del módulo ya importado
+    contexto = multiprocessing.get_context('fork')
+    cola = contexto.Queue()
+    proceso = contexto.Process(target=ejecutar_escenario, args=(nombre, base_url, tareas, workers, cola))
+    proceso.start()
+    rss_maximo = 0
+    medir_rss = os.path.isdir('/proc')
+    while proceso.is_alive():
+        if medir_rss:
+            rss_maximo = max(rss_maximo, rss_arbol(proceso.pid))
+        try:
+            resultado = cola.get(timeout=0.2)
+            break
+        except Exception:
+            continue
+    else:
+        try:
+            resultado = cola.get(timeout=1)
+        except Exception:
+            resultado = {'escenario': nombre, 'error': "el proceso terminó sin resultado"}
+    proceso.join()
+
+    if 'error' not in resultado:
+        segundos = max(resultado['segundos'], 1e-9)
+        resultado['tareas_min'] = resultado['tareas'] / segundos * 60
+        resultado['paginas_s'] = contador.paginas / segundos
+        resultado['ajax_s'] = contador.ajax / segundos
+    resultado['paginas'] = contador.paginas
+    resultado['errores_inyectados'] = contador.errores
+    resultado['rss_max_mb'] = rss_maximo / (1024 * 1024) if medir_rss else None
+    return resultado
+
+def mostrar_resultados(resultados):
+    print(f"\n{'ESCENARIO':<22}{'TAREAS':>8}{'SEG':>9}{'TAREAS/MIN':>12}{'PÁG/S':>9}{'RSS MÁX MB':>12}")
+    for r in resultados:
+        if 'error' in r:
+            print(f"{r['escenario']:<22}  omitido: {r['error']}")
+            continue
+        rss = f"{r['rss_max_mb']:.0f}" if r['rss_max_mb'] is not None else "n/d"
+        print(f"{r['escenario']:<22}{r['tareas']:>8}{r['segundos']:>9.1f}{r['tareas_min']:>12.1f}{r['paginas_s']:>9.1f}{rss:>12}")
+
+def comparar_con_referencia(resultados, ruta_referencia, tolerancia):
+    """Devuelve la lista de regresiones frente a un JSON guardado con --guardar."""
+    with open(ruta_referencia, 'r', encoding='utf-8') as f:
+        referencia = {r['escenario']: r for r in json.load(f)}
+    regresiones = []
+    for r in resultados:
+        base = referencia.get(r['escenario'])
+        if not base or 'error' in r or 'error' in base:
+            continue
+        if r['tareas_min'] < base['tareas_min'] * (1 - tolerancia):
+            regresiones.append(f"{r['escenario']}: tareas/min {base['tareas_min']:.1f} -> {r['tareas_min']:.1f}")
+        if r['rss_max_mb'] and base.get('rss_max_mb') and r['rss_max_mb'] > base['rss_max_mb'] * (1 + tolerancia):
+            regresiones.append(f"{r['escenario']}: RSS {base['rss_max_mb']:.0f} MB -> {r['rss_max_mb']:.0f} MB")
+    return regresiones
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide el scraper contra una copia local del catálogo")
+    parser.add_argument('--escenarios', nargs='+', choices=ESCENARIOS, default=ESCENARIOS)
+    parser.add_argument('--latencia', type=float, default=LATENCIA_MS, help="Retardo medio por respuesta (ms)")
+    parser.add_argument('--variacion', type=float, default=LATENCIA_VARIACION_MS, help="Variación del retardo (ms)")
+    parser.add_argument('--errores', type=float, default=TASA_ERRORES, help="Fracción de respuestas 503")
+    parser.add_argument('--tareas', type=int, default=None, help="Limitar la Fase 2 a las primeras N tareas")
+    parser.add_argument('--workers', type=int, default=1, help="Procesos de la Fase 2 en los escenarios con navegador")
+    parser.add_argument('--puerto', type=int, default=0)
+    parser.add_argument('--guardar', help="Guardar los resultados en este JSON")
+    parser.add_argument('--referencia', help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_REGRESION)
+    parser.add_argument('--solo-servidor', action='store_true', help="Solo servir el catálogo simulado")
+    args = parser.parse_args()
+
+    servidor, contador = crear_servidor(args.puerto, args.latencia, args.variacion, args.errores)
+    base_url = f"http://127.0.0.1:{servidor.server_address[1]}"
+    if args.solo_servidor:
+        print(f"Catálogo simulado en {base_url} (Ctrl+C para terminar)")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        raise SystemExit(0)
+
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    tareas = tareas_del_catalogo(generar_catalogo())[:args.tareas]
+    print(f"Catálogo simulado en {base_url}: {len(tareas)} tareas, latencia {args.latencia:.0f}±{args.variacion:.0f} ms, "
+          f"errores {args.errores:.0%}")
+
+    resultados = [medir_escenario(nombre, base_url, contador, tareas, args.workers) for nombre in args.escenarios]
+    servidor.shutdown()
+    mostrar_resultados(resultados)
+
+    if args.guardar:
+        with open(args.guardar, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+    if args.referencia:
+        regresiones = comparar_con_referencia(resultados, args.referencia, args.tolerancia)
+        for regresion in regresiones:
+            print(f"⚠️ Regresión: {regresion}")
+        raise SystemExit(1 if regresiones else 0)
@@ -1,8 +1,35 @@
 # -*- coding: utf-8 -*-
+import argparse
+import atexit
+import cProfile
 import csv
+import functools
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import logging
+import logging.handlers
+import multiprocessing
 import os
+import pstats
+import queue
 import time
 import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+from urllib.parse import urljoin, urlparse, urlunparse, parse_qsl, urlencode
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -16,90 +43,1026 @@ BASE_URL = "https://www.euromoto85.com"
 OUTPUT_FILE = "repuestos_motos_completo.csv"
 TASKS_FILE = "lista_de_tareas_completa.csv"
 LOG_FILE = "scraper_log.txt"
-START_AFTER_BRAND = "AJP"  # Para reanudar desde una marca específica AJP
+LOG_LEVEL = "INFO"  # "DEBUG" añade las líneas por producto, página y selector
+LOG_MAX_BYTES = 50 * 1024 * 1024  # Tamaño del log antes de rotarlo y comprimirlo
+LOG_BACKUP_COUNT = 10  # Logs rotados (.gz) que se conservan
+STATE_DB = "estado_scraper.sqlite3"  # Claves procesadas y diario de tareas (índice en disco)
 MAX_RETRIES = 3
 MAX_RECOVERY_ATTEMPTS = 3  # Intentos de recuperación cuando se bugea
-DELAY_BETWEEN_REQUESTS = 2
+REQUESTS_PER_SECOND = 0.5  # Ritmo máximo por host, sumando navegador, HTTP y todos los trabajadores
+RATE_LIMIT_BURST = 3  # Peticiones que se pueden encadenar sin esperar tras un periodo inactivo
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# MOTOR DE DESCARGA
+FETCH_BACKEND = "selenium"  # "http" para leer páginas de modelo y producto sin navegador
+HTTP_POOL_SIZE = 10  # Conexiones keep-alive reutilizables por host
+HTTP_TIMEOUT = 30
+LISTING_FETCH_WORKERS = 4  # Descargas simultáneas de páginas de listado (siempre bajo el límite de ritmo)
+HTTP_CACHE_ENABLED = True  # Peticiones condicionales (ETag/Last-Modified) y resultados ya parseados por URL
+HTTP_CACHE_FILE = "cache_http.sqlite3"
+
+SELECTOR_WAIT_TIMEOUT = 10  # Segundos máximos esperando las opciones del siguiente selector
+
+# POOL DE NAVEGADORES
+DRIVER_MAX_TASKS = 50  # Tareas por sesión de Chrome antes de reciclarla
+BROWSER_LEAN = True  # Chrome sin imágenes, fuentes, CSS ni rastreadores y sin cachés innecesarias
+BLOCKED_URL_PATTERNS = [  # Peticiones que Chrome no llega a lanzar en modo ligero (comodines de Network.setBlockedURLs)
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico", "*.bmp",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.css",
+    "*.mp4", "*.webm", "*.mp3",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*googleadservices.com*",
+    "*facebook.net*", "*facebook.com*", "*hotjar.com*", "*clarity.ms*", "*fonts.googleapis.com*",
+    "*fonts.gstatic.com*", "*youtube.com*", "*cookiebot.com*", "*addthis.com*",
+]
+
+# CACHÉ DE PRODUCTOS
+PRODUCT_CACHE_FILE = "cache_productos.jsonl"  # Detalles de producto ya vistos (nombre, referencia, marca)
+PRODUCT_CACHE_TTL_DAYS = 30  # Días antes de volver a visitar la página de un producto
+
+# ESCRITURA DEL CSV
+CSV_FLUSH_ROWS = 200  # Filas en memoria antes de escribirlas al archivo
+CSV_FLUSH_SECONDS = 5  # Segundos máximos que una fila puede esperar en memoria
+OUTPUT_COMPRESSION = None  # "gzip" o "zstd" para escribir el CSV como OUTPUT_FILE.gz / .zst (--comprimir)
+OUTPUT_COMPRESSION_LEVEL = None  # None = nivel por defecto del formato (gzip 6, zstd 3)
+
+# EXPORTACIÓN NORMALIZADA
+EXPORT_FORMAT = None  # "parquet" o "arrow" para exportar tablas products/fitment al terminar cada ejecución
+EXPORT_DIR = "exportacion"
+EXPORT_BATCH_ROWS = 50000  # Filas por lote (row group) al escribir las tablas
+
+# VERIFICACIÓN Y BACKUPS
+VERIFY_SORT_CHUNK_ROWS = 200000  # Filas ordenadas en memoria por bloque al verificar (el resto va a disco)
+BACKUP_COMPRESSION_LEVEL = 6  # Nivel gzip de los backups cuando no se puede enlazar ni clonar el archivo
+
+# EJECUCIÓN PARALELA
+WORKERS = 1  # Procesos de la Fase 2 (se puede cambiar con --workers N)
+
+# FASE 1
+PHASE1_CHECKPOINT_FILE = "fase1_progreso.jsonl"  # Marcas ya recorridas, para reanudar la Fase 1
+PHASE1_MODE = "navegador"  # "endpoints" para llamar directamente a las peticiones de los selectores
+ENDPOINTS_FILE = "endpoints_selectores.json"  # Peticiones de los selectores grabadas desde el navegador
+TASKS_ADDED_FILE = "tareas_nuevas.csv"  # Modelos que aparecieron en la última actualización del catálogo
+TASKS_REMOVED_FILE = "tareas_eliminadas.csv"  # Modelos que desaparecieron en la última actualización
+TOMBSTONES_FILE = "compatibilidades_eliminadas.csv"  # Producto+moto que ya no aparecen en el listado del modelo
+
+# MÉTRICAS POR ETAPA
+METRICS_FILE = "metricas.json"  # Histogramas y contadores, reescrito periódicamente
+METRICS_INTERVAL_SECONDS = 60
+METRICS_PORT = None  # Puerto local para servir /metrics (Prometheus) y /metrics.json, p.ej. 9108
+METRICS_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]  # Límites (segundos) de los histogramas
+
+# PERFILADO
+PROFILE_SAMPLE_RATE = 0  # Fracción de tareas que se perfilan con cProfile (0 = desactivado, --perfilar)
+PROFILE_DIR = "perfiles"  # Un .prof por tarea perfilada, más resumen_tareas.jsonl y resumen.txt
 
 # CONFIGURACIÓN DE RESET
 FORCE_FRESH_START = False  # True para empezar con CSV limpio
 SKIP_PHASE_1 = True  # True para saltar la creación de tareas y usar archivo existente
 
+# Los trabajadores de la Fase 2 heredan con fork el limitador de ritmo, la cola del log y la
+# configuración puesta por los argumentos (FETCH_BACKEND, PROFILE_SAMPLE_RATE...). Con spawn o
+# forkserver cada trabajador empezaría de cero, así que el método se fija en lugar de usar el del sistema.
+_FORK_DISPONIBLE = 'fork' in multiprocessing.get_all_start_methods()
+_procesos = multiprocessing.get_context('fork' if _FORK_DISPONIBLE else None)
+
 # --- FUNCIONES DE LOGGING ---
-def log_message(message):
-    """Registra mensajes en archivo de log y consola."""
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"[{timestamp}] {message}"
-    print(log_entry)
-    with open(LOG_FILE, 'a', encoding='utf-8') as f:
-        f.write(log_entry + "\n")
-# <--- AÑADE ESTA NUEVA FUNCIÓN ---
-def guardar_registro_csv(registro, filename):
+_logger = logging.getLogger("scraper")
+_oyente_log = None
+
+def comprimir_log_rotado(origen, destino):
+    """Rotador del RotatingFileHandler: guarda el log lleno comprimido en gzip."""
+    with open(origen, 'rb') as f_origen, gzip.open(destino, 'wb') as f_destino:
+        shutil.copyfileobj(f_origen, f_destino)
+    os.remove(origen)
+
+def configurar_log(nivel=None):
+    """Prepara el logger: las llamadas solo encolan el registro y un hilo escribe consola y archivo.
+
+    La cola es de multiprocessing para que los trabajadores de la Fase 2 (creados con
+    fork) envíen sus mensajes al mismo hilo escritor del proceso principal.
     """
-    Guarda una única fila en el CSV, manejando el header de forma segura.
-    Abre y cierra el archivo en cada llamada para garantizar la escritura.
+    global _oyente_log
+    _logger.setLevel((nivel or LOG_LEVEL).upper())
+    if _oyente_log is not None:
+        return
+    formato = logging.Formatter("[%(asctime)s] %(message)s", "%Y-%m-%d %H:%M:%S")
+    consola = logging.StreamHandler(sys.stdout)
+    archivo = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                                                   backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    archivo.namer = lambda nombre: nombre + ".gz"
+    archivo.rotator = comprimir_log_rotado
+    for manejador in (consola, archivo):
+        manejador.setFormatter(formato)
+    
+    cola_log = _procesos.Queue()
+    _logger.addHandler(logging.handlers.QueueHandler(cola_log))
+    _logger.propagate = False
+    _oyente_log = logging.handlers.QueueListener(cola_log, consola, archivo)
+    _oyente_log.start()
+    pid_principal = os.getpid()
+    atexit.register(lambda: os.getpid() == pid_principal and detener_log())
+
+def detener_log():
+    """Vacía la cola de mensajes pendientes y cierra el archivo de log."""
+    global _oyente_log
+    if _oyente_log is not None:
+        _oyente_log.stop()
+        for manejador in _oyente_log.handlers:
+            manejador.close()
+        for manejador in list(_logger.handlers):
+            _logger.removeHandler(manejador)
+        _oyente_log = None
+
+def log_message(message, nivel=logging.INFO):
+    """Registra mensajes en archivo de log y consola sin bloquear en la escritura.
+    Los mensajes de detalle (por producto, página o selector) van con nivel=logging.DEBUG."""
+    if _oyente_log is None:
+        configurar_log()
+    _logger.log(nivel, message)
+# --- MÉTRICAS POR ETAPA ---
+class Metricas:
+    """Histogramas de duración por etapa y contadores de eventos (reintentos, recuperaciones...).
+
+    Los trabajadores de la Fase 2 mandan su instantánea al proceso principal,
+    que la suma a la suya al exportar.
     """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.externas = {}
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.etapas = {}
+            self.eventos = {}
+            self.externas = {}
+
+    def observar(self, etapa, segundos):
+        with self._lock:
+            h = self.etapas.get(etapa)
+            if h is None:
+                h = self.etapas[etapa] = {'n': 0, 'suma': 0.0, 'cubos': [0] * (len(METRICS_BUCKETS) + 1)}
+            h['n'] += 1
+            h['suma'] += segundos
+            h['cubos'][next((i for i, limite in enumerate(METRICS_BUCKETS) if segundos <= limite), len(METRICS_BUCKETS))] += 1
+
+    def contar(self, evento, n=1):
+        with self._lock:
+            self.eventos[evento] = self.eventos.get(evento, 0) + n
+
+    def incorporar(self, origen, instantanea):
+        """Guarda la última instantánea de otro proceso (acumulada, reemplaza a la anterior)."""
+        with self._lock:
+            self.externas[origen] = instantanea
+
+    def instantanea(self, propias=False):
+        """Copia serializable de los datos; con propias=False incluye las de los trabajadores."""
+        with self._lock:
+            datos = {'etapas': {k: {'n': h['n'], 'suma': h['suma'], 'cubos': list(h['cubos'])} for k, h in self.etapas.items()},
+                     'eventos': dict(self.eventos)}
+            externas = [] if propias else list(self.externas.values())
+        for otra in externas:
+            for etapa, h in otra['etapas'].items():
+                destino = datos['etapas'].setdefault(etapa, {'n': 0, 'suma': 0.0, 'cubos': [0] * len(h['cubos'])})
+                destino['n'] += h['n']
+                destino['suma'] += h['suma']
+                destino['cubos'] = [a + b for a, b in zip(destino['cubos'], h['cubos'])]
+            for evento, n in otra['eventos'].items():
+                datos['eventos'][evento] = datos['eventos'].get(evento, 0) + n
+        return datos
+
+    def prometheus(self):
+        """Texto en formato de exposición de Prometheus."""
+        datos = self.instantanea()
+        lineas = ["# TYPE scraper_etapa_segundos histogram"]
+        for etapa, h in sorted(datos['etapas'].items()):
+            acumulado = 0
+            for limite, n in zip(METRICS_BUCKETS + ["+Inf"], h['cubos']):
+                acumulado += n
+                lineas.append(f'scraper_etapa_segundos_bucket{{etapa="{etapa}",le="{limite}"}} {acumulado}')
+            lineas.append(f'scraper_etapa_segundos_sum{{etapa="{etapa}"}} {h["suma"]:.6f}')
+            lineas.append(f'scraper_etapa_segundos_count{{etapa="{etapa}"}} {h["n"]}')
+        lineas.append("# TYPE scraper_eventos_total counter")
+        for evento, n in sorted(datos['eventos'].items()):
+            lineas.append(f'scraper_eventos_total{{evento="{evento}"}} {n}')
+        return "\n".join(lineas) + "\n"
+
+metricas = Metricas()
+
+def medido(etapa):
+    """Decorador: registra la duración de cada llamada en el histograma `etapa`.
+    `etapa` también puede ser una función que recibe los argumentos de la llamada."""
+    def decorar(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            nombre = etapa(*args, **kwargs) if callable(etapa) else etapa
+            inicio = time.monotonic()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                metricas.observar(nombre, time.monotonic() - inicio)
+        return envoltura
+    return decorar
+
+def volcar_metricas(filename=None):
+    """Escribe las métricas en JSON de forma atómica (archivo temporal + rename)."""
+    filename = filename or METRICS_FILE
     try:
-        file_exists = os.path.exists(filename)
-        needs_header = not file_exists or os.path.getsize(filename) == 0
-
-        with open(filename, 'a', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            if needs_header:
-                header = [
-                    'TIPO', 'MARCA', 'MODELO', 'CC', 'AÑO', 'URL GENERAL',
-                    'Producto', 'Marca Producto', 'Referencia',
-                    'Referencia MEIWA', 'Referencia HIFLO', 'URL DEL PRODUCTO'
-                ]
-                writer.writerow(header)
-            writer.writerow(registro)
+        datos = dict(metricas.instantanea(), generado=time.time(), limites=METRICS_BUCKETS)
+        temporal = filename + ".tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(datos, f, ensure_ascii=False)
+        os.replace(temporal, filename)
     except Exception as e:
-        log_message(f"‼️ ERROR CRÍTICO AL GUARDAR EN CSV: {e}")
+        log_message(f"⚠️ Error guardando métricas en {filename}: {e}")
+
+class ManejadorMetricas(BaseHTTPRequestHandler):
+    """Sirve /metrics (Prometheus) y /metrics.json."""
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            cuerpo, tipo = metricas.prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            cuerpo, tipo = json.dumps(metricas.instantanea()), "application/json"
+        else:
+            self.send_error(404)
+            return
+        datos = cuerpo.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, *args):
+        pass
+
+def iniciar_exportacion_metricas(puerto=None):
+    """Vuelca METRICS_FILE cada METRICS_INTERVAL_SECONDS y, si hay puerto, sirve /metrics."""
+    def volcado_periodico():
+        while True:
+            time.sleep(METRICS_INTERVAL_SECONDS)
+            volcar_metricas()
+    threading.Thread(target=volcado_periodico, daemon=True).start()
+    
+    puerto = puerto or METRICS_PORT
+    if puerto:
+        servidor = ThreadingHTTPServer(("127.0.0.1", puerto), ManejadorMetricas)
+        servidor.daemon_threads = True
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        log_message(f"📈 Métricas en http://127.0.0.1:{puerto}/metrics")
+
+def resumen_metricas():
+    """Escribe en el log el tiempo total y medio de cada etapa y los contadores de eventos."""
+    datos = metricas.instantanea()
+    if not datos['etapas']:
+        return
+    log_message("⏱️ TIEMPO POR ETAPA (total / llamadas / media):")
+    for etapa, h in sorted(datos['etapas'].items(), key=lambda item: -item[1]['suma']):
+        log_message(f"   • {etapa}: {h['suma']:.1f}s / {h['n']} / {h['suma'] / h['n']:.3f}s")
+    if datos['eventos']:
+        log_message("   Eventos: " + ", ".join(f"{evento}={n}" for evento, n in sorted(datos['eventos'].items())))
+
+# --- ESCRITURA DEL CSV DE RESULTADOS ---
+CABECERA_CSV = [
+    'TIPO', 'MARCA', 'MODELO', 'CC', 'AÑO', 'URL GENERAL',
+    'Producto', 'Marca Producto', 'Referencia',
+    'Referencia MEIWA', 'Referencia HIFLO', 'URL DEL PRODUCTO'
+]
+
+EXTENSIONES_COMPRESION = {'gzip': '.gz', 'zstd': '.zst'}
+
+def formato_compresion(filename):
+    """'gzip' o 'zstd' según la extensión del archivo, o None si es texto plano."""
+    for formato, extension in EXTENSIONES_COMPRESION.items():
+        if filename.endswith(extension):
+            return formato
+    return None
+
+def nombre_con_compresion(filename, formato):
+    if not formato or formato_compresion(filename) == formato:
+        return filename
+    return filename + EXTENSIONES_COMPRESION[formato]
+
+def compresor_miembros(formato, nivel=None):
+    """Función bytes -> bytes que comprime cada volcado como un miembro gzip o frame zstd independiente."""
+    if formato == 'gzip':
+        nivel = 6 if nivel is None else nivel
+        return lambda datos: gzip.compress(datos, compresslevel=nivel, mtime=0)
+    import zstandard
+    return zstandard.ZstdCompressor(level=3 if nivel is None else nivel).compress
+
+def descompresor_miembro(formato):
+    if formato == 'gzip':
+        return zlib.decompressobj(wbits=31)
+    import zstandard
+    return zstandard.ZstdDecompressor().decompressobj()
+
+def miembros_comprimidos(filename, desde=0, tam_lectura=1024 * 1024):
+    """Genera (fin, datos) por cada miembro gzip / frame zstd completo a partir del byte `desde`,
+    donde `fin` es el byte en que termina. Se detiene sin error en un miembro incompleto o
+    dañado, que es lo que queda al final del archivo tras un corte a mitad de un volcado."""
+    formato = formato_compresion(filename)
+    with open(filename, 'rb') as f:
+        f.seek(desde)
+        inicio = desde
+        consumido = 0
+        pendiente = b''
+        descompresor = descompresor_miembro(formato)
+        salida = []
+        while True:
+            if not pendiente:
+                pendiente = f.read(tam_lectura)
+                if not pendiente:
+                    return
+            try:
+                salida.append(descompresor.decompress(pendiente))
+            except Exception:
+                return  # Bytes que no forman un miembro válido
+            if not descompresor.eof:
+                consumido += len(pendiente)
+                pendiente = b''
+                continue
+            sobrante = descompresor.unused_data
+            inicio += consumido + len(pendiente) - len(sobrante)
+            yield inicio, b''.join(salida)
+            consumido = 0
+            pendiente = sobrante
+            descompresor = descompresor_miembro(formato)
+            salida = []
+
+class LectorComprimido(io.RawIOBase):
+    """Flujo binario de solo lectura con el contenido de los miembros completos de un CSV comprimido."""
+
+    def __init__(self, filename, desde=0):
+        self._miembros = miembros_comprimidos(filename, desde)
+        self._resto = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._resto:
+            try:
+                self._resto = memoryview(next(self._miembros)[1])
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._resto))
+        b[:n] = self._resto[:n]
+        self._resto = self._resto[n:]
+        return n
+
+    def close(self):
+        self._miembros.close()
+        super().close()
+
+def abrir_csv(filename, desde=0):
+    """Abre el CSV de resultados (plano, .gz o .zst) como texto a partir del byte `desde`.
+    En los comprimidos `desde` debe ser el inicio de un miembro (un tamaño registrado por el estado)."""
+    if formato_compresion(filename):
+        binario = io.BufferedReader(LectorComprimido(filename, desde), 1024 * 1024)
+    else:
+        binario = open(filename, 'rb')
+        binario.seek(desde)
+    return io.TextIOWrapper(binario, encoding='utf-8', newline='')
+
+def reparar_final_comprimido(filename, desde=0):
+    """Recorta un miembro gzip / frame zstd a medio escribir al final del archivo y
+    devuelve el byte donde termina el último miembro completo (el nuevo tamaño).
+    `desde` es un byte donde empieza un miembro, para no descomprimir el archivo entero."""
+    tamano = os.path.getsize(filename)
+    if desde > tamano:
+        desde = 0
+    fin = desde
+    for fin, _ in miembros_comprimidos(filename, desde):
+        pass
+    if fin == desde < tamano and desde > 0:
+        return reparar_final_comprimido(filename, 0)  # La pista no apuntaba a un miembro completo
+    if fin < tamano:
+        with open(filename, 'rb+') as f:
+            f.truncate(fin)
+        log_message(f"🩹 Recortado un bloque comprimido incompleto al final de {filename} ({tamano - fin} bytes)")
+    return fin
+
+def convertir_csv_comprimido(origen, destino, tam_bloque=8 * 1024 * 1024):
+    """Pasa un CSV plano existente al formato comprimido por bloques y borra el original.
+    Si `destino` ya existe, las filas de `origen` (sin su cabecera) se añaden al final."""
+    reparar_final_csv(origen)
+    anexar = reparar_final_csv(destino) > 0
+    comprimir = compresor_miembros(formato_compresion(destino), OUTPUT_COMPRESSION_LEVEL)
+    temporal = destino + ".tmp"
+    if anexar:
+        shutil.copyfile(destino, temporal)  # Se reemplaza de una vez: un corte no deja filas a medias
+    with open(origen, 'rb') as f_origen, open(temporal, 'ab' if anexar else 'wb') as f_destino:
+        if anexar:
+            f_origen.readline()
+        for bloque in iter(lambda: f_origen.read(tam_bloque), b''):
+            f_destino.write(comprimir(bloque))
+        f_destino.flush()
+        os.fsync(f_destino.fileno())
+    os.replace(temporal, destino)
+    if anexar:
+        log_message(f"🗜️ Filas de {origen} añadidas a {destino} ({os.path.getsize(destino)} bytes)")
+    else:
+        log_message(f"🗜️ {origen} convertido a {destino} ({os.path.getsize(origen)} -> {os.path.getsize(destino)} bytes)")
+    os.remove(origen)
+
+def reparar_final_csv(filename, desde=0):
+    """Recorta una última línea a medio escribir (p.ej. tras un corte de luz) y devuelve el
+    tamaño válido del archivo. En los CSV comprimidos recorta el último miembro incompleto
+    (ver reparar_final_comprimido)."""
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        return 0
+    if formato_compresion(filename):
+        return reparar_final_comprimido(filename, desde)
+    with open(filename, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        tamano = f.tell()
+        f.seek(tamano - 1)
+        if f.read(1) == b'\n':
+            return tamano
+        
+        # Buscar hacia atrás el último salto de línea completo
+        posicion = tamano
+        while posicion > 0:
+            inicio = max(0, posicion - 65536)
+            f.seek(inicio)
+            bloque = f.read(posicion - inicio)
+            indice = bloque.rfind(b'\n')
+            if indice >= 0:
+                nuevo_tamano = inicio + indice + 1
+                break
+            posicion = inicio
+        else:
+            nuevo_tamano = 0
+        f.truncate(nuevo_tamano)
+        log_message(f"🩹 Recortada una línea incompleta al final de {filename} ({tamano - nuevo_tamano} bytes)")
+    return nuevo_tamano
+
+class EscritorCSV:
+    """Escritor de larga duración para el CSV de resultados.
+
+    Acumula las filas en memoria y las escribe cada CSV_FLUSH_ROWS filas o
+    CSV_FLUSH_SECONDS segundos; sincronizar() además hace fsync y se llama al
+    terminar cada tarea. Al abrir, repara una posible última línea incompleta.
+    Si el nombre termina en .gz o .zst cada volcado es un miembro comprimido
+    completo, así que el archivo se puede leer entero hasta el último volcado.
+    `fin_volcado` es el byte donde termina el último volcado completo.
+    """
+
+    def __init__(self, filename, cabecera=CABECERA_CSV, filas_por_volcado=CSV_FLUSH_ROWS, segundos_por_volcado=CSV_FLUSH_SECONDS, reparar_desde=0):
+        self.filename = filename
+        self.filas_por_volcado = filas_por_volcado
+        self.segundos_por_volcado = segundos_por_volcado
+        
+        reparar_final_csv(filename, reparar_desde)
+        necesita_cabecera = not os.path.exists(filename) or os.path.getsize(filename) == 0
+        formato = formato_compresion(filename)
+        self._comprimir = compresor_miembros(formato, OUTPUT_COMPRESSION_LEVEL) if formato else None
+        if formato:
+            self._archivo = open(filename, 'ab')
+        else:
+            self._archivo = open(filename, 'a', newline='', encoding='utf-8')
+        self._buffer = io.StringIO()
+        self._csv = csv.writer(self._buffer)
+        self._pendientes = 0
+        self._ultimo_volcado = time.monotonic()
+        self.fin_volcado = os.fstat(self._archivo.fileno()).st_size
+        if necesita_cabecera:
+            self._csv.writerow(cabecera)
+            self.sincronizar()
+
+    def escribir(self, registro):
+        self._csv.writerow(registro)
+        self._pendientes += 1
+        self.volcar_si_toca()
+
+    def volcar_si_toca(self):
+        if self._pendientes >= self.filas_por_volcado or \
+                (self._pendientes and time.monotonic() - self._ultimo_volcado >= self.segundos_por_volcado):
+            self.volcar()
+
+    def volcar(self):
+        """Pasa las filas acumuladas al archivo (sin fsync)."""
+        datos = self._buffer.getvalue()
+        if datos:
+            self._archivo.write(self._comprimir(datos.encode('utf-8')) if self._comprimir else datos)
+            self._archivo.flush()
+            self.fin_volcado = self._archivo.tell() if self._comprimir else os.fstat(self._archivo.fileno()).st_size
+            self._buffer.seek(0)
+            self._buffer.truncate()
+        self._pendientes = 0
+        self._ultimo_volcado = time.monotonic()
+
+    def sincronizar(self):
+        """Vuelca y fuerza la escritura a disco."""
+        self.volcar()
+        os.fsync(self._archivo.fileno())
+
+    def cerrar(self):
+        if not self._archivo.closed:
+            self.sincronizar()
+            self._archivo.close()
+
+class SalidaLocal:
+    """Destino de filas del modo secuencial y del proceso escritor: escribe en el CSV
+    y, en cada fin de tarea, confirma el estado después de sincronizar el archivo."""
+
+    def __init__(self, estado=None, filename=None):
+        self.estado = estado
+        filename = filename or OUTPUT_FILE
+        self.escritor = EscritorCSV(filename, reparar_desde=max(estado.posicion_csv(filename), 0) if estado else 0)
+
+    def guardar_fila(self, clave, registro):
+        try:
+            self.escritor.escribir(registro)
+        except Exception as e:
+            log_message(f"‼️ ERROR CRÍTICO AL GUARDAR EN CSV: {e}")
+
+    def guardar_huella(self, url_general, huella, urls, datos_moto):
+        if self.estado is not None:
+            self.estado.guardar_huella(url_general, huella, urls, datos_moto)
+
+    def eliminar_compatibilidades(self, eliminadas):
+        """Marca como eliminadas las compatibilidades [(clave, datos_moto, url_producto)] y las anota en TOMBSTONES_FILE."""
+        if self.estado is not None:
+            for clave, _, _ in eliminadas:
+                self.estado.eliminar_compatibilidad(clave)
+        try:
+            nuevo = not os.path.exists(TOMBSTONES_FILE)
+            with open(TOMBSTONES_FILE, 'a', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                if nuevo:
+                    writer.writerow(['FECHA', 'TIPO', 'MARCA', 'MODELO', 'CC', 'AÑO', 'URL GENERAL', 'URL DEL PRODUCTO'])
+                fecha = time.strftime("%Y-%m-%d %H:%M:%S")
+                for _, datos_moto, url_producto in eliminadas:
+                    writer.writerow([fecha, datos_moto['tipo_text'], datos_moto['marca_text'], datos_moto['modelo_parseado'],
+                                     datos_moto['cc_parseado'], datos_moto['anio'], datos_moto['url_general'], url_producto])
+        except Exception as e:
+            log_message(f"⚠️ Error anotando compatibilidades eliminadas en {TOMBSTONES_FILE}: {e}")
+
+    def anotar_pendiente(self, clave, producto, datos_moto):
+        if self.estado is not None:
+            self.estado.anotar_detalle_pendiente(clave, producto['url'], producto['marca_producto'], datos_moto)
+
+    def fin_de_tarea(self):
+        self.escritor.sincronizar()
+        if self.estado is not None:
+            self.estado.registrar_csv(self.escritor.filename, self.escritor.fin_volcado)
+            self.estado.confirmar()
+
+    def cerrar(self):
+        self.fin_de_tarea()
+        self.escritor.cerrar()
+
+class SalidaCola:
+    """Destino de filas de un trabajador: las envía al proceso escritor."""
+
+    def __init__(self, cola):
+        self.cola = cola
+
+    def guardar_fila(self, clave, registro):
+        self.cola.put(('fila', clave, registro))
+
+    def guardar_huella(self, url_general, huella, urls, datos_moto):
+        self.cola.put(('huella', url_general, (huella, urls, datos_moto)))
+
+    def eliminar_compatibilidades(self, eliminadas):
+        self.cola.put(('eliminadas', None, eliminadas))
+
+    def anotar_pendiente(self, clave, producto, datos_moto):
+        self.cola.put(('pendiente', clave, (producto, datos_moto)))
 # --- NUEVAS FUNCIONES PARA MANEJAR PRODUCTOS POR AÑO ---
 def crear_clave_unica(url_producto, datos_moto):
     """Crea una clave única que incluye el contexto del año/modelo"""
     return f"{url_producto}|{datos_moto['marca_text']}|{datos_moto['modelo_parseado']}|{datos_moto['anio']}"
 
-def leer_registros_procesados(filename):
-    """Lee el CSV existente y devuelve conjunto de claves únicas procesadas"""
-    processed_keys = set()
+def id_tarea(tarea):
+    """Identificador estable de una tarea de la Fase 2."""
+    return f"{tarea['tipo_value']}|{tarea['marca_value']}|{tarea['cc_value']}|{tarea['modelo_value']}"
+
+def iterar_claves_csv(filename, desde=0):
+    """Genera las claves únicas (como crear_clave_unica) de las filas del CSV,
+    empezando en el byte `desde` si se indica (plano o comprimido, ver abrir_csv)."""
+    with abrir_csv(filename) as f:
+        header = next(csv.reader([f.readline()]), None)
+        if not header:
+            return
+        # Encontrar índices de las columnas necesarias
+        indices = [header.index(c) for c in ('URL DEL PRODUCTO', 'MARCA', 'MODELO', 'AÑO')]
+        if not desde:
+            for row in csv.reader(f):
+                if len(row) > max(indices):
+                    yield "|".join(row[i] for i in indices)
+            return
+    with abrir_csv(filename, desde) as f:
+        for row in csv.reader(f):
+            if len(row) > max(indices):
+                yield "|".join(row[i] for i in indices)
+
+# --- ESTADO PERSISTENTE EN SQLITE ---
+class EstadoSQLite:
+    """Claves procesadas y diario de tareas en una base SQLite indexada.
+
+    Se comporta como el antiguo conjunto processed_keys (`in` y add), pero abre
+    en tiempo constante. Las escrituras quedan en una transacción abierta que se
+    confirma con confirmar() después de sincronizar el CSV, junto con el tamaño
+    del CSV en ese momento; así al arrancar solo hay que leer la cola del CSV
+    escrita tras la última confirmación.
+
+    El diario de tareas solo recibe inserciones: cada ejecución de una tarea
+    añade una entrada (hecha, vacia o fallida) con su duración, y el último
+    estado de cada tarea decide si se salta o se reintenta al reanudar.
+
+    Por cada url_general se guarda la huella de su lista de productos; las
+    compatibilidades que desaparecen del listado salen de claves_procesadas y
+    quedan en compatibilidades_eliminadas hasta que add() las vuelve a añadir.
+    Esa lista no depende de claves_procesadas: reimportar el CSV (donde siguen
+    sus filas) no la anula.
+
+    Los detalles de producto que fallan quedan en detalles_pendientes hasta que
+    add() guarda su clave, y se reintentan sueltos sin repetir la tarea entera.
+    """
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or STATE_DB
+        self.conexion = sqlite3.connect(self.ruta, timeout=30)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self.conexion.executescript("""
+            CREATE TABLE IF NOT EXISTS claves_procesadas (clave TEXT PRIMARY KEY) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS diario_tareas (
+                id INTEGER PRIMARY KEY, tarea_id TEXT NOT NULL, estado TEXT NOT NULL,
+                inicio REAL, duracion REAL, productos INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS diario_tareas_tarea ON diario_tareas (tarea_id, id);
+            CREATE TABLE IF NOT EXISTS huellas_listados (
+                url_general TEXT PRIMARY KEY, huella TEXT, productos TEXT, comprobada REAL, datos_moto TEXT
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS compatibilidades_eliminadas (clave TEXT PRIMARY KEY, eliminada REAL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS detalles_pendientes (
+                clave TEXT PRIMARY KEY, url_producto TEXT, marca_producto TEXT, datos_moto TEXT, anotado REAL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT) WITHOUT ROWID;
+        """)
+        # Bases creadas antes del diario: las tareas completadas pasan a ser entradas "hecha"/"vacia"
+        if self.conexion.execute("SELECT 1 FROM sqlite_master WHERE name = 'tareas_completadas'").fetchone():
+            self.conexion.execute("""
+                INSERT INTO diario_tareas (tarea_id, estado, inicio, duracion, productos)
+                SELECT tarea_id, CASE WHEN productos > 0 THEN 'hecha' ELSE 'vacia' END, completada_en, NULL, productos
+                FROM tareas_completadas
+            """)
+            self.conexion.execute("DROP TABLE tareas_completadas")
+        # Huellas guardadas antes de que --refrescar leyera los listados directamente
+        columnas = {fila[1] for fila in self.conexion.execute("PRAGMA table_info(huellas_listados)")}
+        if 'datos_moto' not in columnas:
+            self.conexion.execute("ALTER TABLE huellas_listados ADD COLUMN datos_moto TEXT")
+        # Antes una eliminación quedaba anulada si la clave seguía en claves_procesadas
+        if self.leer_meta('eliminadas_independientes') is None:
+            self.conexion.execute("DELETE FROM compatibilidades_eliminadas WHERE clave IN (SELECT clave FROM claves_procesadas)")
+            self.guardar_meta('eliminadas_independientes', 1)
+        self.conexion.commit()
+
+    def __contains__(self, clave):
+        return self.conexion.execute("SELECT 1 FROM claves_procesadas WHERE clave = ?", (clave,)).fetchone() is not None
+
+    def __len__(self):
+        return self.conexion.execute("SELECT count(*) FROM claves_procesadas").fetchone()[0]
+
+    def add(self, clave):
+        self.conexion.execute("INSERT OR IGNORE INTO claves_procesadas VALUES (?)", (clave,))
+        self.conexion.execute("DELETE FROM compatibilidades_eliminadas WHERE clave = ?", (clave,))  # Vuelve a aparecer
+        self.conexion.execute("DELETE FROM detalles_pendientes WHERE clave = ?", (clave,))
+
+    def leer_meta(self, clave, defecto=None):
+        fila = self.conexion.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else defecto
+
+    def guardar_meta(self, clave, valor):
+        self.conexion.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (clave, str(valor)))
+
+    def leer_huella(self, url_general):
+        """Devuelve (huella, [urls de producto], datos_moto) de la última visita al listado, o None."""
+        return leer_huella_listado(self.conexion, url_general)
+
+    def listados_guardados(self):
+        """[(url_general, datos_moto)] de los listados con huella que --refrescar puede releer directamente."""
+        return [(url_general, json.loads(datos_moto)) for url_general, datos_moto in self.conexion.execute(
+            "SELECT url_general, datos_moto FROM huellas_listados WHERE datos_moto IS NOT NULL ORDER BY url_general")]
+
+    def incorporar_shard(self, ruta):
+        """Copia el diario de tareas, las huellas, las compatibilidades eliminadas y los detalles
+        pendientes de la base de un shard.
+        Las claves procesadas no se copian: llegan con las filas de su CSV."""
+        self.confirmar()  # ATTACH no se permite dentro de una transacción
+        self.conexion.execute("ATTACH DATABASE ? AS shard", (ruta,))
+        try:
+            self.conexion.execute("""
+                INSERT INTO diario_tareas (tarea_id, estado, inicio, duracion, productos)
+                SELECT tarea_id, estado, inicio, duracion, productos FROM shard.diario_tareas ORDER BY id
+            """)
+            self.conexion.execute("""
+                INSERT OR REPLACE INTO huellas_listados (url_general, huella, productos, comprobada, datos_moto)
+                SELECT url_general, huella, productos, comprobada, datos_moto FROM shard.huellas_listados
+            """)
+            self.conexion.execute("""
+                INSERT OR REPLACE INTO compatibilidades_eliminadas SELECT * FROM shard.compatibilidades_eliminadas
+            """)
+            self.conexion.execute("""
+                INSERT OR REPLACE INTO detalles_pendientes SELECT * FROM shard.detalles_pendientes
+                WHERE clave NOT IN (SELECT clave FROM claves_procesadas)
+            """)
+            self.confirmar()
+        finally:
+            self.conexion.execute("DETACH DATABASE shard")
+
+    def guardar_huella(self, url_general, huella, urls, datos_moto):
+        self.conexion.execute("INSERT OR REPLACE INTO huellas_listados VALUES (?, ?, ?, ?, ?)",
+                              (url_general, huella, json.dumps(urls, ensure_ascii=False), time.time(),
+                               json.dumps(datos_moto, ensure_ascii=False)))
+
+    def eliminar_compatibilidad(self, clave):
+        self.conexion.execute("DELETE FROM claves_procesadas WHERE clave = ?", (clave,))
+        self.conexion.execute("INSERT OR REPLACE INTO compatibilidades_eliminadas VALUES (?, ?)", (clave, time.time()))
+        self.conexion.execute("DELETE FROM detalles_pendientes WHERE clave = ?", (clave,))
+
+    def anotar_detalle_pendiente(self, clave, url_producto, marca_producto, datos_moto):
+        self.conexion.execute("INSERT OR REPLACE INTO detalles_pendientes VALUES (?, ?, ?, ?, ?)",
+                              (clave, url_producto, marca_producto, json.dumps(datos_moto, ensure_ascii=False), time.time()))
+
+    def detalles_pendientes(self):
+        """[(clave, url_producto, marca_producto, datos_moto)] de los detalles que fallaron y faltan por guardar."""
+        return [(clave, url, marca, json.loads(datos_moto)) for clave, url, marca, datos_moto in self.conexion.execute(
+            "SELECT clave, url_producto, marca_producto, datos_moto FROM detalles_pendientes ORDER BY anotado")]
+
+    def registrar_tarea(self, tarea_id, productos, inicio, duracion, completa=True):
+        """Añade al diario el resultado de una ejecución de la tarea: `productos` son las
+        filas guardadas y una tarea que no se completó queda fallida aunque haya guardado alguna."""
+        estado = 'fallida' if not completa else ('hecha' if productos > 0 else 'vacia')
+        self.conexion.execute(
+            "INSERT INTO diario_tareas (tarea_id, estado, inicio, duracion, productos) VALUES (?, ?, ?, ?, ?)",
+            (tarea_id, estado, inicio, duracion, productos))
+        return estado
+
+    def estados_tareas(self):
+        """Devuelve {tarea_id: último estado} leyendo el diario una sola vez."""
+        return dict(self.conexion.execute("""
+            SELECT tarea_id, estado FROM diario_tareas
+            WHERE id IN (SELECT max(id) FROM diario_tareas GROUP BY tarea_id)
+        """))
+
+    def registrar_csv(self, filename, fin_volcado):
+        """Anota hasta qué byte del CSV están registradas las claves (se confirma con confirmar()).
+        `fin_volcado` es el final del último volcado completo, nunca un tamaño leído del disco."""
+        self.guardar_meta('csv_archivo', filename)
+        self.guardar_meta('csv_bytes', fin_volcado)
+
+    def posicion_csv(self, filename):
+        """Byte de `filename` hasta el que están registradas las claves, o -1 si nunca se registró ese archivo."""
+        if self.leer_meta('csv_archivo', filename) != filename:
+            return -1
+        return int(self.leer_meta('csv_bytes', -1))
+
+    def confirmar(self):
+        self.conexion.commit()
+
+    def cerrar(self):
+        self.conexion.commit()
+        self.conexion.close()
+
+    def sincronizar_con_csv(self, filename):
+        """Incorpora las filas del CSV que aún no están en la base.
+        La primera vez importa el CSV completo; después solo lee la parte añadida
+        desde la última confirmación. Devuelve "completa", "parcial" o None.
+        Antes recorta una cola a medio escribir, para registrar solo hasta el final
+        de la última fila (o miembro comprimido) completa y que lo que se escriba
+        después quede legible."""
+        if not os.path.exists(filename):
+            return None
+        registrado = self.posicion_csv(filename)
+        tamano = reparar_final_csv(filename, max(registrado, 0))
+        if registrado == tamano:
+            return None
+        
+        completa = registrado < 0 or registrado > tamano
+        if completa:
+            log_message(f"📥 Importando claves procesadas desde {filename} (solo ocurre una vez)...")
+        antes = len(self)
+        try:
+            # Las filas de compatibilidades eliminadas siguen en el CSV: no se reimportan
+            insertar = """INSERT OR IGNORE INTO claves_procesadas
+                          SELECT ?1 WHERE NOT EXISTS (SELECT 1 FROM compatibilidades_eliminadas WHERE clave = ?1)"""
+            lote = []
+            for clave in iterar_claves_csv(filename, 0 if completa else registrado):
+                lote.append((clave,))
+                if len(lote) >= 10000:
+                    self.conexion.executemany(insertar, lote)
+                    lote = []
+            self.conexion.executemany(insertar, lote)
+            self.guardar_meta('csv_archivo', filename)
+            self.guardar_meta('csv_bytes', tamano)
+            self.confirmar()
+        except ValueError as e:
+            log_message(f"Error encontrando columnas en CSV: {e}")
+            self.conexion.rollback()
+            return None
+        log_message(f"📥 {len(self) - antes} claves nuevas incorporadas desde {filename}")
+        return "completa" if completa else "parcial"
+
+def leer_huella_listado(conexion, url_general):
+    fila = conexion.execute("SELECT huella, productos, datos_moto FROM huellas_listados WHERE url_general = ?", (url_general,)).fetchone()
+    if fila is None:
+        return None
+    return fila[0], json.loads(fila[1]), json.loads(fila[2]) if fila[2] else None
+
+def claves_eliminadas(ruta=None):
+    """Claves con la compatibilidad eliminada y no vuelta a añadir, leídas del estado en solo lectura."""
+    ruta = ruta or STATE_DB
+    if not os.path.exists(ruta):
+        return set()
+    conexion = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True, timeout=30)
+    try:
+        return {fila[0] for fila in conexion.execute("SELECT clave FROM compatibilidades_eliminadas")}
+    except sqlite3.OperationalError:
+        return set()  # Estado anterior a las huellas de listados
+    finally:
+        conexion.close()
+
+class VistaClavesTrabajador:
+    """processed_keys de un proceso trabajador: consulta la base del escritor en
+    solo lectura (ve lo que confirman los demás) y recuerda lo que él mismo envía."""
+
+    def __init__(self, ruta):
+        self.conexion = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True, timeout=30)
+        self.propias = set()
+
+    def __contains__(self, clave):
+        if clave in self.propias:
+            return True
+        return self.conexion.execute("SELECT 1 FROM claves_procesadas WHERE clave = ?", (clave,)).fetchone() is not None
+
+    def add(self, clave):
+        self.propias.add(clave)
+
+    def leer_huella(self, url_general):
+        return leer_huella_listado(self.conexion, url_general)
+
+# --- CACHÉ PERSISTENTE DE DETALLES DE PRODUCTO ---
+_cache_productos = None
+
+def cargar_cache_productos(filename=None):
+    """Carga la caché de productos descartando entradas caducadas y líneas incompletas."""
+    filename = filename or PRODUCT_CACHE_FILE
+    cache = {}
     if not os.path.exists(filename):
-        return processed_keys
-    
+        return cache
+
+    ahora = time.time()
+    ttl = PRODUCT_CACHE_TTL_DAYS * 86400
+    lineas = 0
     try:
-        with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            header = next(reader, None)
-            if header:
-                # Encontrar índices de las columnas necesarias
+        with open(filename, 'r', encoding='utf-8') as f:
+            for linea in f:
+                lineas += 1
                 try:
-                    url_index = header.index('URL DEL PRODUCTO')
-                    marca_index = header.index('MARCA')
-                    modelo_index = header.index('MODELO') 
-                    anio_index = header.index('AÑO')
-                    
-                    for row in reader:
-                        if len(row) > max(url_index, marca_index, modelo_index, anio_index):
-                            # Crear clave única con contexto
-                            clave_unica = f"{row[url_index]}|{row[marca_index]}|{row[modelo_index]}|{row[anio_index]}"
-                            processed_keys.add(clave_unica)
-                except ValueError as e:
-                    log_message(f"Error encontrando columnas en CSV: {e}")
-                    return set()
-        
-        log_message(f"Se encontraron {len(processed_keys)} registros únicos ya procesados")
+                    entrada = json.loads(linea)
+                except ValueError:
+                    continue  # Línea a medio escribir tras un corte
+                if ahora - entrada.get('ts', 0) > ttl:
+                    cache.pop(entrada.get('url'), None)
+                    continue
+                cache[entrada['url']] = entrada
+
+        # Compactar si el archivo acumula demasiadas entradas caducadas o repetidas
+        if lineas > 2 * len(cache) + 100:
+            temporal = filename + ".tmp"
+            with open(temporal, 'w', encoding='utf-8') as f:
+                for entrada in cache.values():
+                    f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+            os.replace(temporal, filename)
+            log_message(f"🧹 Caché de productos compactada: {lineas} -> {len(cache)} entradas")
+
+        log_message(f"💾 Caché de productos cargada: {len(cache)} productos vigentes")
     except Exception as e:
-        log_message(f"Error leyendo registros procesados: {e}")
-    
-    return processed_keys
+        log_message(f"⚠️ Error cargando caché de productos: {e}")
+
+    return cache
+
+def obtener_detalle_cache(url_producto):
+    """Devuelve los detalles cacheados de un producto o None si no existen o han caducado."""
+    global _cache_productos
+    if _cache_productos is None:
+        _cache_productos = cargar_cache_productos()
+
+    entrada = _cache_productos.get(url_producto)
+    if entrada and time.time() - entrada.get('ts', 0) <= PRODUCT_CACHE_TTL_DAYS * 86400:
+        return entrada
+    return None
+
+def guardar_detalle_cache(url_producto, nombre, referencia, marca, ts=None):
+    """Añade los detalles de un producto a la caché en memoria y en disco."""
+    guardar_detalles_cache([{
+        'url': url_producto, 'nombre': nombre, 'referencia': referencia,
+        'marca': marca, 'ts': ts or time.time()
+    }])
+
+def guardar_detalles_cache(entradas):
+    """Añade varias entradas a la caché con una sola escritura en disco."""
+    global _cache_productos
+    if _cache_productos is None:
+        _cache_productos = cargar_cache_productos()
+    if not entradas:
+        return
+
+    try:
+        with open(PRODUCT_CACHE_FILE, 'a', encoding='utf-8') as f:
+            for entrada in entradas:
+                _cache_productos[entrada['url']] = entrada
+                f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+    except Exception as e:
+        log_message(f"⚠️ Error guardando en caché de productos: {e}")
+
+def sembrar_cache_desde_csv(filename):
+    """Rellena la caché con los productos que ya figuran en el CSV de salida."""
+    if not os.path.exists(filename):
+        return
+
+    ts = os.path.getmtime(filename)
+    nuevas = {}
+    try:
+        with abrir_csv(filename) as csvfile:
+            for row in csv.DictReader(csvfile):
+                url = row.get('URL DEL PRODUCTO')
+                if not url or url in nuevas or obtener_detalle_cache(url):
+                    continue
+                nuevas[url] = {
+                    'url': url,
+                    'nombre': row.get('Producto', 'N/A'),
+                    'referencia': row.get('Referencia', 'N/A'),
+                    'marca': row.get('Marca Producto', 'N/A'),
+                    'ts': ts
+                }
+        if nuevas:
+            guardar_detalles_cache(list(nuevas.values()))
+            log_message(f"💾 Caché sembrada con {len(nuevas)} productos del CSV existente")
+    except Exception as e:
+        log_message(f"⚠️ Error sembrando caché desde {filename}: {e}")
+
+# --- LIMITADOR DE PETICIONES POR HOST ---
+class LimitadorTasa:
+    """Cubo de fichas con el estado en memoria compartida, de modo que los
+    procesos trabajadores creados después heredan el mismo cubo."""
+
+    def __init__(self, tasa, rafaga):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        # [fichas disponibles, último instante de recarga]; monotonic es común a todo el sistema
+        self._estado = _procesos.RawArray('d', [float(rafaga), time.monotonic()])
+        self._lock = _procesos.Lock()
+
+    def esperar(self):
+        """Bloquea hasta que haya una ficha disponible y la consume."""
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                fichas = min(self.rafaga, self._estado[0] + (ahora - self._estado[1]) * self.tasa)
+                self._estado[1] = ahora
+                if fichas >= 1:
+                    self._estado[0] = fichas - 1
+                    return
+                self._estado[0] = fichas
+                espera = (1 - fichas) / self.tasa
+            time.sleep(espera)
+
+_limitadores = {}
+
+def obtener_limitador(url):
+    """Devuelve el limitador del host de `url`, creándolo si no existe."""
+    host = urlparse(url).netloc
+    limitador = _limitadores.get(host)
+    if limitador is None:
+        limitador = _limitadores[host] = LimitadorTasa(REQUESTS_PER_SECOND, RATE_LIMIT_BURST)
+    return limitador
+
+@medido("espera_limitador")
+def esperar_turno(url=None):
+    """Espera el turno para lanzar una petición (navegación, XHR de un selector o HTTP)."""
+    obtener_limitador(url or BASE_URL).esperar()
 
 # --- FUNCIONES DE AYUDA ---
-def configurar_driver():
-    """Configura e inicia el navegador Chrome con Selenium (versión para servidor)."""
+@medido("arranque_driver")
+def configurar_driver(registrar_red=False):
+    """Configura e inicia el navegador Chrome con Selenium (versión para servidor).
+    Con registrar_red=True se activa el log de rendimiento para leer las peticiones de red."""
     options = webdriver.ChromeOptions()
+    if registrar_red:
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
     
+    # Perfil propio por sesión; cerrar_driver() lo borra al terminar
+    directorio_perfil = tempfile.mkdtemp(prefix=f"chrome-session-{os.getpid()}-")
     options.add_argument('--headless')
-    options.add_argument(f'--user-data-dir=/tmp/chrome-session-{os.getpid()}')
+    options.add_argument(f'--user-data-dir={directorio_perfil}')
     options.add_argument('--log-level=3')
     options.add_argument('--disable-gpu')
     options.add_argument('--no-sandbox')
@@ -107,23 +1070,131 @@ def configurar_driver():
     options.add_argument('--disable-blink-features=AutomationControlled')
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option('useAutomationExtension', False)
-    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+    options.add_argument(f"user-agent={USER_AGENT}")
+    if BROWSER_LEAN:
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_argument('--disk-cache-size=1')
+        options.add_argument('--media-cache-size=1')
+        for opcion in ('--disable-extensions', '--disable-background-networking', '--disable-component-update',
+                       '--disable-default-apps', '--disable-sync', '--no-first-run', '--mute-audio',
+                       '--disable-features=Translate,OptimizationHints,MediaRouter'):
+            options.add_argument(opcion)
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
     
     try:
         driver = webdriver.Chrome(options=options)
+        driver.directorio_perfil = directorio_perfil
         driver.set_page_load_timeout(60)
+        driver.set_script_timeout(SELECTOR_WAIT_TIMEOUT + 5)
         driver.implicitly_wait(10)
+        if BROWSER_LEAN:
+            bloquear_recursos(driver)
         return driver
     except Exception as e:
         log_message(f"Error al iniciar Selenium: {e}")
+        shutil.rmtree(directorio_perfil, ignore_errors=True)
         return None
 
+def bloquear_recursos(driver):
+    """Bloquea a nivel de red las peticiones de BLOCKED_URL_PATTERNS (imágenes, fuentes, CSS, rastreadores)."""
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+    except Exception as e:
+        log_message(f"⚠️ No se pudo activar el bloqueo de recursos: {e}")
+
+def limpiar_perfiles_huerfanos():
+    """Borra los perfiles de Chrome que dejaron en /tmp procesos que ya no existen."""
+    directorio_tmp = tempfile.gettempdir()
+    borrados = 0
+    for nombre in os.listdir(directorio_tmp):
+        if not nombre.startswith("chrome-session-"):
+            continue
+        pid = nombre[len("chrome-session-"):].split("-")[0]
+        if not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            os.kill(int(pid), 0)
+            continue  # El proceso sigue vivo
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            continue
+        shutil.rmtree(os.path.join(directorio_tmp, nombre), ignore_errors=True)
+        borrados += 1
+    if borrados:
+        log_message(f"🧹 {borrados} perfiles de Chrome huérfanos eliminados de {directorio_tmp}")
+
+def driver_sano(driver):
+    """Comprueba con una llamada mínima que la sesión de Chrome sigue respondiendo."""
+    try:
+        return driver.execute_script("return 1") == 1
+    except Exception:
+        return False
+
+def cerrar_driver(driver):
+    """Cierra una sesión de Chrome ignorando errores y borra su perfil temporal."""
+    try:
+        driver.quit()
+    except Exception as e:
+        log_message(f"⚠️ Error cerrando driver: {e}")
+    directorio_perfil = getattr(driver, 'directorio_perfil', None)
+    if directorio_perfil:
+        shutil.rmtree(directorio_perfil, ignore_errors=True)
+
+class PoolDrivers:
+    """Mantiene sesiones de Chrome abiertas entre tareas.
+
+    Cada sesión se comprueba con driver_sano() antes de entregarla y se
+    recicla tras DRIVER_MAX_TASKS tareas o cuando una tarea falla.
+    """
+
+    def __init__(self, max_tareas=DRIVER_MAX_TASKS):
+        self.max_tareas = max_tareas
+        self._libres = []
+        self._usos = {}
+
+    def obtener(self):
+        """Devuelve un driver listo para usar o None si no se pudo iniciar."""
+        while self._libres:
+            driver = self._libres.pop()
+            if driver_sano(driver):
+                return driver
+            log_message("🔧 Sesión de Chrome sin respuesta, se descarta")
+            self._descartar(driver)
+        
+        driver = configurar_driver()
+        if driver:
+            self._usos[driver] = 0
+            log_message("🔧 Nueva sesión de Chrome iniciada")
+        return driver
+
+    def liberar(self, driver, fallo=False):
+        """Devuelve un driver al pool, o lo cierra si falló o agotó sus usos."""
+        self._usos[driver] = self._usos.get(driver, 0) + 1
+        if fallo or self._usos[driver] >= self.max_tareas:
+            motivo = "fallo en la tarea" if fallo else f"{self._usos[driver]} tareas realizadas"
+            log_message(f"🔧 Reciclando sesión de Chrome ({motivo})")
+            self._descartar(driver)
+        else:
+            self._libres.append(driver)
+
+    def cerrar(self):
+        """Cierra todas las sesiones abiertas."""
+        while self._libres:
+            self._descartar(self._libres.pop())
+
+    def _descartar(self, driver):
+        self._usos.pop(driver, None)
+        cerrar_driver(driver)
+
+@medido("reiniciar_selectores")
 def reiniciar_selectores(driver):
     """Reinicia todos los selectores a su estado inicial."""
     try:
         log_message("    🔄 Reiniciando selectores...")
+        esperar_turno(BASE_URL)
         driver.get(BASE_URL)
-        time.sleep(3)
         
         # Esperar a que los selectores estén disponibles
         wait = WebDriverWait(driver, 15)
@@ -137,8 +1208,8 @@ def reiniciar_selectores(driver):
                 select_obj = Select(select_element)
                 if select_obj.first_selected_option.get_attribute('value') not in ["-1", "", "0"]:
                     # Si no está en valor por defecto, resetear
+                    esperar_turno()
                     select_obj.select_by_index(0)
-                    time.sleep(0.5)
             except Exception as e:
                 log_message(f"    ⚠️ Error reseteando selector {selector_id}: {e}")
         
@@ -149,16 +1220,63 @@ def reiniciar_selectores(driver):
         log_message(f"    ❌ Error reiniciando selectores: {e}")
         return False
 
+# Ambos scripts devuelven las opciones válidas como [[value, text], ...]
+_JS_OPCIONES_SELECTOR = """
+var s = document.getElementById(arguments[0]);
+if (!s) return [];
+return Array.prototype.map.call(s.options, function (o) { return [o.value, o.text.trim()]; })
+    .filter(function (o) { return ["-1", "", "0"].indexOf(o[0]) < 0 && o[1] && o[1] !== "- Seleccionar -"; });
+"""
+
+_JS_ESPERAR_OPCIONES_NUEVAS = """
+var id = arguments[0], previas = JSON.stringify(arguments[1] || []), limite = arguments[2];
+var listo = arguments[arguments.length - 1];
+var vaciado = false, terminado = false, observador, temporizador;
+function validas() {
+    var s = document.getElementById(id);
+    if (!s) return [];
+    return Array.prototype.map.call(s.options, function (o) { return [o.value, o.text.trim()]; })
+        .filter(function (o) { return ["-1", "", "0"].indexOf(o[0]) < 0 && o[1] && o[1] !== "- Seleccionar -"; });
+}
+function terminar(resultado) {
+    if (terminado) return;
+    terminado = true;
+    observador.disconnect();
+    clearTimeout(temporizador);
+    listo(resultado);
+}
+function comprobar() {
+    var v = validas();
+    // Se acepta una lista distinta de la anterior, o cualquiera si el selector se vació entretanto
+    if (!v.length) { vaciado = true; return; }
+    if (vaciado || JSON.stringify(v) !== previas) terminar({nuevas: true, opciones: v});
+}
+observador = new MutationObserver(comprobar);
+observador.observe(document.documentElement, {childList: true, subtree: true});
+temporizador = setTimeout(function () { terminar({nuevas: false, opciones: validas()}); }, limite);
+comprobar();
+"""
+
+def leer_opciones_selector(driver, locator):
+    """Lee las opciones válidas de un <select> (localizado por ID) con una sola llamada al navegador."""
+    opciones = driver.execute_script(_JS_OPCIONES_SELECTOR, locator[1])
+    return [{'value': value, 'text': text} for value, text in opciones]
+
+def esperar_opciones_nuevas(driver, locator, anteriores, timeout=SELECTOR_WAIT_TIMEOUT):
+    """Espera a que el <select> indicado tenga opciones válidas distintas de `anteriores`.
+    Un MutationObserver en la página responde en cuanto cambian, sin sondear.
+    Si se agota el tiempo devuelve las opciones válidas que haya (o [])."""
+    previas = [[o['value'], o['text']] for o in anteriores or []]
+    resultado = driver.execute_async_script(_JS_ESPERAR_OPCIONES_NUEVAS, locator[1], previas, int(timeout * 1000))
+    if not resultado['nuevas'] and resultado['opciones']:
+        log_message(f"    ⚠️ {locator[1]}: sin cambios tras {timeout}s, se usan las opciones actuales")
+    return [{'value': value, 'text': text} for value, text in resultado['opciones']]
+
 def verificar_estado_selector(driver, locator, descripcion="selector"):
     """Verifica si un selector está en buen estado y tiene opciones válidas."""
     try:
-        element = driver.find_element(*locator)
-        select_obj = Select(element)
-        opciones_validas = [opt for opt in select_obj.options 
-                          if opt.get_attribute('value') not in ["-1", "", "0"] 
-                          and opt.text.strip() not in ["- Seleccionar -", ""]]
-        
-        log_message(f"    🔍 {descripcion}: {len(opciones_validas)} opciones válidas")
+        opciones_validas = leer_opciones_selector(driver, locator)
+        log_message(f"    🔍 {descripcion}: {len(opciones_validas)} opciones válidas", logging.DEBUG)
         return len(opciones_validas) > 0
         
     except Exception as e:
@@ -185,35 +1303,32 @@ def obtener_opciones_desplegable_seguro(driver, locator, timeout=15, max_recover
         for intento in range(MAX_RETRIES):
             try:
                 wait = WebDriverWait(driver, timeout)
-                desplegable_element = wait.until(EC.presence_of_element_located(locator))
-                select = Select(desplegable_element)
-                opciones = []
-                
-                for option in select.options:
-                    value = option.get_attribute('value')
-                    text = option.text.strip()
-                    if value and value not in ["-1", "", "0"] and text and text != "- Seleccionar -":
-                        opciones.append({'value': value, 'text': text})
+                wait.until(EC.presence_of_element_located(locator))
+                opciones = leer_opciones_selector(driver, locator)
                 
                 if opciones:  # Si encontramos opciones válidas
-                    log_message(f"Encontradas {len(opciones)} opciones válidas en {locator}")
+                    log_message(f"Encontradas {len(opciones)} opciones válidas en {locator}", logging.DEBUG)
                     return opciones
                 else:
                     log_message(f"⚠️ No se encontraron opciones válidas en {locator}")
                     if recovery_attempt < max_recovery_attempts - 1:
                         log_message(f"    🔄 Intento de recuperación {recovery_attempt + 1}/{max_recovery_attempts}")
+                        metricas.contar("recuperacion_selector")
                         if reiniciar_selectores(driver):
                             break  # Salir del bucle de intentos y probar recovery
                     return []
                 
             except StaleElementReferenceException:
                 log_message(f"Elemento 'stale' detectado. Reintentando... ({MAX_RETRIES - intento} intentos restantes)")
+                metricas.contar("reintento_selector")
                 time.sleep(1)
             except Exception as e:
                 log_message(f"Error obteniendo opciones del desplegable {locator}: {e}")
+                metricas.contar("reintento_selector")
                 if intento == MAX_RETRIES - 1:
                     if recovery_attempt < max_recovery_attempts - 1:
                         log_message(f"    🔄 Intento de recuperación {recovery_attempt + 1}/{max_recovery_attempts}")
+                        metricas.contar("recuperacion_selector")
                         if reiniciar_selectores(driver):
                             break
                     else:
@@ -222,49 +1337,55 @@ def obtener_opciones_desplegable_seguro(driver, locator, timeout=15, max_recover
     
     return []
 
-def seleccionar_opcion_segura_con_recuperacion(driver, select_locator, option_value, next_select_locator=None, descripcion="opción"):
+@medido(lambda driver, select_locator, *args, **kwargs: f"selector_{select_locator[1]}")
+def seleccionar_opcion_segura_con_recuperacion(driver, select_locator, option_value, next_select_locator=None, descripcion="opción", max_recovery_attempts=MAX_RECOVERY_ATTEMPTS):
     """Selecciona una opción de forma segura con recuperación ante errores."""
     
-    for recovery_attempt in range(MAX_RECOVERY_ATTEMPTS):
+    for recovery_attempt in range(max_recovery_attempts):
         for intento in range(MAX_RETRIES):
             try:
                 wait = WebDriverWait(driver, 20)
                 select_element = wait.until(EC.element_to_be_clickable(select_locator))
                 select_obj = Select(select_element)
                 
+                # Foto de las opciones actuales del siguiente selector para detectar el cambio
+                anteriores = leer_opciones_selector(driver, next_select_locator) if next_select_locator else None
+                
+                # Cada selección dispara una petición en segundo plano de la web
+                esperar_turno()
+                
                 # Intentar seleccionar por valor primero, luego por texto
                 try:
                     select_obj.select_by_value(option_value)
                 except:
                     select_obj.select_by_visible_text(option_value)
                 
-                time.sleep(DELAY_BETWEEN_REQUESTS)
-                
-                # Si hay un siguiente select, esperar a que se actualice y verificar
+                # Si hay un siguiente select, esperar a que lleguen sus nuevas opciones
                 if next_select_locator:
-                    wait.until(EC.presence_of_element_located(next_select_locator))
+                    opciones_siguiente = esperar_opciones_nuevas(driver, next_select_locator, anteriores)
+                    log_message(f"    🔍 siguiente selector después de {descripcion}: {len(opciones_siguiente)} opciones válidas", logging.DEBUG)
                     
-                    # Verificar que el siguiente selector tiene opciones válidas
-                    time.sleep(1)  # Dar tiempo extra para que carguen las opciones
-                    
-                    if not verificar_estado_selector(driver, next_select_locator, f"siguiente selector después de {descripcion}"):
+                    if not opciones_siguiente:
                         log_message(f"⚠️ El siguiente selector no tiene opciones válidas después de seleccionar {descripcion}: {option_value}")
                         
-                        if recovery_attempt < MAX_RECOVERY_ATTEMPTS - 1:
-                            log_message(f"🔄 Intento de recuperación {recovery_attempt + 1}/{MAX_RECOVERY_ATTEMPTS}")
+                        if recovery_attempt < max_recovery_attempts - 1:
+                            log_message(f"🔄 Intento de recuperación {recovery_attempt + 1}/{max_recovery_attempts}")
+                            metricas.contar("recuperacion_selector")
                             if reiniciar_selectores(driver):
                                 break  # Salir del bucle de intentos y probar recovery
                         return False
                 
-                log_message(f"✅ Seleccionado correctamente {descripcion}: {option_value}")
+                log_message(f"✅ Seleccionado correctamente {descripcion}: {option_value}", logging.DEBUG)
                 return True
                 
             except Exception as e:
                 log_message(f"Error seleccionando {descripcion} {option_value} (intento {intento + 1}): {e}")
+                metricas.contar("reintento_selector")
                 if intento < MAX_RETRIES - 1:
                     time.sleep(2)
-                elif recovery_attempt < MAX_RECOVERY_ATTEMPTS - 1:
-                    log_message(f"🔄 Intento de recuperación {recovery_attempt + 1}/{MAX_RECOVERY_ATTEMPTS}")
+                elif recovery_attempt < max_recovery_attempts - 1:
+                    log_message(f"🔄 Intento de recuperación {recovery_attempt + 1}/{max_recovery_attempts}")
+                    metricas.contar("recuperacion_selector")
                     if reiniciar_selectores(driver):
                         break
                 else:
@@ -276,16 +1397,73 @@ def seleccionar_opcion_segura_con_recuperacion(driver, select_locator, option_va
     return False
 
 # --- FASE 1: RECOPILACIÓN DE TAREAS CON RECUPERACIÓN ---
+TIPO_LOCATOR = (By.ID, 'itipo')
+MARCA_LOCATOR = (By.ID, 'imarca')
+CC_LOCATOR = (By.ID, 'icc')
+MODELO_LOCATOR = (By.ID, 'imodel')
+
+TIPOS_VEHICULOS = [
+    {'value': '3', 'text': 'Moto'},
+    {'value': '4', 'text': 'Scooter'}
+]
+
+def seleccionar_en_ruta(driver, ruta):
+    """Cambia solo el último selector de `ruta` (lista de (locator, valor, siguiente, descripción))
+    suponiendo que los anteriores ya están seleccionados en la página. Si falla, reinicia
+    los selectores y recorre la ruta completa."""
+    locator, valor, siguiente, descripcion = ruta[-1]
+    if seleccionar_opcion_segura_con_recuperacion(driver, locator, valor, siguiente, descripcion, max_recovery_attempts=1):
+        return True
+    
+    for recovery_attempt in range(MAX_RECOVERY_ATTEMPTS):
+        log_message(f"🔄 Reconstruyendo selección completa ({len(ruta)} niveles), intento {recovery_attempt + 1}/{MAX_RECOVERY_ATTEMPTS}")
+        if not reiniciar_selectores(driver):
+            continue
+        if all(seleccionar_opcion_segura_con_recuperacion(driver, l, v, sig, desc, max_recovery_attempts=1)
+               for l, v, sig, desc in ruta):
+            return True
+    return False
+
+def cargar_progreso_fase1(filename=PHASE1_CHECKPOINT_FILE):
+    """Devuelve {'tipo|marca': [tareas]} con las marcas ya completadas en una ejecución anterior."""
+    progreso = {}
+    if not os.path.exists(filename):
+        return progreso
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    entrada = json.loads(linea)
+                except ValueError:
+                    continue  # Línea a medio escribir tras un corte
+                progreso[f"{entrada['tipo_value']}|{entrada['marca_value']}"] = entrada['tareas']
+    except Exception as e:
+        log_message(f"⚠️ Error leyendo progreso de Fase 1: {e}")
+    return progreso
+
+def guardar_progreso_marca(tipo, marca, tareas_marca, filename=PHASE1_CHECKPOINT_FILE):
+    """Anota una marca completada en el archivo de progreso de la Fase 1."""
+    try:
+        with open(filename, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'tipo_value': tipo['value'], 'marca_value': marca['value'], 'tareas': tareas_marca
+            }, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    except Exception as e:
+        log_message(f"⚠️ Error guardando progreso de la marca {marca['text']}: {e}")
+
 def recopilar_todas_las_tareas_seguro(driver):
-    """Navega por todos los menús para crear una lista maestra de todas las combinaciones con manejo de errores."""
+    """Recorre los menús en profundidad para crear la lista maestra de combinaciones.
+    Solo se cambia el selector más profundo que lo necesita (marca, luego cada CC) y cada
+    marca completada se guarda en PHASE1_CHECKPOINT_FILE para poder reanudar."""
     log_message("=== FASE 1: Creando mapa completo de todas las motos y scooters (con recuperación) ===")
     tareas = []
     
-    # Definir localizadores
-    TIPO_LOCATOR = (By.ID, 'itipo')
-    MARCA_LOCATOR = (By.ID, 'imarca')
-    CC_LOCATOR = (By.ID, 'icc')
-    MODELO_LOCATOR = (By.ID, 'imodel')
+    progreso = cargar_progreso_fase1()
+    if progreso:
+        log_message(f"⏭️ Reanudando Fase 1: {len(progreso)} marcas ya completadas en '{PHASE1_CHECKPOINT_FILE}'")
+    marcas_incompletas = 0
     
     try:
         # Inicializar página
@@ -293,69 +1471,58 @@ def recopilar_todas_las_tareas_seguro(driver):
             log_message("❌ No se pudo inicializar la página")
             return []
         
-        # Obtener tipos (Moto y Scooter)
-        tipos_vehiculos = [
-            {'value': '3', 'text': 'Moto'},
-            {'value': '4', 'text': 'Scooter'}
-        ]
-        
-        for tipo in tipos_vehiculos:
+        for tipo in TIPOS_VEHICULOS:
             log_message(f"Procesando tipo: {tipo['text']}")
+            ruta_tipo = [(TIPO_LOCATOR, tipo['value'], MARCA_LOCATOR, "tipo")]
             
-            # Reiniciar selectores antes de cada tipo
-            if not reiniciar_selectores(driver):
-                log_message(f"❌ Error reiniciando para tipo {tipo['text']}")
-                continue
-            
-            # Seleccionar tipo
-            if not seleccionar_opcion_segura_con_recuperacion(driver, TIPO_LOCATOR, tipo['value'], MARCA_LOCATOR, "tipo"):
+            if not seleccionar_en_ruta(driver, ruta_tipo):
                 log_message(f"❌ ERROR: No se pudo seleccionar el tipo {tipo['text']}")
                 continue
             
             # Obtener marcas
-            marcas = obtener_opciones_desplegable_seguro(driver, MARCA_LOCATOR)
+            marcas = obtener_opciones_desplegable_seguro(driver, MARCA_LOCATOR, max_recovery_attempts=1)
             if not marcas:
                 log_message(f"❌ No se encontraron marcas para {tipo['text']}")
                 continue
             
             for idx_marca, marca in enumerate(marcas):
-                log_message(f"  Procesando marca {idx_marca + 1}/{len(marcas)}: {marca['text']}")
-                
-                # Re-seleccionar tipo antes de cada marca (por seguridad)
-                if not seleccionar_opcion_segura_con_recuperacion(driver, TIPO_LOCATOR, tipo['value'], MARCA_LOCATOR, "tipo"):
-                    log_message(f"❌ Error re-seleccionando tipo para marca {marca['text']}")
+                clave_progreso = f"{tipo['value']}|{marca['value']}"
+                if clave_progreso in progreso:
+                    tareas.extend(progreso[clave_progreso])
+                    log_message(f"  ⏭️ Marca {idx_marca + 1}/{len(marcas)} ya completada: {marca['text']}")
                     continue
                 
-                if not seleccionar_opcion_segura_con_recuperacion(driver, MARCA_LOCATOR, marca['value'], CC_LOCATOR, "marca"):
+                log_message(f"  Procesando marca {idx_marca + 1}/{len(marcas)}: {marca['text']}")
+                ruta_marca = ruta_tipo + [(MARCA_LOCATOR, marca['value'], CC_LOCATOR, "marca")]
+                
+                if not seleccionar_en_ruta(driver, ruta_marca):
                     log_message(f"❌ ERROR: No se pudo seleccionar la marca {marca['text']}")
+                    marcas_incompletas += 1
                     continue
                 
                 # Obtener CCs
-                ccs = obtener_opciones_desplegable_seguro(driver, CC_LOCATOR)
+                ccs = obtener_opciones_desplegable_seguro(driver, CC_LOCATOR, max_recovery_attempts=1)
                 if not ccs:
                     log_message(f"⚠️ No se encontraron CCs para {marca['text']}")
+                    marcas_incompletas += 1
                     continue
                 
+                tareas_marca = []
+                marca_completa = True
                 for idx_cc, cc in enumerate(ccs):
                     log_message(f"    Procesando CC {idx_cc + 1}/{len(ccs)}: {cc['text']}")
+                    ruta_cc = ruta_marca + [(CC_LOCATOR, cc['value'], MODELO_LOCATOR, "CC")]
                     
-                    # Re-seleccionar tipo y marca antes de cada CC
-                    if not seleccionar_opcion_segura_con_recuperacion(driver, TIPO_LOCATOR, tipo['value'], MARCA_LOCATOR, "tipo"):
-                        log_message(f"❌ Error re-seleccionando tipo para CC {cc['text']}")
-                        continue
-                    
-                    if not seleccionar_opcion_segura_con_recuperacion(driver, MARCA_LOCATOR, marca['value'], CC_LOCATOR, "marca"):
-                        log_message(f"❌ Error re-seleccionando marca para CC {cc['text']}")
-                        continue
-                    
-                    if not seleccionar_opcion_segura_con_recuperacion(driver, CC_LOCATOR, cc['value'], MODELO_LOCATOR, "CC"):
+                    if not seleccionar_en_ruta(driver, ruta_cc):
                         log_message(f"❌ ERROR: No se pudo seleccionar CC {cc['text']} - SALTANDO")
+                        marca_completa = False
                         continue
                     
                     # Obtener modelos
-                    modelos = obtener_opciones_desplegable_seguro(driver, MODELO_LOCATOR)
+                    modelos = obtener_opciones_desplegable_seguro(driver, MODELO_LOCATOR, max_recovery_attempts=1)
                     if not modelos:
                         log_message(f"⚠️ No se encontraron modelos para {cc['text']}cc - SALTANDO")
+                        marca_completa = False
                         continue
                     
                     log_message(f"      ✅ Encontrados {len(modelos)} modelos para {cc['text']}cc")
@@ -370,258 +1537,858 @@ def recopilar_todas_las_tareas_seguro(driver):
                             'modelo_value': modelo['value'],
                             'modelo_text': modelo['text']
                         }
-                        tareas.append(tarea)
+                        tareas_marca.append(tarea)
+                
+                tareas.extend(tareas_marca)
+                if marca_completa:
+                    guardar_progreso_marca(tipo, marca, tareas_marca)
+                else:
+                    marcas_incompletas += 1
         
-        # Guardar tareas
-        if tareas:
-            with open(TASKS_FILE, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=tareas[0].keys())
-                writer.writeheader()
-                writer.writerows(tareas)
-            
-            log_message(f"=== FASE 1 COMPLETADA: {len(tareas)} tareas guardadas en '{TASKS_FILE}' ===")
-        else:
-            log_message("❌ ERROR: No se recopilaron tareas")
-            
-        return tareas
+        return finalizar_fase1(tareas, marcas_incompletas)
         
     except Exception as e:
         log_message(f"❌ ERROR CRÍTICO en Fase 1: {e}")
         return []
 
-# --- CONTINUAMOS CON LAS FUNCIONES ORIGINALES (sin cambios significativos) ---
-def extraer_productos_de_pagina(driver):
-    """Extrae todos los productos de la página actual, incluyendo paginación."""
-    productos = []
+def guardar_tareas(tareas, filename=None):
+    """Escribe la lista de tareas con el esquema de TASKS_FILE."""
+    with open(filename or TASKS_FILE, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=tareas[0].keys())
+        writer.writeheader()
+        writer.writerows(tareas)
+
+def finalizar_fase1(tareas, marcas_incompletas):
+    """Guarda las tareas recopiladas y devuelve la lista guardada.
+
+    El progreso intermedio de la Fase 1 solo se elimina cuando todas las marcas se
+    completaron. Si falta alguna se conserva para reanudar, y de la lista anterior de
+    TASKS_FILE se mantienen los modelos de las marcas sin terminar que no se han vuelto a ver.
+    """
+    if not tareas:
+        log_message("❌ ERROR: No se recopilaron tareas")
+        return tareas
+    if marcas_incompletas:
+        completas = set(cargar_progreso_fase1(PHASE1_CHECKPOINT_FILE))
+        vistas = {clave_modelo(t) for t in tareas}
+        anteriores = cargar_tareas() if os.path.exists(TASKS_FILE) else []
+        conservadas = [t for t in anteriores if clave_modelo(t) not in vistas
+                       and f"{t['tipo_value']}|{t['marca_value']}" not in completas]
+        tareas = tareas + conservadas
+        guardar_tareas(tareas)
+        log_message(f"⚠️ FASE 1 INCOMPLETA: {marcas_incompletas} marcas sin terminar. '{TASKS_FILE}' guarda "
+                    f"{len(tareas)} tareas ({len(conservadas)} de la lista anterior) y '{PHASE1_CHECKPOINT_FILE}' "
+                    f"se mantiene para reanudar")
+        return tareas
+    guardar_tareas(tareas)
+    log_message(f"=== FASE 1 COMPLETADA: {len(tareas)} tareas guardadas en '{TASKS_FILE}' ===")
+    if os.path.exists(PHASE1_CHECKPOINT_FILE):
+        os.remove(PHASE1_CHECKPOINT_FILE)
+    return tareas
+
+def cargar_tareas(filename=None):
+    """Lee una lista de tareas con el esquema de TASKS_FILE."""
+    with open(filename or TASKS_FILE, 'r', newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+def clave_modelo(tarea):
+    """Identifica un modelo del catálogo independientemente de los textos mostrados."""
+    return (tarea['marca_value'], tarea['cc_value'], tarea['modelo_value'])
+
+def comparar_tareas(anteriores, actuales):
+    """Devuelve (nuevas, eliminadas) comparando por clave_modelo y conservando el orden."""
+    claves_anteriores = {clave_modelo(t) for t in anteriores}
+    claves_actuales = {clave_modelo(t) for t in actuales}
+    nuevas = [t for t in actuales if clave_modelo(t) not in claves_anteriores]
+    eliminadas = [t for t in anteriores if clave_modelo(t) not in claves_actuales]
+    return nuevas, eliminadas
+
+def actualizar_catalogo(modo):
+    """Vuelve a recorrer el catálogo, lo compara con TASKS_FILE y guarda solo las diferencias
+    en TASKS_ADDED_FILE y TASKS_REMOVED_FILE. Devuelve la lista de tareas nuevas."""
+    anteriores = cargar_tareas() if os.path.exists(TASKS_FILE) else []
+    log_message(f"🔄 ACTUALIZACIÓN INCREMENTAL: {len(anteriores)} tareas en '{TASKS_FILE}'")
     
-    try:
-        # Esperar a que cargue el contenido
-        wait = WebDriverWait(driver, 20)
-        
-        # Intentar detectar si hay productos o si la página está vacía
+    if modo == "endpoints":
+        actuales = recopilar_tareas_por_endpoints()
+    else:
+        driver_fase1 = configurar_driver()
+        if not driver_fase1:
+            log_message("❌ ERROR: No se pudo iniciar driver para Fase 1")
+            return None
+        actuales = recopilar_todas_las_tareas_seguro(driver_fase1)
+        cerrar_driver(driver_fase1)
+    if not actuales:
+        log_message("❌ ERROR: El recorrido del catálogo no devolvió tareas, se conserva la lista anterior")
+        return None
+    
+    nuevas, eliminadas = comparar_tareas(anteriores, actuales)
+    for lista, filename in ((nuevas, TASKS_ADDED_FILE), (eliminadas, TASKS_REMOVED_FILE)):
+        if lista:
+            guardar_tareas(lista, filename)
+        elif os.path.exists(filename):
+            os.remove(filename)
+    
+    log_message(f"   • Modelos nuevos: {len(nuevas)} -> '{TASKS_ADDED_FILE}'")
+    log_message(f"   • Modelos eliminados: {len(eliminadas)} -> '{TASKS_REMOVED_FILE}'")
+    if anteriores and len(eliminadas) > len(anteriores) // 10:
+        log_message("⚠️ Han desaparecido más del 10% de los modelos: revisar si alguna marca falló en el recorrido")
+    return nuevas
+
+# --- FASE 1 DIRECTA: LLAMADAS A LAS PETICIONES DE LOS SELECTORES ---
+# Cada selector se rellena con una petición en segundo plano de la web. Se graba una vez
+# desde el log de red del navegador y se convierte en plantilla: los parámetros cuyo valor
+# coincide con una opción seleccionada se sustituyen por el nombre de su nivel.
+NIVELES_SELECTORES = [
+    ('tipo', TIPO_LOCATOR),
+    ('marca', MARCA_LOCATOR),
+    ('cc', CC_LOCATOR),
+    ('modelo', MODELO_LOCATOR)
+]
+
+def peticiones_xhr_registradas(driver):
+    """Devuelve las peticiones XHR/fetch del log de rendimiento desde la última lectura."""
+    peticiones = []
+    for entrada in driver.get_log('performance'):
         try:
-            # Esperar a que aparezca el contenedor de productos O un mensaje de "no productos"
-            wait.until(lambda d: 
-                d.find_elements(By.CSS_SELECTOR, 'div.vista_fitxes') or 
+            mensaje = json.loads(entrada['message'])['message']
+        except (KeyError, ValueError):
+            continue
+        if mensaje.get('method') != 'Network.requestWillBeSent':
+            continue
+        params = mensaje.get('params', {})
+        if params.get('type') in ('XHR', 'Fetch'):
+            peticiones.append(params['request'])
+    return peticiones
+
+def _sustituir_valor(valor, seleccion):
+    """Convierte un valor en '{nivel}' si coincide con una selección (el nivel más profundo gana)."""
+    for nivel in reversed(list(seleccion)):
+        if valor == seleccion[nivel]:
+            return '{' + nivel + '}'
+    return valor
+
+def crear_plantilla_peticion(peticion, seleccion):
+    """Convierte una petición grabada en plantilla reutilizable para cualquier selección."""
+    url = urlparse(peticion['url'])
+    ruta = '/'.join(_sustituir_valor(parte, seleccion) for parte in url.path.split('/'))
+    cabeceras = {k: v for k, v in peticion.get('headers', {}).items()
+                 if k.lower() not in ('cookie', 'content-length', 'host') and not k.startswith(':')}
+    
+    plantilla = {
+        'metodo': peticion.get('method', 'GET'),
+        'url': urlunparse(url._replace(path=ruta, query='')),
+        'query': [[k, _sustituir_valor(v, seleccion)] for k, v in parse_qsl(url.query, keep_blank_values=True)],
+        'cabeceras': cabeceras,
+        'cuerpo': None,
+        'formato_cuerpo': None
+    }
+    
+    cuerpo = peticion.get('postData')
+    if cuerpo:
+        try:
+            datos = json.loads(cuerpo)
+            if isinstance(datos, dict):
+                plantilla['cuerpo'] = {k: _sustituir_valor(str(v), seleccion) for k, v in datos.items()}
+                plantilla['formato_cuerpo'] = 'json'
+        except ValueError:
+            plantilla['cuerpo'] = [[k, _sustituir_valor(v, seleccion)] for k, v in parse_qsl(cuerpo, keep_blank_values=True)]
+            plantilla['formato_cuerpo'] = 'form'
+    return plantilla
+
+def parsear_opciones_respuesta(contenido):
+    """Extrae [{'value', 'text'}] de la respuesta de un selector (HTML con <option> o JSON)."""
+    opciones = []
+    try:
+        datos = json.loads(contenido)
+    except ValueError:
+        datos = None
+    
+    if isinstance(datos, dict) and isinstance(datos.get('html'), str):
+        contenido, datos = datos['html'], None
+    
+    if isinstance(datos, list):
+        for item in datos:
+            if isinstance(item, dict):
+                valor = next((item[k] for k in ('value', 'valor', 'id', 'codi', 'codigo') if k in item), None)
+                texto = next((item[k] for k in ('text', 'texto', 'nom', 'nombre', 'name', 'descripcion') if k in item), None)
+                opciones.append((valor, texto))
+            elif isinstance(item, (list, tuple)) and len(item) >= 2:
+                opciones.append((item[0], item[1]))
+    elif isinstance(datos, dict):
+        opciones = list(datos.items())
+    elif datos is None:
+        for option in BeautifulSoup(contenido, 'lxml').find_all('option'):
+            opciones.append((option.get('value', ''), texto_visible(option)))
+    
+    return [{'value': str(valor), 'text': str(texto).strip()} for valor, texto in opciones
+            if valor is not None and texto and str(valor) not in ["-1", "", "0"]
+            and str(texto).strip() not in ["- Seleccionar -", ""]]
+
+@medido("endpoint_selector")
+def consultar_opciones_endpoint(plantilla, seleccion):
+    """Lanza la petición de la plantilla para `seleccion` y devuelve las opciones del selector."""
+    def rellenar(valor):
+        if valor.startswith('{') and valor.endswith('}') and valor[1:-1] in seleccion:
+            return seleccion[valor[1:-1]]
+        return valor
+    
+    url = '/'.join(rellenar(parte) for parte in plantilla['url'].split('/'))
+    if plantilla['query']:
+        url += '?' + urlencode([(k, rellenar(v)) for k, v in plantilla['query']])
+    
+    argumentos = {'headers': plantilla['cabeceras'], 'timeout': HTTP_TIMEOUT}
+    if plantilla['formato_cuerpo'] == 'json':
+        argumentos['json'] = {k: rellenar(v) for k, v in plantilla['cuerpo'].items()}
+    elif plantilla['formato_cuerpo'] == 'form':
+        argumentos['data'] = [(k, rellenar(v)) for k, v in plantilla['cuerpo']]
+    
+    for intento in range(MAX_RETRIES):
+        try:
+            esperar_turno(url)
+            respuesta = obtener_sesion_http().request(plantilla['metodo'], url, **argumentos)
+            respuesta.raise_for_status()
+            return parsear_opciones_respuesta(respuesta.text)
+        except Exception as e:
+            log_message(f"        ⚠️ Error consultando {url} (intento {intento + 1}/{MAX_RETRIES}): {e}")
+            metricas.contar("reintento_endpoint")
+            if intento < MAX_RETRIES - 1:
+                time.sleep(2)
+    return None
+
+def plantilla_reproduce(plantilla, seleccion, esperadas):
+    """True si la plantilla, repetida por HTTP con `seleccion`, devuelve los valores `esperadas`."""
+    obtenidas = consultar_opciones_endpoint(plantilla, seleccion)
+    return obtenidas is not None and [o['value'] for o in obtenidas] == esperadas
+
+def grabar_endpoints_selectores(driver):
+    """Selecciona la primera opción de cada nivel en el navegador, graba la petición que
+    rellena el siguiente selector y comprueba que al repetirla por HTTP devuelve las
+    mismas opciones que muestra la página. Devuelve {nivel_siguiente: plantilla}.
+
+    Cada plantilla se comprueba también con una segunda opción del nivel, contra lo que
+    muestra el navegador al elegirla, para no guardar una petición que solo sirve para
+    el valor grabado."""
+    if not reiniciar_selectores(driver):
+        raise RuntimeError("no se pudo cargar la página inicial")
+    
+    # La sesión HTTP usa las mismas cookies que el navegador
+    sesion = obtener_sesion_http()
+    for cookie in driver.get_cookies():
+        sesion.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'))
+    
+    seleccion = {}
+    plantillas = {}
+    for (nivel, locator), (siguiente, locator_siguiente) in zip(NIVELES_SELECTORES, NIVELES_SELECTORES[1:]):
+        opciones = TIPOS_VEHICULOS if nivel == 'tipo' else leer_opciones_selector(driver, locator)
+        if not opciones:
+            raise RuntimeError(f"el selector {nivel} no tiene opciones")
+        
+        driver.get_log('performance')  # Descartar las peticiones anteriores
+        # La segunda opción se elige antes para que el recorrido siga por la primera
+        comprobacion = None
+        if len(opciones) > 1:
+            if not seleccionar_opcion_segura_con_recuperacion(driver, locator, opciones[1]['value'], locator_siguiente, nivel, max_recovery_attempts=1):
+                raise RuntimeError(f"no se pudo seleccionar {nivel}")
+            comprobacion = (dict(seleccion, **{nivel: opciones[1]['value']}),
+                            [o['value'] for o in leer_opciones_selector(driver, locator_siguiente)])
+        if not seleccionar_opcion_segura_con_recuperacion(driver, locator, opciones[0]['value'], locator_siguiente, nivel, max_recovery_attempts=1):
+            raise RuntimeError(f"no se pudo seleccionar {nivel}")
+        seleccion[nivel] = opciones[0]['value']
+        
+        esperadas = [o['value'] for o in leer_opciones_selector(driver, locator_siguiente)]
+        for peticion in reversed(peticiones_xhr_registradas(driver)):
+            plantilla = crear_plantilla_peticion(peticion, seleccion)
+            if not plantilla_reproduce(plantilla, seleccion, esperadas):
+                continue
+            if comprobacion and not plantilla_reproduce(plantilla, *comprobacion):
+                log_message(f"    ⚠️ La petición {plantilla['url']} no sirve para otro valor de {nivel}, se descarta")
+                continue
+            plantillas[siguiente] = plantilla
+            log_message(f"    🎙️ Petición de '{siguiente}' grabada: {plantilla['metodo']} {plantilla['url']}")
+            break
+        else:
+            raise RuntimeError(f"ninguna petición reproduce las opciones de '{siguiente}' para dos valores de {nivel}")
+    
+    return plantillas
+
+def obtener_plantillas_endpoints(regrabar=False):
+    """Carga las plantillas de ENDPOINTS_FILE o las graba con un navegador temporal."""
+    if not regrabar and os.path.exists(ENDPOINTS_FILE):
+        with open(ENDPOINTS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    log_message("🎙️ Grabando las peticiones de los selectores desde el navegador...")
+    driver = configurar_driver(registrar_red=True)
+    if not driver:
+        raise RuntimeError("no se pudo iniciar el navegador")
+    try:
+        plantillas = grabar_endpoints_selectores(driver)
+    finally:
+        cerrar_driver(driver)
+    
+    with open(ENDPOINTS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(plantillas, f, ensure_ascii=False, indent=2)
+    return plantillas
+
+def recopilar_tareas_por_endpoints():
+    """Fase 1 sin clics: recorre el árbol tipo → marca → CC → modelo llamando directamente
+    a las peticiones de los selectores. Genera el mismo esquema que recopilar_todas_las_tareas_seguro."""
+    log_message("=== FASE 1 (ENDPOINTS): Creando mapa completo con llamadas directas ===")
+    try:
+        plantillas = obtener_plantillas_endpoints()
+        # Las plantillas guardadas pueden haber caducado: se comprueban con el primer tipo
+        sesion = obtener_sesion_http()
+        esperar_turno(BASE_URL)
+        sesion.get(BASE_URL, timeout=HTTP_TIMEOUT)  # Cookies de sesión
+        if not consultar_opciones_endpoint(plantillas['marca'], {'tipo': TIPOS_VEHICULOS[0]['value']}):
+            log_message("⚠️ Las peticiones grabadas ya no responden, se vuelven a grabar")
+            plantillas = obtener_plantillas_endpoints(regrabar=True)
+    except Exception as e:
+        log_message(f"❌ ERROR: No se pudieron obtener las peticiones de los selectores: {e}")
+        log_message("🔄 Se recorre el catálogo con el navegador")
+        driver_fase1 = configurar_driver()
+        if not driver_fase1:
+            log_message("❌ ERROR: No se pudo iniciar driver para Fase 1")
+            return []
+        try:
+            return recopilar_todas_las_tareas_seguro(driver_fase1)
+        finally:
+            cerrar_driver(driver_fase1)
+    
+    tareas = []
+    progreso = cargar_progreso_fase1()
+    marcas_incompletas = 0
+    for tipo in TIPOS_VEHICULOS:
+        marcas = consultar_opciones_endpoint(plantillas['marca'], {'tipo': tipo['value']}) or []
+        log_message(f"Procesando tipo: {tipo['text']} ({len(marcas)} marcas)")
+        
+        for idx_marca, marca in enumerate(marcas):
+            clave_progreso = f"{tipo['value']}|{marca['value']}"
+            if clave_progreso in progreso:
+                tareas.extend(progreso[clave_progreso])
+                continue
+            
+            seleccion = {'tipo': tipo['value'], 'marca': marca['value']}
+            ccs = consultar_opciones_endpoint(plantillas['cc'], seleccion)
+            if not ccs:
+                log_message(f"⚠️ No se encontraron CCs para {marca['text']}")
+                marcas_incompletas += 1
+                continue
+            
+            tareas_marca = []
+            marca_completa = True
+            for cc in ccs:
+                modelos = consultar_opciones_endpoint(plantillas['modelo'], dict(seleccion, cc=cc['value']))
+                if not modelos:
+                    log_message(f"⚠️ No se encontraron modelos para {marca['text']} {cc['text']}cc")
+                    marca_completa = False
+                    continue
+                for modelo in modelos:
+                    tareas_marca.append({
+                        'tipo_value': tipo['value'],
+                        'tipo_text': tipo['text'],
+                        'marca_value': marca['value'],
+                        'marca_text': marca['text'],
+                        'cc_value': cc['value'],
+                        'cc_text': cc['text'],
+                        'modelo_value': modelo['value'],
+                        'modelo_text': modelo['text']
+                    })
+            
+            log_message(f"  ✅ Marca {idx_marca + 1}/{len(marcas)}: {marca['text']} - {len(tareas_marca)} modelos")
+            tareas.extend(tareas_marca)
+            if marca_completa:
+                guardar_progreso_marca(tipo, marca, tareas_marca)
+            else:
+                marcas_incompletas += 1
+    
+    return finalizar_fase1(tareas, marcas_incompletas)
+
+# --- CONTINUAMOS CON LAS FUNCIONES ORIGINALES (sin cambios significativos) ---
+SELECTORES_PRODUCTOS = [
+    'div.vista_fitxes > div.producte',
+    'div.vista_fitxes .producte',
+    '.producte',
+    'div[class*="product"]',
+    'article.product'
+]
+SELECTOR_PAGINACION = "div.paginacio a.num[href], .pagination a[href]"
+
+def enlaces_paginacion(soup, url_actual):
+    """URLs de las demás páginas del listado, sin repetir y en el orden del paginador."""
+    otras_paginas = {}
+    for link in soup.select(SELECTOR_PAGINACION):
+        href = urljoin(url_actual, link['href'])
+        if href != url_actual:
+            otras_paginas[href] = None
+    return list(otras_paginas)
+
+def deduplicar_productos(productos):
+    """Elimina productos repetidos por URL conservando el orden de aparición."""
+    productos_unicos = []
+    urls_vistas = set()
+    for producto in productos:
+        if producto['url'] not in urls_vistas:
+            productos_unicos.append(producto)
+            urls_vistas.add(producto['url'])
+        else:
+            log_message(f"        🔄 Producto duplicado omitido: {producto['url'].split('/')[-1]}", logging.DEBUG)
+    return productos_unicos
+
+@medido("listado_completo")
+def extraer_productos_de_pagina(driver):
+    """Extrae todos los productos de la página actual, incluyendo paginación.
+    Devuelve [] si la página indica que no hay productos y None si el listado
+    no se pudo leer entero (timeout, página sin contenedor o alguna página fallida)."""
+    productos = []
+    
+    try:
+        # Esperar a que cargue el contenido
+        wait = WebDriverWait(driver, 20)
+        
+        # Intentar detectar si hay productos o si la página está vacía
+        try:
+            # Esperar a que aparezca el contenedor de productos O un mensaje de "no productos"
+            wait.until(lambda d: 
+                d.find_elements(By.CSS_SELECTOR, 'div.vista_fitxes') or 
                 d.find_elements(By.CSS_SELECTOR, '.no-products, .sin-productos') or
                 "No se han encontrado productos" in d.page_source.lower()
             )
         except TimeoutException:
             log_message("        ⚠️ Timeout esperando contenido de productos")
-            return []
+            return None
         
-        # Verificar si hay productos
-        contenedor_productos = driver.find_elements(By.CSS_SELECTOR, 'div.vista_fitxes')
-        if not contenedor_productos:
-            log_message("        ℹ️ No se encontró contenedor de productos en esta página")
-            return []
+        # Un solo page_source para todas las comprobaciones de la primera página
+        url_actual = driver.current_url
+        soup = BeautifulSoup(driver.page_source, 'lxml')
         
         # Verificar si hay mensaje de "sin productos"
-        if "no se han encontrado productos" in driver.page_source.lower():
+        if soup.select('.no-products, .sin-productos') or "no se han encontrado productos" in soup.get_text(" ").lower():
             log_message("        ℹ️ La página indica que no hay productos disponibles")
             return []
         
-        # Obtener URLs de todas las páginas de paginación
-        paginas_urls = {driver.current_url}
+        # Verificar si hay productos
+        if not soup.select('div.vista_fitxes'):
+            log_message("        ⚠️ No se encontró contenedor de productos en esta página")
+            return None
         
-        try:
-            # Buscar enlaces de paginación
-            pagination_links = driver.find_elements(By.CSS_SELECTOR, "div.paginacio a.num[href], .pagination a[href]")
-            for link in pagination_links:
-                href = link.get_attribute('href')
-                if href and href != driver.current_url:
-                    paginas_urls.add(href)
-            
-            if len(paginas_urls) > 1:
-                log_message(f"        🔄 Detectadas {len(paginas_urls)} páginas de productos")
-        except Exception as e:
-            log_message(f"        ⚠️ Error obteniendo paginación: {e}")
+        # Obtener URLs de todas las páginas de paginación (la primera es la ya cargada)
+        paginas_urls = [url_actual] + enlaces_paginacion(soup, url_actual)
+        if len(paginas_urls) > 1:
+            log_message(f"        🔄 Detectadas {len(paginas_urls)} páginas de productos")
+        
+        # Las demás páginas se descargan a la vez por HTTP, sin pasar por el navegador
+        listados = [None] + leer_paginas_listado(paginas_urls[1:])
         
         # Procesar cada página
-        for i, pagina_url in enumerate(sorted(list(paginas_urls))):
+        for i, pagina_url in enumerate(paginas_urls):
             try:
-                if i > 0:  # Si no es la primera página, navegar
-                    log_message(f"        🔄 Navegando a página {i+1}/{len(paginas_urls)}: {pagina_url}")
+                if i > 0 and listados[i] is not None and not listados[i]['aviso']:
+                    soup = None
+                elif i > 0:  # Si la descarga falló o llegó sin productos, navegar con el navegador
+                    log_message(f"        🔄 Navegando a página {i+1}/{len(paginas_urls)}: {pagina_url}", logging.DEBUG)
+                    esperar_turno(pagina_url)
                     driver.get(pagina_url)
-                    time.sleep(DELAY_BETWEEN_REQUESTS)
                     
                     # Esperar a que cargue la nueva página
                     wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'div.vista_fitxes')))
+                    soup = BeautifulSoup(driver.page_source, 'lxml')
                 
-                log_message(f"        🔍 Extrayendo productos de página {i+1}/{len(paginas_urls)}")
+                log_message(f"        🔍 Extrayendo productos de página {i+1}/{len(paginas_urls)}", logging.DEBUG)
                 
                 # Extraer productos de la página actual
-                productos_pagina = extraer_productos_pagina_actual(driver)
+                productos_pagina = listados[i]['productos'] if soup is None else parsear_productos_listado(soup, pagina_url)
                 productos.extend(productos_pagina)
                 
-                log_message(f"        📦 Página {i+1}: {len(productos_pagina)} productos extraídos")
+                log_message(f"        📦 Página {i+1}: {len(productos_pagina)} productos extraídos", logging.DEBUG)
                 
             except Exception as e:
+                # Un listado incompleto no sirve de huella ni deja la tarea como hecha
                 log_message(f"        ❌ Error procesando página {i+1}: {e}")
-                continue
+                return None
         
         # Eliminar duplicados basados en URL
-        productos_unicos = []
-        urls_vistas = set()
-        for producto in productos:
-            if producto['url'] not in urls_vistas:
-                productos_unicos.append(producto)
-                urls_vistas.add(producto['url'])
-            else:
-                log_message(f"        🔄 Producto duplicado omitido: {producto['url'].split('/')[-1]}")
+        productos_unicos = deduplicar_productos(productos)
         
         log_message(f"        ✅ Total productos únicos encontrados: {len(productos_unicos)}")
         return productos_unicos
         
     except Exception as e:
         log_message(f"        ❌ Error extrayendo productos: {e}")
+        return None
+
+# --- MOTOR HTTP SIN NAVEGADOR ---
+_sesion_http = None
+
+def obtener_sesion_http():
+    """Devuelve la sesión HTTP compartida, con un pool de conexiones keep-alive."""
+    global _sesion_http
+    if _sesion_http is None:
+        sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        sesion.mount('http://', adaptador)
+        sesion.mount('https://', adaptador)
+        sesion.headers.update({
+            'User-Agent': USER_AGENT,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'es-ES,es;q=0.9'
+        })
+        _sesion_http = sesion
+    return _sesion_http
+
+@medido("descarga_http")
+def descargar_respuesta(url, cabeceras=None):
+    """Descarga una página por HTTP con reintentos. Devuelve la respuesta (200 o 304) o None."""
+    for intento in range(MAX_RETRIES):
+        try:
+            esperar_turno(url)
+            respuesta = obtener_sesion_http().get(url, headers=cabeceras, timeout=HTTP_TIMEOUT)
+            respuesta.raise_for_status()
+            return respuesta
+        except Exception as e:
+            log_message(f"        ⚠️ Error HTTP en {url} (intento {intento + 1}/{MAX_RETRIES}): {e}")
+            metricas.contar("reintento_http")
+            if intento < MAX_RETRIES - 1:
+                time.sleep(2)
+    return None
+
+def descargar_pagina(url):
+    """Descarga una página por HTTP con reintentos. Devuelve el HTML (bytes) o None."""
+    respuesta = descargar_respuesta(url)
+    return respuesta.content if respuesta is not None else None
+
+class CacheHTTP:
+    """Respuestas ya vistas, por URL: validadores (ETag/Last-Modified), hash del cuerpo
+    y el resultado ya parseado de la página (en JSON).
+
+    Cada proceso abre su propia conexión (los trabajadores se crean con fork) y
+    los hilos de descarga la comparten con un lock; WAL permite que varios
+    procesos escriban a la vez.
+    """
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or HTTP_CACHE_FILE
+        self._lock = threading.Lock()
+        self._pid = None
+        self.conexion = None
+
+    def _conectar(self):
+        if self._pid != os.getpid():
+            self.conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None, check_same_thread=False)
+            self.conexion.execute("PRAGMA journal_mode=WAL")
+            self.conexion.execute("PRAGMA synchronous=NORMAL")
+            self.conexion.execute("""
+                CREATE TABLE IF NOT EXISTS respuestas (
+                    url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, hash TEXT, resultado TEXT, comprobada REAL
+                ) WITHOUT ROWID
+            """)
+            self._pid = os.getpid()
+        return self.conexion
+
+    def leer(self, url):
+        with self._lock:
+            fila = self._conectar().execute(
+                "SELECT etag, last_modified, hash, resultado FROM respuestas WHERE url = ?", (url,)).fetchone()
+        if not fila:
+            return None
+        return {'etag': fila[0], 'last_modified': fila[1], 'hash': fila[2], 'resultado': json.loads(fila[3])}
+
+    def guardar(self, url, etag, last_modified, resumen, resultado):
+        with self._lock:
+            self._conectar().execute("INSERT OR REPLACE INTO respuestas VALUES (?, ?, ?, ?, ?, ?)",
+                                     (url, etag, last_modified, resumen, json.dumps(resultado, ensure_ascii=False), time.time()))
+
+    def marcar_comprobada(self, url):
+        with self._lock:
+            self._conectar().execute("UPDATE respuestas SET comprobada = ? WHERE url = ?", (time.time(), url))
+
+_cache_http = None
+
+def obtener_cache_http():
+    global _cache_http
+    if _cache_http is None:
+        _cache_http = CacheHTTP()
+    return _cache_http
+
+def descargar_y_parsear(url, parsear):
+    """Devuelve parsear(html) de `url` (None si la descarga falla), evitando el parseo si la página no cambió.
+
+    Con HTTP_CACHE_ENABLED se envían If-None-Match/If-Modified-Since con los validadores
+    de la última visita; si el servidor responde 304, o el cuerpo tiene el mismo hash que
+    entonces, se devuelve el resultado guardado sin volver a parsear. `parsear` debe
+    devolver algo serializable en JSON.
+    """
+    if not HTTP_CACHE_ENABLED:
+        contenido = descargar_pagina(url)
+        return parsear(contenido) if contenido is not None else None
+    
+    cache = obtener_cache_http()
+    entrada = cache.leer(url)
+    cabeceras = {}
+    if entrada and entrada['etag']:
+        cabeceras['If-None-Match'] = entrada['etag']
+    if entrada and entrada['last_modified']:
+        cabeceras['If-Modified-Since'] = entrada['last_modified']
+    
+    respuesta = descargar_respuesta(url, cabeceras)
+    if respuesta is None:
+        return None
+    if respuesta.status_code == 304:
+        if entrada:
+            metricas.contar("cache_http_304")
+            cache.marcar_comprobada(url)
+            return entrada['resultado']
+        respuesta = descargar_respuesta(url)  # 304 sin entrada propia: se pide la página completa
+        if respuesta is None:
+            return None
+    
+    resumen = hashlib.sha1(respuesta.content).hexdigest()
+    etag, last_modified = respuesta.headers.get('ETag'), respuesta.headers.get('Last-Modified')
+    if entrada and entrada['hash'] == resumen:
+        metricas.contar("cache_http_mismo_cuerpo")
+        resultado = entrada['resultado']
+    else:
+        metricas.contar("cache_http_parseada")
+        resultado = parsear(respuesta.content)
+    cache.guardar(url, etag, last_modified, resumen, resultado)
+    return resultado
+
+_pool_descargas = None
+
+def obtener_pool_descargas():
+    """Hilos compartidos para descargar páginas de listado en paralelo."""
+    global _pool_descargas
+    if _pool_descargas is None:
+        _pool_descargas = ThreadPoolExecutor(max_workers=LISTING_FETCH_WORKERS)
+    return _pool_descargas
+
+def leer_pagina_listado(url):
+    """Descarga y analiza una página de listado (con la caché HTTP). Devuelve el dict de
+    analizar_pagina_listado o None si la descarga falló."""
+    return descargar_y_parsear(url, lambda contenido: analizar_pagina_listado(contenido, url))
+
+def leer_paginas_listado(urls):
+    """leer_pagina_listado de varias páginas a la vez; cada petición sigue pasando por el
+    limitador. Devuelve los resultados en el mismo orden que las URLs."""
+    if not urls:
         return []
+    return list(obtener_pool_descargas().map(leer_pagina_listado, urls))
+
+def texto_visible(elemento):
+    """Texto de un nodo con los espacios normalizados, como el .text de Selenium."""
+    return " ".join(elemento.get_text(" ").split()) if elemento else ""
 
-def extraer_productos_pagina_actual(driver):
-    """Extrae productos de la página actual con mejor detección."""
+@medido("pagina_listado")
+def parsear_productos_listado(soup, url_base):
+    """Extrae los productos ({url, marca_producto}) de una página de listado ya parseada.
+    Se usa tanto para el page_source del navegador como para el HTML descargado por HTTP."""
     productos = []
     
-    try:
-        # Buscar todos los contenedores de productos con múltiples selectores
-        contenedores_productos = []
+    contenedores_productos = []
+    for selector in SELECTORES_PRODUCTOS:
+        contenedores = soup.select(selector)
+        if contenedores:
+            contenedores_productos = contenedores
+            log_message(f"          🎯 Productos encontrados con selector: {selector} ({len(contenedores)} elementos)", logging.DEBUG)
+            break
+    
+    if not contenedores_productos:
+        log_message("          ⚠️ No se encontraron contenedores de productos con ningún selector")
+        return []
+    
+    for idx, contenedor in enumerate(contenedores_productos):
+        link_element = contenedor.find('a')
+        href = link_element.get('href') if link_element else None
+        if not href:
+            log_message(f"          ⚠️ Producto {idx+1} sin URL válida", logging.DEBUG)
+            continue
+        url_producto = urljoin(url_base, href)
         
-        # Intentar diferentes selectores para encontrar productos
-        selectores_productos = [
-            'div.vista_fitxes > div.producte',
-            'div.vista_fitxes .producte',
-            '.producte',
-            'div[class*="product"]',
-            'article.product'
-        ]
+        # Mismas estrategias que en la versión Selenium
+        marca_producto = "N/A"
+        marca_img = contenedor.select_one('div.marca img.marcaprod, .marca img, img[class*="marca"]')
+        if marca_img:
+            marca_producto = marca_img.get('title') or marca_img.get('alt')
         
-        for selector in selectores_productos:
-            contenedores = driver.find_elements(By.CSS_SELECTOR, selector)
-            if contenedores:
-                contenedores_productos = contenedores
-                log_message(f"          🎯 Productos encontrados con selector: {selector} ({len(contenedores)} elementos)")
-                break
+        if not marca_producto or marca_producto == "N/A":
+            marca_element = contenedor.select_one('.marca, [class*="brand"], .brand')
+            if marca_element:
+                marca_producto = marca_element.get('title') or texto_visible(marca_element)
+        
+        if not marca_producto or marca_producto == "N/A":
+            titulo_element = contenedor.select_one('.nom_producte, .product-name, .title, h3, h4')
+            if titulo_element:
+                palabras = texto_visible(titulo_element).split()
+                if palabras:
+                    marca_producto = palabras[0]
+        
+        marca_producto = marca_producto.strip() if marca_producto else "N/A"
+        productos.append({'url': url_producto, 'marca_producto': marca_producto})
+        log_message(f"          ✓ Producto {idx+1}: {marca_producto} - {url_producto.split('/')[-1]}", logging.DEBUG)
+    
+    return productos
+
+def analizar_pagina_listado(contenido, url):
+    """Analiza el HTML de una página de listado. Devuelve {'aviso', 'paginas', 'productos'}:
+    aviso es None, 'sin_contenedor' o 'sin_productos'; paginas son los demás enlaces del paginador."""
+    soup = BeautifulSoup(contenido, 'lxml')
+    if soup.select('.no-products, .sin-productos') or "no se han encontrado productos" in soup.get_text(" ").lower():
+        return {'aviso': 'sin_productos', 'paginas': [], 'productos': []}
+    if not soup.select('div.vista_fitxes'):
+        return {'aviso': 'sin_contenedor', 'paginas': [], 'productos': []}
+    return {'aviso': None, 'paginas': enlaces_paginacion(soup, url), 'productos': parsear_productos_listado(soup, url)}
+
+@medido("listado_completo")
+def extraer_productos_de_url_http(url, contenido=None, primera_pagina=None):
+    """Versión HTTP de extraer_productos_de_pagina (mismos resultados: [] o None).
+    Si se pasa el HTML de la primera página (p.ej. driver.page_source), o su
+    análisis ya hecho en `primera_pagina`, no se vuelve a descargar."""
+    try:
+        if primera_pagina is None:
+            primera_pagina = analizar_pagina_listado(contenido, url) if contenido is not None else leer_pagina_listado(url)
+            if primera_pagina is None:
+                return None
         
-        if not contenedores_productos:
-            log_message("          ⚠️ No se encontraron contenedores de productos con ningún selector")
+        if primera_pagina['aviso'] == 'sin_contenedor':
+            log_message("        ⚠️ No se encontró contenedor de productos en esta página")
+            return None
+        if primera_pagina['aviso'] == 'sin_productos':
+            log_message("        ℹ️ La página indica que no hay productos disponibles")
             return []
         
-        for idx, contenedor in enumerate(contenedores_productos):
-            try:
-                # Obtener URL del producto
-                link_element = contenedor.find_element(By.TAG_NAME, 'a')
-                url_producto = link_element.get_attribute('href')
-                
-                if not url_producto:
-                    log_message(f"          ⚠️ Producto {idx+1} sin URL válida")
-                    continue
-                
-                # Obtener marca del producto con múltiples estrategias
-                marca_producto = "N/A"
-                
-                # Estrategia 1: Imagen con título
-                try:
-                    marca_img = contenedor.find_element(By.CSS_SELECTOR, 'div.marca img.marcaprod, .marca img, img[class*="marca"]')
-                    marca_producto = marca_img.get_attribute('title') or marca_img.get_attribute('alt')
-                except:
-                    pass
-                
-                # Estrategia 2: Elemento de marca directo
-                if not marca_producto or marca_producto == "N/A":
-                    try:
-                        marca_element = contenedor.find_element(By.CSS_SELECTOR, '.marca, [class*="brand"], .brand')
-                        marca_producto = marca_element.get_attribute('title') or marca_element.text.strip()
-                    except:
-                        pass
-                
-                # Estrategia 3: Buscar en el título o nombre del producto
-                if not marca_producto or marca_producto == "N/A":
-                    try:
-                        titulo_element = contenedor.find_element(By.CSS_SELECTOR, '.nom_producte, .product-name, .title, h3, h4')
-                        titulo_texto = titulo_element.text.strip()
-                        # Intentar extraer marca del inicio del título
-                        palabras = titulo_texto.split()
-                        if palabras:
-                            marca_producto = palabras[0]
-                    except:
-                        pass
-                
-                marca_producto = marca_producto.strip() if marca_producto else "N/A"
-                
-                producto = {
-                    'url': url_producto,
-                    'marca_producto': marca_producto
-                }
-                productos.append(producto)
-                
-                log_message(f"          ✓ Producto {idx+1}: {marca_producto} - {url_producto.split('/')[-1]}")
-                
-            except Exception as e:
-                log_message(f"          ❌ Error procesando producto {idx+1}: {e}")
-                continue
+        # La primera página es la ya descargada; el resto se descarga a la vez
+        paginas_urls = [url] + primera_pagina['paginas']
+        if len(paginas_urls) > 1:
+            log_message(f"        🔄 Detectadas {len(paginas_urls)} páginas de productos")
+        listados = [primera_pagina] + leer_paginas_listado(paginas_urls[1:])
         
-        return productos
+        productos = []
+        for i, pagina_url in enumerate(paginas_urls):
+            if i > 0:
+                log_message(f"        🔄 Página descargada {i+1}/{len(paginas_urls)}: {pagina_url}", logging.DEBUG)
+                if listados[i] is None or listados[i]['aviso']:
+                    motivo = "descarga fallida" if listados[i] is None else f"página {listados[i]['aviso']}"
+                    log_message(f"        ❌ Error procesando página {i+1}: {motivo}")
+                    return None
+            
+            productos_pagina = listados[i]['productos']
+            productos.extend(productos_pagina)
+            log_message(f"        📦 Página {i+1}: {len(productos_pagina)} productos extraídos", logging.DEBUG)
         
+        productos_unicos = deduplicar_productos(productos)
+        log_message(f"        ✅ Total productos únicos encontrados: {len(productos_unicos)}")
+        return productos_unicos
+    
     except Exception as e:
-        log_message(f"          ❌ Error en extraer_productos_pagina_actual: {e}")
-        return []
+        log_message(f"        ❌ Error extrayendo productos por HTTP: {e}")
+        return None
 
-def extraer_detalle_producto(driver, url_producto, marca_producto, datos_moto):
-    """Extrae los detalles completos de un producto específico (SIN buscar MEIWA/HIFLO)."""
+def parsear_detalle_producto(soup):
+    """Devuelve (nombre, referencia) de una ficha de producto ya descargada."""
+    if not soup.select_one('.detalls'):
+        raise ValueError("la página no contiene '.detalls'")
+    
+    nombre_element = soup.select_one('.nom_producte > span') or soup.select_one('.nom_producte')
+    nombre_producto = texto_visible(nombre_element) if nombre_element else "N/A"
+    
+    # Equivalente a //div[span[contains(text(), 'Referencia:')]] con su alternativa
+    referencia_principal = "N/A"
+    for span in soup.find_all('span'):
+        if any('Referencia:' in t for t in span.find_all(string=True, recursive=False)):
+            ref_element = span.parent if span.parent.name == 'div' else span
+            referencia_principal = texto_visible(ref_element).replace('Referencia:', '').strip()
+            break
+    
+    return nombre_producto, referencia_principal
+
+@medido("detalle_navegador")
+def leer_detalle_selenium(driver, url_producto):
+    """Carga la ficha de producto en el navegador y devuelve (nombre, referencia)."""
+    esperar_turno(url_producto)
+    driver.get(url_producto)
+    wait = WebDriverWait(driver, 20)
+    
+    # Esperar a que cargue la página del producto
+    wait.until(EC.presence_of_element_located((By.CLASS_NAME, 'detalls')))
+    
+    # Extraer nombre del producto
+    nombre_producto = "N/A"
     try:
-        driver.get(url_producto)
-        wait = WebDriverWait(driver, 20)
-        
-        # Esperar a que cargue la página del producto
-        wait.until(EC.presence_of_element_located((By.CLASS_NAME, 'detalls')))
-        time.sleep(1)
-        
-        # Extraer nombre del producto
-        nombre_producto = "N/A"
+        nombre_element = driver.find_element(By.CSS_SELECTOR, '.nom_producte > span')
+        nombre_producto = nombre_element.text.strip()
+    except:
         try:
-            nombre_element = driver.find_element(By.CSS_SELECTOR, '.nom_producte > span')
+            nombre_element = driver.find_element(By.CSS_SELECTOR, '.nom_producte')
             nombre_producto = nombre_element.text.strip()
         except:
-            try:
-                nombre_element = driver.find_element(By.CSS_SELECTOR, '.nom_producte')
-                nombre_producto = nombre_element.text.strip()
-            except:
-                pass
-        
-        # Extraer referencia principal
-        referencia_principal = "N/A"
+            pass
+    
+    # Extraer referencia principal
+    referencia_principal = "N/A"
+    try:
+        ref_element = driver.find_element(By.XPATH, "//div[span[contains(text(), 'Referencia:')]]")
+        referencia_principal = ref_element.text.replace('Referencia:', '').strip()
+    except:
         try:
-            ref_element = driver.find_element(By.XPATH, "//div[span[contains(text(), 'Referencia:')]]")
+            ref_element = driver.find_element(By.XPATH, "//span[contains(text(), 'Referencia:')]")
             referencia_principal = ref_element.text.replace('Referencia:', '').strip()
         except:
-            try:
-                ref_element = driver.find_element(By.XPATH, "//span[contains(text(), 'Referencia:')]")
-                referencia_principal = ref_element.text.replace('Referencia:', '').strip()
-            except:
-                pass
-        
-        # --- CAMBIO PRINCIPAL ---
-        # Asignar N/A directamente sin buscar en la web.
-        ref_meiwa = "N/A"
-        ref_hiflo = "N/A"
-        # Todo el bloque de código que buscaba "más información" ha sido eliminado.
+            pass
+    
+    return nombre_producto, referencia_principal
+
+def leer_detalle_http(url_producto):
+    """Descarga la ficha de producto sin navegador (con la caché HTTP) y devuelve (nombre, referencia)."""
+    detalle = descargar_y_parsear(url_producto, lambda contenido: parsear_detalle_producto(BeautifulSoup(contenido, 'lxml')))
+    if detalle is None:
+        raise ValueError("descarga fallida")
+    return tuple(detalle)
+
+def construir_registro(datos_moto, nombre_producto, marca_producto, referencia_principal, url_producto):
+    """Crea la fila del CSV combinando los datos de la moto con los del producto."""
+    # Las referencias MEIWA/HIFLO no se buscan en la web: siempre N/A
+    ref_meiwa = "N/A"
+    ref_hiflo = "N/A"
+    
+    return [
+        datos_moto['tipo_text'],           # TIPO
+        datos_moto['marca_text'],          # MARCA MOTO
+        datos_moto['modelo_parseado'],     # MODELO
+        datos_moto['cc_parseado'],         # CC
+        datos_moto['anio'],                # AÑO
+        datos_moto['url_general'],         # URL GENERAL
+        nombre_producto,                   # PRODUCTO
+        marca_producto,                    # MARCA PRODUCTO
+        referencia_principal,              # REFERENCIA
+        ref_meiwa,                         # REFERENCIA MEIWA (siempre N/A)
+        ref_hiflo,                         # REFERENCIA HIFLO (siempre N/A)
+        url_producto                       # URL DEL PRODUCTO
+    ]
+
+@medido("detalle_producto")
+def extraer_detalle_producto(driver, url_producto, marca_producto, datos_moto):
+    """Extrae los detalles completos de un producto específico (SIN buscar MEIWA/HIFLO).
+    Si el producto ya está en la caché, construye la fila sin volver a cargar su página."""
+    cacheado = obtener_detalle_cache(url_producto)
+    if cacheado:
+        if not marca_producto or marca_producto == "N/A":
+            marca_producto = cacheado.get('marca') or "N/A"
+        log_message(f"        💾 Detalle desde caché: {url_producto.split('/')[-1]}", logging.DEBUG)
+        metricas.contar("detalle_cache")
+        return construir_registro(datos_moto, cacheado['nombre'], marca_producto, cacheado['referencia'], url_producto)
+    
+    try:
+        if FETCH_BACKEND == "http":
+            nombre_producto, referencia_principal = leer_detalle_http(url_producto)
+        else:
+            nombre_producto, referencia_principal = leer_detalle_selenium(driver, url_producto)
         
-        # Crear registro completo
-        registro = [
-            datos_moto['tipo_text'],           # TIPO
-            datos_moto['marca_text'],          # MARCA MOTO
-            datos_moto['modelo_parseado'],     # MODELO
-            datos_moto['cc_parseado'],         # CC
-            datos_moto['anio'],                # AÑO
-            datos_moto['url_general'],         # URL GENERAL
-            nombre_producto,                   # PRODUCTO
-            marca_producto,                    # MARCA PRODUCTO
-            referencia_principal,              # REFERENCIA
-            ref_meiwa,                         # REFERENCIA MEIWA (siempre N/A)
-            ref_hiflo,                         # REFERENCIA HIFLO (siempre N/A)
-            url_producto                       # URL DEL PRODUCTO
-        ]
+        # Solo se cachean páginas leídas correctamente
+        if nombre_producto != "N/A" or referencia_principal != "N/A":
+            guardar_detalle_cache(url_producto, nombre_producto, referencia_principal, marca_producto)
         
-        return registro
+        return construir_registro(datos_moto, nombre_producto, marca_producto, referencia_principal, url_producto)
         
     except Exception as e:
         log_message(f"ERROR extrayendo detalles de {url_producto}: {e}")
@@ -656,93 +2423,175 @@ def parsear_modelo_y_anio(texto_modelo, cc_text):
     return modelo_limpio, cc_parseado, anio
 
 # <--- REEMPLAZA TU FUNCIÓN ORIGINAL CON ESTA ---
-def procesar_tarea_seguro(driver, tarea, processed_keys):
-    """Procesa una tarea específica con manejo robusto de errores y productos por año."""
+@medido("tabla_anios")
+def parsear_tabla_anios(soup, url_base, cc_text):
+    """Lee las filas de table.resultats de una página de modelo ya descargada.
+    Devuelve None si no hay tabla de años, o la lista de filas con su URL y año."""
+    tabla_anios = soup.select("table.resultats tbody tr")
+    if not tabla_anios:
+        return None
+    log_message(f"    Encontrada tabla con {len(tabla_anios)} filas de años")
+    
+    year_column_index = -1
+    for idx, header in enumerate(soup.select("table.resultats thead th")):
+        texto_cabecera = texto_visible(header).upper()
+        if "AÑO" in texto_cabecera or "ANY" in texto_cabecera:
+            year_column_index = idx
+            log_message(f"    📅 Columna de año encontrada en posición: {idx}", logging.DEBUG)
+            break
+    
+    filas_info = []
+    for idx_fila, fila in enumerate(tabla_anios):
+        try:
+            celdas = fila.find_all('td')
+            if len(celdas) < 2:
+                continue
+            
+            link_element = celdas[0].find('a')
+            if not link_element or not link_element.get('href'):
+                raise ValueError("la primera celda no tiene enlace")
+            url_general = urljoin(url_base, link_element['href'])
+            modelo_completo = texto_visible(celdas[0])
+            
+            anio = "N/A"
+            if year_column_index >= 0 and year_column_index < len(celdas):
+                anio_texto = texto_visible(celdas[year_column_index])
+                if anio_texto.isdigit() and len(anio_texto) >= 4:
+                    anio = anio_texto
+            
+            if anio == "N/A":
+                modelo_parseado, cc_parseado, anio_parseado = parsear_modelo_y_anio(modelo_completo, cc_text)
+                anio = anio_parseado
+            else:
+                modelo_parseado, cc_parseado, _ = parsear_modelo_y_anio(modelo_completo, cc_text)
+            
+            filas_info.append({
+                'url_general': url_general,
+                'modelo_completo': modelo_completo,
+                'modelo_parseado': modelo_parseado,
+                'cc_parseado': cc_parseado,
+                'anio': anio,
+                'fila_numero': idx_fila + 1
+            })
+            
+            log_message(f"      🔍 Fila {idx_fila + 1}: {modelo_completo} - Año: {anio} - URL: {url_general}", logging.DEBUG)
+            
+        except Exception as e:
+            log_message(f"❌ ERROR recolectando información de fila {idx_fila + 1}: {e}")
+            continue
+    
+    return filas_info
+
+def huella_listado(productos):
+    """Huella de un listado: hash de las URLs de producto, sin depender del orden ni de duplicados."""
+    urls = sorted({producto['url'] for producto in productos})
+    return hashlib.sha1('\n'.join(urls).encode('utf-8')).hexdigest(), urls
+
+def procesar_listado(driver, productos, datos_moto, processed_keys, salida):
+    """Extrae el detalle de los productos nuevos de un listado (url_general).
+    Devuelve el número de productos guardados.
+
+    Si la huella del listado coincide con la guardada no se entra en ningún
+    detalle; si ha cambiado, las compatibilidades cuyo producto ya no aparece
+    se marcan como eliminadas. Un detalle que falla no deja el listado a medias:
+    se anota como pendiente y reintentar_detalles_pendientes lo repite solo."""
+    huella, urls = huella_listado(productos)
+    anterior = processed_keys.leer_huella(datos_moto['url_general'])
+    if anterior is not None and anterior[0] == huella:
+        if anterior[2] is None:
+            salida.guardar_huella(datos_moto['url_general'], huella, urls, datos_moto)  # Huella de antes de datos_moto
+        metricas.contar("listado_sin_cambios")
+        log_message(f"      💤 Listado sin cambios ({len(urls)} productos), se omiten los detalles")
+        return 0
+    
+    if anterior is not None and urls:
+        desaparecidas = sorted(set(anterior[1]) - set(urls))
+        if desaparecidas:
+            metricas.contar("compatibilidades_eliminadas", len(desaparecidas))
+            log_message(f"      🪦 {len(desaparecidas)} productos ya no aparecen en el listado; compatibilidades marcadas como eliminadas")
+            salida.eliminar_compatibilidades([(crear_clave_unica(url, datos_moto), datos_moto, url) for url in desaparecidas])
+    
+    procesados = 0
+    for producto in productos:
+        clave_unica = crear_clave_unica(producto['url'], datos_moto)
+        
+        if clave_unica in processed_keys:
+            log_message(f"        ⏭️ OMITIENDO (ya procesado para este contexto): {producto['url'].split('/')[-1]} - Año: {datos_moto['anio']}", logging.DEBUG)
+            continue
+        
+        detalle = extraer_detalle_producto(driver, producto['url'], producto['marca_producto'], datos_moto)
+        if detalle:
+            salida.guardar_fila(clave_unica, detalle)
+            processed_keys.add(clave_unica)
+            procesados += 1
+            log_message(f"        ✅ Procesado: {detalle[6]} ({detalle[7]}) - Año: {datos_moto['anio']}", logging.DEBUG)
+        else:
+            salida.anotar_pendiente(clave_unica, producto, datos_moto)
+            metricas.contar("detalles_pendientes")
+            log_message(f"        ❌ Error procesando producto (queda pendiente): {producto['url']}")
+    
+    # Un listado vacío puede ser un fallo de carga: no se toma como huella de referencia
+    if urls:
+        salida.guardar_huella(datos_moto['url_general'], huella, urls, datos_moto)
+    return procesados
+
+@medido("tarea")
+def procesar_tarea_seguro(driver, tarea, processed_keys, salida):
+    """Procesa una tarea específica con manejo robusto de errores y productos por año.
+    Las filas nuevas se entregan a `salida` (SalidaLocal o SalidaCola).
+    Devuelve (productos nuevos guardados, completa). completa es False si la tarea
+    quedó a medias (un selector, un listado sin leer o un año con error), para que el
+    diario la marque como fallida y se reintente; los detalles de producto que
+    fallan no cuentan, se reintentan sueltos (ver procesar_listado)."""
     log_message(f"\n--- Procesando: {tarea['tipo_text']} | {tarea['marca_text']} | {tarea['cc_text']} | {tarea['modelo_text']} ---")
     
     productos_procesados = 0
+    completa = True
     
     try:
         if not reiniciar_selectores(driver):
             log_message(f"❌ ERROR: No se pudo reiniciar selectores para la tarea")
-            return 0
+            return 0, False
         
         if not seleccionar_opcion_segura_con_recuperacion(driver, (By.ID, 'itipo'), tarea['tipo_value'], (By.ID, 'imarca'), "tipo"):
             log_message(f"❌ ERROR: No se pudo seleccionar tipo {tarea['tipo_text']}")
-            return 0
+            return 0, False
         
         if not seleccionar_opcion_segura_con_recuperacion(driver, (By.ID, 'imarca'), tarea['marca_value'], (By.ID, 'icc'), "marca"):
             log_message(f"❌ ERROR: No se pudo seleccionar marca {tarea['marca_text']}")
-            return 0
+            return 0, False
         
         if not seleccionar_opcion_segura_con_recuperacion(driver, (By.ID, 'icc'), tarea['cc_value'], (By.ID, 'imodel'), "CC"):
             log_message(f"❌ ERROR: No se pudo seleccionar CC {tarea['cc_text']}")
-            return 0
+            return 0, False
         
+        url_inicial = driver.current_url
         if not seleccionar_opcion_segura_con_recuperacion(driver, (By.ID, 'imodel'), tarea['modelo_value'], None, "modelo"):
             log_message(f"❌ ERROR: No se pudo seleccionar modelo {tarea['modelo_text']}")
-            return 0
+            return 0, False
         
-        time.sleep(3)
+        # Esperar a que aparezca la tabla de años o el listado de productos del modelo
+        try:
+            WebDriverWait(driver, 15).until(lambda d:
+                d.find_elements(By.CSS_SELECTOR, "table.resultats") or
+                (d.current_url != url_inicial and d.find_elements(By.CSS_SELECTOR, "div.vista_fitxes"))
+            )
+        except TimeoutException:
+            log_message("    ⚠️ Timeout esperando la página del modelo")
         
-        tabla_anios = driver.find_elements(By.CSS_SELECTOR, "table.resultats tbody tr")
+        # Tabla de años (o listado directo) leída de un único page_source
+        pagina_html = driver.page_source
+        filas_info = parsear_tabla_anios(BeautifulSoup(pagina_html, 'lxml'), driver.current_url, tarea['cc_text'])
         
-        if tabla_anios:
-            log_message(f"    Encontrada tabla con {len(tabla_anios)} filas de años")
-            
-            year_column_index = -1
-            try:
-                headers = driver.find_elements(By.CSS_SELECTOR, "table.resultats thead th")
-                for idx, header in enumerate(headers):
-                    if "AÑO" in header.text.upper() or "ANY" in header.text.upper():
-                        year_column_index = idx
-                        log_message(f"    📅 Columna de año encontrada en posición: {idx}")
-                        break
-            except:
-                year_column_index = -1
-            
-            filas_info = []
-            for idx_fila, fila in enumerate(tabla_anios):
-                try:
-                    celdas = fila.find_elements(By.TAG_NAME, 'td')
-                    if len(celdas) < 2:
-                        continue
-                    
-                    link_element = celdas[0].find_element(By.TAG_NAME, 'a')
-                    url_general = link_element.get_attribute('href')
-                    modelo_completo = celdas[0].text.strip()
-                    
-                    anio = "N/A"
-                    if year_column_index >= 0 and year_column_index < len(celdas):
-                        anio_texto = celdas[year_column_index].text.strip()
-                        if anio_texto.isdigit() and len(anio_texto) >= 4:
-                            anio = anio_texto
-                    
-                    if anio == "N/A":
-                        modelo_parseado, cc_parseado, anio_parseado = parsear_modelo_y_anio(modelo_completo, tarea['cc_text'])
-                        anio = anio_parseado
-                    else:
-                        modelo_parseado, cc_parseado, _ = parsear_modelo_y_anio(modelo_completo, tarea['cc_text'])
-                    
-                    fila_info = {
-                        'url_general': url_general,
-                        'modelo_completo': modelo_completo,
-                        'modelo_parseado': modelo_parseado,
-                        'cc_parseado': cc_parseado,
-                        'anio': anio,
-                        'fila_numero': idx_fila + 1
-                    }
-                    filas_info.append(fila_info)
-                    
-                    log_message(f"      🔍 Fila {idx_fila + 1}: {modelo_completo} - Año: {anio} - URL: {url_general}")
-                    
-                except Exception as e:
-                    log_message(f"❌ ERROR recolectando información de fila {idx_fila + 1}: {e}")
-                    continue
-            
+        if filas_info is not None:
             log_message(f"    📊 Total de filas válidas encontradas: {len(filas_info)}")
             
-            for fila_info in filas_info:
+            # Con el motor HTTP, el listado del año siguiente se descarga mientras se procesa el actual
+            siguiente_listado = None
+            for n_fila, fila_info in enumerate(filas_info):
+                listado_precargado, siguiente_listado = siguiente_listado, None
+                if FETCH_BACKEND == "http" and n_fila + 1 < len(filas_info):
+                    siguiente_listado = obtener_pool_descargas().submit(leer_pagina_listado, filas_info[n_fila + 1]['url_general'])
                 try:
                     log_message(f"\n    🔄 Procesando Año {fila_info['anio']} (Fila {fila_info['fila_numero']})...")
                     
@@ -755,39 +2604,30 @@ def procesar_tarea_seguro(driver, tarea, processed_keys):
                         'url_general': fila_info['url_general']
                     }
                     
-                    log_message(f"      🌐 Navegando a: {fila_info['url_general']}")
-                    driver.get(fila_info['url_general'])
-                    time.sleep(DELAY_BETWEEN_REQUESTS)
-                    
-                    productos = extraer_productos_de_pagina(driver)
+                    if FETCH_BACKEND == "http":
+                        log_message(f"      🌐 Descargando: {fila_info['url_general']}", logging.DEBUG)
+                        primera_pagina = listado_precargado.result() if listado_precargado else None
+                        productos = extraer_productos_de_url_http(fila_info['url_general'], primera_pagina=primera_pagina)
+                    else:
+                        log_message(f"      🌐 Navegando a: {fila_info['url_general']}", logging.DEBUG)
+                        esperar_turno(fila_info['url_general'])
+                        driver.get(fila_info['url_general'])
+                        productos = extraer_productos_de_pagina(driver)
                     
+                    if productos is None:
+                        log_message(f"      ❌ Año {fila_info['anio']}: no se pudo leer el listado")
+                        completa = False
+                        continue
                     log_message(f"      📦 Año {fila_info['anio']}: {len(productos)} productos encontrados")
                     
-                    productos_procesados_anio = 0
-                    for producto in productos:
-                        clave_unica = crear_clave_unica(producto['url'], datos_moto)
-                        
-                        if clave_unica in processed_keys:
-                            log_message(f"        ⏭️ OMITIENDO (ya procesado para este contexto): {producto['url'].split('/')[-1]} - Año: {datos_moto['anio']}")
-                            continue
-                        
-                        detalle = extraer_detalle_producto(driver, producto['url'], producto['marca_producto'], datos_moto)
-                        if detalle:
-                            guardar_registro_csv(detalle, OUTPUT_FILE)
-                            processed_keys.add(clave_unica)
-                            productos_procesados += 1
-                            productos_procesados_anio += 1
-                            log_message(f"        ✅ Procesado: {detalle[6]} ({detalle[7]}) - Año: {fila_info['anio']}")
-                        else:
-                            log_message(f"        ❌ Error procesando producto: {producto['url']}")
+                    productos_procesados_anio = procesar_listado(driver, productos, datos_moto, processed_keys, salida)
+                    productos_procesados += productos_procesados_anio
                     
                     log_message(f"      📈 Año {fila_info['anio']} completado: {productos_procesados_anio} productos procesados")
                     
-                    if len(filas_info) > 1:
-                        time.sleep(1)
-                    
                 except Exception as e:
                     log_message(f"❌ ERROR procesando año {fila_info['anio']}: {e}")
+                    completa = False
                     continue
         
         else:
@@ -805,44 +2645,78 @@ def procesar_tarea_seguro(driver, tarea, processed_keys):
                 'url_general': url_general
             }
             
-            productos = extraer_productos_de_pagina(driver)
-            log_message(f"    {len(productos)} productos encontrados")
-            
-            for producto in productos:
-                clave_unica = crear_clave_unica(producto['url'], datos_moto)
-                
-                if clave_unica in processed_keys:
-                    log_message(f"      ⏭️ OMITIENDO (ya procesado para este contexto): {producto['url'].split('/')[-1]} - Año: {datos_moto['anio']}")
-                    continue
-                
-                detalle = extraer_detalle_producto(driver, producto['url'], producto['marca_producto'], datos_moto)
-                if detalle:
-                    guardar_registro_csv(detalle, OUTPUT_FILE)
-                    processed_keys.add(clave_unica)
-                    productos_procesados += 1
-                    log_message(f"      ✅ Procesado: {detalle[6]} - {detalle[7]} - Año: {datos_moto['anio']}")
+            if FETCH_BACKEND == "http":
+                # La primera página ya está en el navegador: se parsea su HTML
+                productos = extraer_productos_de_url_http(url_general, pagina_html)
+            else:
+                productos = extraer_productos_de_pagina(driver)
+            if productos is None:
+                log_message("    ❌ No se pudo leer el listado de productos")
+                completa = False
+            else:
+                log_message(f"    {len(productos)} productos encontrados")
+                productos_procesados = procesar_listado(driver, productos, datos_moto, processed_keys, salida)
         
-        log_message(f"--- Tarea completada: {productos_procesados} productos procesados ---")
-        return productos_procesados
+        if not completa:
+            log_message(f"--- Tarea incompleta: {productos_procesados} productos guardados, se reintentará ---")
+        else:
+            log_message(f"--- Tarea completada: {productos_procesados} productos procesados ---")
+        return productos_procesados, completa
         
     except Exception as e:
         log_message(f"❌ ERROR CRÍTICO procesando tarea: {e}")
-        return 0
+        return productos_procesados, False
+
+FICLONE = 0x40049409  # ioctl de Linux que clona un archivo compartiendo bloques (btrfs, XFS, bcachefs)
+
+def copiar_para_backup(origen, destino, se_reemplaza=False):
+    """Copia `origen` a `destino` sin cargarlo en memoria y ocupando el mínimo espacio extra.
+
+    Si el original se va a borrar justo después basta un enlace duro; si no, se
+    intenta un reflink (copia de bloques bajo demanda) y, como último recurso, se
+    copia por bloques comprimiendo en gzip (el destino pasa a terminar en .gz),
+    salvo que el original ya esté comprimido.
+    Devuelve la ruta creada."""
+    if se_reemplaza:
+        try:
+            os.link(origen, destino)
+            return destino
+        except OSError:
+            pass
+    try:
+        import fcntl
+        with open(origen, 'rb') as f_origen:
+            with open(destino, 'xb') as f_destino:
+                try:
+                    fcntl.ioctl(f_destino.fileno(), FICLONE, f_origen.fileno())
+                    return destino
+                except OSError:
+                    pass
+            os.remove(destino)
+    except ImportError:
+        pass
+    if formato_compresion(origen):
+        with open(origen, 'rb') as f_origen, open(destino, 'xb') as f_destino:
+            shutil.copyfileobj(f_origen, f_destino, 1024 * 1024)
+        return destino
+    destino += '.gz'
+    with open(origen, 'rb') as f_origen, gzip.open(destino, 'xb', compresslevel=BACKUP_COMPRESSION_LEVEL) as f_destino:
+        shutil.copyfileobj(f_origen, f_destino, 1024 * 1024)
+    return destino
 
 def hacer_backup_archivos():
-    """Crear backup de archivos existentes antes de empezar"""
+    """Crear backup de archivos existentes antes de empezar.
+    El CSV se borra a continuación, así que su backup es un enlace duro; el log sigue abierto y se clona o comprime."""
     timestamp = time.strftime("%Y%m%d_%H%M%S")
     archivos_backup = []
     
-    files_to_backup = [OUTPUT_FILE, LOG_FILE]
+    files_to_backup = [(OUTPUT_FILE, True), (LOG_FILE, False)]
     
-    for file in files_to_backup:
+    for file, se_reemplaza in files_to_backup:
         if os.path.exists(file):
             try:
                 backup_name = file.replace('.csv', f'_backup_{timestamp}.csv').replace('.txt', f'_backup_{timestamp}.txt')
-                with open(file, 'r', encoding='utf-8') as original:
-                    with open(backup_name, 'w', encoding='utf-8') as backup:
-                        backup.write(original.read())
+                backup_name = copiar_para_backup(file, backup_name, se_reemplaza)
                 archivos_backup.append(backup_name)
                 log_message(f"📁 Backup creado: {backup_name}")
             except Exception as e:
@@ -850,56 +2724,86 @@ def hacer_backup_archivos():
     
     return archivos_backup
 
+def ordenar_por_url(filas, tam_bloque=None):
+    """Ordena las tuplas (url, ...) por URL con memoria acotada (ordenación externa).
+
+    Cada bloque de `tam_bloque` filas se ordena en memoria y, si hay más de uno,
+    se guarda en un temporal gzip; al final se mezclan los bloques con heapq.merge."""
+    tam_bloque = tam_bloque or VERIFY_SORT_CHUNK_ROWS
+    with tempfile.TemporaryDirectory(prefix="verificacion-") as directorio:
+        bloques = []
+        while True:
+            bloque = sorted(itertools.islice(filas, tam_bloque))
+            if not bloque:
+                break
+            if len(bloque) < tam_bloque and not bloques:
+                yield from bloque  # Todo cupo en un bloque: no hace falta tocar el disco
+                return
+            ruta = os.path.join(directorio, f"bloque_{len(bloques)}.csv.gz")
+            with gzip.open(ruta, 'wt', newline='', encoding='utf-8', compresslevel=1) as f:
+                csv.writer(f).writerows(bloque)
+            bloques.append(ruta)
+        archivos = [gzip.open(ruta, 'rt', newline='', encoding='utf-8') for ruta in bloques]
+        try:
+            yield from heapq.merge(*(map(tuple, csv.reader(f)) for f in archivos))
+        finally:
+            for f in archivos:
+                f.close()
+
 def verificar_resultado_final(csv_file):
-    """Verifica que el proceso funcionó correctamente"""
+    """Verifica que el proceso funcionó correctamente.
+    Una sola lectura del CSV; los productos se agrupan por URL con ordenar_por_url,
+    así que la memoria no crece con el resultado y los ejemplos salen en orden de URL."""
     try:
-        productos_por_url = {}
-        total_registros = 0
+        total_registros = registros_con_anio = 0
+        productos_unicos = productos_multiples_años = 0
+        ejemplos = []
         
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
+        def filas_con_url(reader):
+            nonlocal total_registros, registros_con_anio
             for row in reader:
                 total_registros += 1
                 url = row.get('URL DEL PRODUCTO', '')
                 if url:
-                    if url not in productos_por_url:
-                        productos_por_url[url] = []
-                    productos_por_url[url].append({
-                        'marca': row.get('MARCA', ''),
-                        'modelo': row.get('MODELO', ''),
-                        'anio': row.get('AÑO', ''),
-                        'producto': row.get('Producto', '')
-                    })
+                    anio = row.get('AÑO', '')
+                    if anio != 'N/A':
+                        registros_con_anio += 1
+                    yield (url, anio, row.get('MARCA', ''), row.get('MODELO', ''), row.get('Producto', ''))
+        
+        with abrir_csv(csv_file) as f:
+            filas = ordenar_por_url(filas_con_url(csv.DictReader(f)))
+            for url, registros in itertools.groupby(filas, key=lambda fila: fila[0]):
+                productos_unicos += 1
+                primero = next(registros)
+                if len(ejemplos) < 5:
+                    años = [primero[1]] + [fila[1] for fila in registros]
+                    if len(años) > 1:
+                        productos_multiples_años += 1
+                        ejemplos.append((url, primero, sorted(a for a in años if a != 'N/A')))
+                elif next(registros, None) is not None:
+                    productos_multiples_años += 1
         
         log_message(f"\n{'='*60}")
         log_message(f"📊 VERIFICACIÓN FINAL DEL RESULTADO:")
         log_message(f"   • Total de registros: {total_registros}")
-        log_message(f"   • Productos únicos (por URL): {len(productos_por_url)}")
+        log_message(f"   • Productos únicos (por URL): {productos_unicos}")
         
         # Mostrar ejemplos de productos con múltiples años
-        productos_multiples_años = {url: data for url, data in productos_por_url.items() if len(data) > 1}
-        log_message(f"   • Productos con múltiples años: {len(productos_multiples_años)}")
+        log_message(f"   • Productos con múltiples años: {productos_multiples_años}")
         
-        if productos_multiples_años:
+        if ejemplos:
             log_message(f"\n📝 EJEMPLOS DE PRODUCTOS CON MÚLTIPLES AÑOS (primeros 5):")
-            for i, (url, registros) in enumerate(list(productos_multiples_años.items())[:5]):
-                producto_nombre = registros[0]['producto']
-                años = sorted([r['anio'] for r in registros if r['anio'] != 'N/A'])
-                marca_moto = registros[0]['marca']
-                modelo_moto = registros[0]['modelo']
+            for i, (url, (_, _, marca_moto, modelo_moto, producto_nombre), años) in enumerate(ejemplos):
                 log_message(f"   {i+1}. {producto_nombre}")
                 log_message(f"      Moto: {marca_moto} {modelo_moto}")
                 log_message(f"      Años compatibles: {', '.join(años) if años else 'N/A'}")
                 log_message(f"      URL: {url.split('/')[-1]}")
         
         # Estadísticas adicionales
-        registros_con_anio = sum(1 for productos in productos_por_url.values() 
-                               for producto in productos if producto['anio'] != 'N/A')
-        
         log_message(f"\n📈 ESTADÍSTICAS ADICIONALES:")
         log_message(f"   • Registros con año específico: {registros_con_anio}")
         log_message(f"   • Registros sin año específico: {total_registros - registros_con_anio}")
-        log_message(f"   • Promedio de años por producto: {total_registros/len(productos_por_url):.1f}")
+        log_message(f"   • Promedio de años por producto: {total_registros / productos_unicos if productos_unicos else 0:.1f}")
         
         return True
         
@@ -907,10 +2811,622 @@ def verificar_resultado_final(csv_file):
         log_message(f"❌ Error verificando resultado: {e}")
         return False
 
+# --- EXPORTACIÓN NORMALIZADA (PARQUET / ARROW IPC) ---
+def exportar_normalizado(csv_file, formato, directorio=EXPORT_DIR):
+    """Convierte el CSV de resultados en dos tablas columnar:
+    - products: product_id, url, nombre, marca_producto, referencia (una fila por URL)
+    - fitment: product_id, tipo, marca, modelo, cc, anio, url_general (sin duplicados)
+    Las columnas MEIWA/HIFLO (siempre N/A) se omiten. Lee el CSV en una sola pasada
+    y escribe por lotes de EXPORT_BATCH_ROWS filas. Las compatibilidades que un
+    refresco marcó como eliminadas en el estado no pasan a fitment."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        log_message("❌ La exportación normalizada necesita pyarrow (pip install pyarrow)")
+        return False
+    
+    esquema_productos = pa.schema([
+        ('product_id', pa.int32()), ('url', pa.string()), ('nombre', pa.string()),
+        ('marca_producto', pa.string()), ('referencia', pa.string())
+    ])
+    esquema_fitment = pa.schema([
+        ('product_id', pa.int32()), ('tipo', pa.string()), ('marca', pa.string()),
+        ('modelo', pa.string()), ('cc', pa.string()), ('anio', pa.int16()), ('url_general', pa.string())
+    ])
+    extension = "parquet" if formato == "parquet" else "arrow"
+    os.makedirs(directorio, exist_ok=True)
+    rutas = {nombre: os.path.join(directorio, f"{nombre}.{extension}") for nombre in ("products", "fitment")}
+    
+    def abrir(ruta, esquema):
+        if formato == "parquet":
+            return pq.ParquetWriter(ruta + ".tmp", esquema, compression='zstd')
+        return pa.ipc.new_file(ruta + ".tmp", esquema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+    
+    def volcar(escritor, esquema, columnas):
+        if columnas[esquema.names[0]]:
+            escritor.write_table(pa.table(columnas, schema=esquema))
+            for valores in columnas.values():
+                valores.clear()
+    
+    ids_productos = {}
+    fitments_vistos = set()
+    eliminadas = claves_eliminadas()
+    productos = {nombre: [] for nombre in esquema_productos.names}
+    fitment = {nombre: [] for nombre in esquema_fitment.names}
+    total_filas = duplicadas = descartadas = 0
+    
+    escritores = []
+    exportado = False
+    try:
+        escritor_productos = abrir(rutas['products'], esquema_productos)
+        escritores.append(escritor_productos)
+        escritor_fitment = abrir(rutas['fitment'], esquema_fitment)
+        escritores.append(escritor_fitment)
+        with abrir_csv(csv_file) as f:
+            for row in csv.DictReader(f):
+                url = row.get('URL DEL PRODUCTO')
+                if not url:
+                    continue
+                total_filas += 1
+                
+                product_id = ids_productos.get(url)
+                if product_id is None:
+                    product_id = ids_productos[url] = len(ids_productos)
+                    productos['product_id'].append(product_id)
+                    productos['url'].append(url)
+                    productos['nombre'].append(row.get('Producto'))
+                    productos['marca_producto'].append(row.get('Marca Producto'))
+                    productos['referencia'].append(row.get('Referencia'))
+                    if len(productos['url']) >= EXPORT_BATCH_ROWS:
+                        volcar(escritor_productos, esquema_productos, productos)
+                
+                # Misma clave que crear_clave_unica
+                clave = (product_id, row.get('MARCA'), row.get('MODELO'), row.get('AÑO'))
+                if clave in fitments_vistos:
+                    duplicadas += 1
+                    continue
+                fitments_vistos.add(clave)
+                if eliminadas and f"{url}|{row.get('MARCA')}|{row.get('MODELO')}|{row.get('AÑO')}" in eliminadas:
+                    descartadas += 1
+                    continue
+                
+                anio = row.get('AÑO', '')
+                fitment['product_id'].append(product_id)
+                fitment['tipo'].append(row.get('TIPO'))
+                fitment['marca'].append(row.get('MARCA'))
+                fitment['modelo'].append(row.get('MODELO'))
+                fitment['cc'].append(row.get('CC'))
+                fitment['anio'].append(int(anio) if anio.isdigit() else None)
+                fitment['url_general'].append(row.get('URL GENERAL'))
+                if len(fitment['product_id']) >= EXPORT_BATCH_ROWS:
+                    volcar(escritor_fitment, esquema_fitment, fitment)
+        
+        volcar(escritor_productos, esquema_productos, productos)
+        volcar(escritor_fitment, esquema_fitment, fitment)
+        while escritores:
+            escritores.pop(0).close()
+        for ruta in rutas.values():
+            os.replace(ruta + ".tmp", ruta)
+        exportado = True
+    except Exception as e:
+        log_message(f"❌ Error exportando tablas normalizadas: {e}")
+    finally:
+        # Tras un error no quedan escritores abiertos ni .tmp a medias; las tablas anteriores se conservan
+        for escritor in escritores:
+            try:
+                escritor.close()
+            except Exception:
+                pass
+        for ruta in rutas.values():
+            if os.path.exists(ruta + ".tmp"):
+                os.remove(ruta + ".tmp")
+    if not exportado:
+        return False
+    
+    log_message(f"📦 Exportación {formato} completada en '{directorio}':")
+    log_message(f"   • products: {len(ids_productos)} productos -> {rutas['products']}")
+    log_message(f"   • fitment: {total_filas - duplicadas - descartadas} compatibilidades -> {rutas['fitment']}")
+    if duplicadas:
+        log_message(f"   • Filas duplicadas descartadas: {duplicadas}")
+    if descartadas:
+        log_message(f"   • Compatibilidades eliminadas en el catálogo: {descartadas}")
+    return True
+
+# --- PERFILADO DE TAREAS ---
+# Dónde se va el tiempo de una tarea: cumtime de la función de entrada de cada categoría
+CATEGORIAS_PERFIL = [
+    ('webdriver', 'selenium/webdriver/remote/webdriver.py', 'execute'),
+    ('http', 'requests/sessions.py', 'request'),
+    ('esperas (sleep)', '~', '<built-in method time.sleep>'),
+    ('log', 'scraper.py', 'log_message'),
+    ('csv', 'scraper.py', 'volcar'),
+    ('sqlite', '~', "<method 'execute' of 'sqlite3.Connection' objects>"),
+    ('parseo html', 'bs4/__init__.py', '__init__'),
+]
+
+def tarea_muestreada(tarea, fraccion):
+    """Decide de forma estable (mismo resultado en cada ejecución) si la tarea se perfila."""
+    resumen = hashlib.md5(id_tarea(tarea).encode('utf-8')).digest()
+    return fraccion > 0 and int.from_bytes(resumen[:4], 'big') % 10000 < fraccion * 10000
+
+def tiempos_por_categoria(estadisticas):
+    """Segundos acumulados en cada categoría de CATEGORIAS_PERFIL según un pstats.Stats."""
+    tiempos = {categoria: 0.0 for categoria, _, _ in CATEGORIAS_PERFIL}
+    for (archivo, _, funcion), (_, _, _, cumtime, _) in estadisticas.stats.items():
+        for categoria, sufijo, nombre in CATEGORIAS_PERFIL:
+            if funcion == nombre and archivo.replace(os.sep, '/').endswith(sufijo):
+                tiempos[categoria] += cumtime
+    return tiempos
+
+def procesar_tarea(driver, tarea, processed_keys, salida):
+    """procesar_tarea_seguro, perfilando con cProfile las tareas de la muestra (PROFILE_SAMPLE_RATE).
+
+    Cada tarea perfilada deja su .prof en PROFILE_DIR y una línea en resumen_tareas.jsonl
+    con el tiempo real, el tiempo de CPU del proceso y lo pasado en WebDriver, HTTP,
+    sleeps, log, CSV, SQLite y parseo. Solo se perfila el hilo principal: las
+    descargas en paralelo aparecen como espera del hilo que las recoge.
+    """
+    if not tarea_muestreada(tarea, PROFILE_SAMPLE_RATE):
+        return procesar_tarea_seguro(driver, tarea, processed_keys, salida)
+    
+    perfil = cProfile.Profile()
+    inicio, inicio_cpu = time.perf_counter(), time.process_time()
+    try:
+        return perfil.runcall(procesar_tarea_seguro, driver, tarea, processed_keys, salida)
+    finally:
+        pared, cpu = time.perf_counter() - inicio, time.process_time() - inicio_cpu
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            nombre = re.sub(r'[^\w.-]+', '_', id_tarea(tarea))[:120]
+            perfil.dump_stats(os.path.join(PROFILE_DIR, f"tarea_{nombre}_{os.getpid()}.prof"))
+            resumen = {'tarea': id_tarea(tarea), 'pid': os.getpid(), 'pared': round(pared, 3), 'cpu': round(cpu, 3),
+                       'categorias': {k: round(v, 3) for k, v in tiempos_por_categoria(pstats.Stats(perfil)).items()}}
+            with open(os.path.join(PROFILE_DIR, "resumen_tareas.jsonl"), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(resumen, ensure_ascii=False) + "\n")
+            log_message(f"🔬 Tarea perfilada: {pared:.1f}s reales, {cpu:.1f}s de CPU, "
+                        f"{resumen['categorias']['webdriver']:.1f}s en WebDriver")
+        except Exception as e:
+            log_message(f"⚠️ Error guardando el perfil de la tarea: {e}")
+
+def resumir_perfiles(directorio=None, limite=40):
+    """Combina todos los .prof de `directorio` en resumen.txt: funciones más costosas
+    (acumulado y propio) y el reparto por categorías de todas las tareas perfiladas."""
+    directorio = directorio or PROFILE_DIR
+    archivos = sorted(os.path.join(directorio, f) for f in os.listdir(directorio) if f.endswith('.prof')) \
+        if os.path.isdir(directorio) else []
+    if not archivos:
+        return None
+    
+    salida_texto = io.StringIO()
+    estadisticas = pstats.Stats(*archivos, stream=salida_texto)
+    
+    totales = {'pared': 0.0, 'cpu': 0.0}
+    categorias = {categoria: 0.0 for categoria, _, _ in CATEGORIAS_PERFIL}
+    ruta_resumen = os.path.join(directorio, "resumen_tareas.jsonl")
+    if os.path.exists(ruta_resumen):
+        with open(ruta_resumen, 'r', encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    resumen = json.loads(linea)
+                except ValueError:
+                    continue
+                totales['pared'] += resumen['pared']
+                totales['cpu'] += resumen['cpu']
+                for categoria, segundos in resumen['categorias'].items():
+                    categorias[categoria] = categorias.get(categoria, 0.0) + segundos
+    
+    salida_texto.write(f"{len(archivos)} tareas perfiladas: {totales['pared']:.1f}s reales, {totales['cpu']:.1f}s de CPU del proceso\n")
+    for categoria, segundos in sorted(categorias.items(), key=lambda item: -item[1]):
+        porcentaje = segundos / totales['pared'] * 100 if totales['pared'] else 0
+        salida_texto.write(f"  {categoria:<18}{segundos:>10.1f}s {porcentaje:>6.1f}%\n")
+    salida_texto.write("\n=== POR TIEMPO ACUMULADO ===\n")
+    estadisticas.sort_stats('cumulative').print_stats(limite)
+    salida_texto.write("\n=== POR TIEMPO PROPIO ===\n")
+    estadisticas.sort_stats('tottime').print_stats(limite)
+    
+    ruta = os.path.join(directorio, "resumen.txt")
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write(salida_texto.getvalue())
+    log_message(f"🔬 Resumen de {len(archivos)} perfiles en '{ruta}'")
+    return ruta
+
+# --- FASE 2: EJECUCIÓN SECUENCIAL Y PARALELA ---
+def ejecutar_fase2_secuencial(lista_de_tareas, estado):
+    """Procesa las tareas una a una en este proceso.
+    Devuelve (productos, tareas_exitosas, tareas_con_error, tareas_saltadas)."""
+    total_productos_procesados, tareas_exitosas, tareas_con_error, tareas_saltadas = 0, 0, 0, 0
+    
+    pool_drivers = PoolDrivers()
+    salida = SalidaLocal(estado)
+    for i, tarea in enumerate(lista_de_tareas):
+        log_message(f"\n>>> TAREA {i+1}/{len(lista_de_tareas)} <<<")
+        driver = None
+        fallo_driver = False
+        productos_en_tarea, completa = 0, False
+        inicio = time.time()
+        try:
+            driver = pool_drivers.obtener()
+            if not driver:
+                log_message("❌ ERROR: No se pudo iniciar el driver. Saltando tarea.")
+            else:
+                productos_en_tarea, completa = procesar_tarea(driver, tarea, estado, salida)
+                # procesar_tarea_seguro captura sus errores: una tarea a medias también es sesión sospechosa
+                fallo_driver = not completa
+        except Exception as e:
+            log_message(f"❌ ERROR CRÍTICO en tarea {i+1}: {e}")
+            fallo_driver = True
+        finally:
+            metricas.contar("tareas_" + estado.registrar_tarea(id_tarea(tarea), productos_en_tarea, inicio,
+                                                                time.time() - inicio, completa))
+            salida.fin_de_tarea()
+            if driver:
+                pool_drivers.liberar(driver, fallo_driver)
+        
+        # Las filas guardadas cuentan aunque la tarea quede a medias
+        total_productos_procesados += productos_en_tarea
+        if not completa:
+            log_message(f"❌ Tarea falló ({productos_en_tarea} productos guardados)")
+            tareas_con_error += 1
+        elif productos_en_tarea > 0:
+            tareas_exitosas += 1
+            log_message(f"✅ Tarea {i+1} exitosa: {productos_en_tarea} productos procesados")
+        else:
+            log_message("⚠️ Tarea completada pero sin productos nuevos")
+            tareas_saltadas += 1
+    
+    pool_drivers.cerrar()
+    salida.cerrar()
+    return total_productos_procesados, tareas_exitosas, tareas_con_error, tareas_saltadas
+
+def refrescar_listados(listados, estado):
+    """Modo --refrescar: vuelve a leer directamente cada url_general con huella guardada,
+    sin pasar por la portada ni los selectores, y solo entra en los detalles de los
+    listados cuya huella cambió (ver procesar_listado). Los modelos nuevos del
+    catálogo no aparecen aquí: para eso está --actualizar-tareas.
+    Devuelve (productos, listados_con_nuevos, listados_con_error, listados_sin_nuevos)."""
+    total_productos_procesados, con_nuevos, con_error, sin_nuevos = 0, 0, 0, 0
+    
+    # El motor HTTP no necesita navegador ni para el listado ni para los detalles
+    pool_drivers = PoolDrivers() if FETCH_BACKEND != "http" else None
+    salida = SalidaLocal(estado)
+    for i, (url_general, datos_moto) in enumerate(listados):
+        log_message(f"\n>>> LISTADO {i+1}/{len(listados)}: {datos_moto['marca_text']} {datos_moto['modelo_parseado']} "
+                    f"({datos_moto['anio']}) <<<")
+        driver = None
+        fallo_driver = False
+        productos_en_listado, completo = 0, False
+        try:
+            if FETCH_BACKEND == "http":
+                productos = extraer_productos_de_url_http(url_general)
+            else:
+                driver = pool_drivers.obtener()
+                if not driver:
+                    raise RuntimeError("no se pudo iniciar el driver")
+                esperar_turno(url_general)
+                driver.get(url_general)
+                productos = extraer_productos_de_pagina(driver)
+            if productos is None:
+                log_message("    ❌ No se pudo leer el listado: se conserva la huella anterior")
+                fallo_driver = True
+            else:
+                productos_en_listado, completo = procesar_listado(driver, productos, datos_moto, estado, salida), True
+        except Exception as e:
+            log_message(f"❌ ERROR refrescando {url_general}: {e}")
+            fallo_driver = True
+        finally:
+            salida.fin_de_tarea()
+            if driver:
+                pool_drivers.liberar(driver, fallo_driver)
+        
+        total_productos_procesados += productos_en_listado
+        if not completo:
+            con_error += 1
+        elif productos_en_listado > 0:
+            con_nuevos += 1
+        else:
+            sin_nuevos += 1
+    
+    if pool_drivers:
+        pool_drivers.cerrar()
+    salida.cerrar()
+    return total_productos_procesados, con_nuevos, con_error, sin_nuevos
+
+def reintentar_detalles_pendientes(estado):
+    """Vuelve a extraer los detalles de producto que fallaron (en esta ejecución o en
+    anteriores) sin repetir sus tareas ni sus listados.
+    Devuelve (productos guardados, detalles que siguen pendientes)."""
+    pendientes = estado.detalles_pendientes()
+    if not pendientes:
+        return 0, 0
+    log_message(f"\n🔁 Reintentando {len(pendientes)} detalles de producto pendientes")
+    
+    pool_drivers = PoolDrivers() if FETCH_BACKEND != "http" else None
+    driver = pool_drivers.obtener() if pool_drivers else None
+    if pool_drivers and not driver:
+        log_message("❌ ERROR: No se pudo iniciar el driver para los detalles pendientes")
+        pool_drivers.cerrar()
+        return 0, len(pendientes)
+    
+    salida = SalidaLocal(estado)
+    guardados = 0
+    try:
+        for clave, url_producto, marca_producto, datos_moto in pendientes:
+            if clave in estado:
+                estado.add(clave)  # Ya guardado por otra vía: solo se quita de pendientes
+                continue
+            detalle = extraer_detalle_producto(driver, url_producto, marca_producto, datos_moto)
+            if detalle:
+                salida.guardar_fila(clave, detalle)
+                estado.add(clave)
+                guardados += 1
+        salida.fin_de_tarea()
+    finally:
+        if pool_drivers:
+            pool_drivers.liberar(driver, False)
+            pool_drivers.cerrar()
+        salida.cerrar()
+    
+    quedan = len(estado.detalles_pendientes())
+    log_message(f"🔁 Detalles pendientes: {guardados} recuperados, {quedan} siguen pendientes")
+    return guardados, quedan
+
+def trabajador_fase2(cola_tareas, cola_resultados, ruta_estado):
+    """Proceso trabajador: procesa tareas con su propio Chrome y envía las filas al escritor."""
+    global _sesion_http
+    _sesion_http = None  # Nunca compartir sockets heredados del proceso padre
+    metricas.reiniciar()  # Solo las de este trabajador; el escritor las suma a las suyas
+    
+    processed_keys = VistaClavesTrabajador(ruta_estado)
+    salida = SalidaCola(cola_resultados)
+    pool_drivers = PoolDrivers()
+    try:
+        while True:
+            item = cola_tareas.get()
+            if item is None:
+                break
+            i, tarea = item
+            driver = None
+            fallo_driver = False
+            productos_en_tarea, completa = 0, False
+            inicio = time.time()
+            try:
+                driver = pool_drivers.obtener()
+                if driver:
+                    productos_en_tarea, completa = procesar_tarea(driver, tarea, processed_keys, salida)
+                    fallo_driver = not completa
+                else:
+                    log_message(f"❌ ERROR: No se pudo iniciar el driver para la tarea {i+1}")
+            except Exception as e:
+                log_message(f"❌ ERROR CRÍTICO en tarea {i+1}: {e}")
+                fallo_driver = True
+            finally:
+                if driver:
+                    pool_drivers.liberar(driver, fallo_driver)
+            cola_resultados.put(('metricas', os.getpid(), metricas.instantanea(propias=True)))
+            cola_resultados.put(('tarea', i, (productos_en_tarea, completa, inicio, time.time() - inicio)))
+    finally:
+        pool_drivers.cerrar()
+        cola_resultados.put(('fin', os.getpid(), None))
+
+def ejecutar_fase2_paralela(lista_de_tareas, estado, workers):
+    """Reparte las tareas entre `workers` procesos. Este proceso es el único
+    que escribe en OUTPUT_FILE y en el estado (processed_keys), así que las
+    filas nunca se mezclan y los duplicados entre trabajadores se descartan aquí."""
+    log_message(f"🚀 Modo paralelo: {workers} procesos trabajadores")
+    total_productos_procesados, tareas_exitosas, tareas_con_error, tareas_saltadas = 0, 0, 0, 0
+    
+    cola_tareas = _procesos.Queue()
+    cola_resultados = _procesos.Queue()
+    for item in enumerate(lista_de_tareas):
+        cola_tareas.put(item)
+    for _ in range(workers):
+        cola_tareas.put(None)
+    
+    # El limitador debe existir antes de crear los procesos para que lo compartan todos
+    obtener_limitador(BASE_URL)
+    
+    # Los trabajadores consultan el estado en solo lectura para no descargar lo ya guardado
+    estado.confirmar()
+    procesos = [
+        _procesos.Process(target=trabajador_fase2, args=(cola_tareas, cola_resultados, estado.ruta))
+        for _ in range(workers)
+    ]
+    for proceso in procesos:
+        proceso.start()
+    
+    salida = SalidaLocal(estado)
+    activos = workers
+    tareas_terminadas = 0
+    while activos:
+        try:
+            tipo, dato, valor = cola_resultados.get(timeout=5)
+        except queue.Empty:
+            salida.escritor.volcar_si_toca()
+            if not any(proceso.is_alive() for proceso in procesos):
+                log_message("⚠️ Todos los trabajadores terminaron sin avisar")
+                break
+            continue
+        
+        if tipo == 'fila':
+            if dato in estado:
+                continue
+            salida.guardar_fila(dato, valor)
+            estado.add(dato)
+            total_productos_procesados += 1
+        elif tipo == 'tarea':
+            productos_en_tarea, completa, inicio, duracion = valor
+            metricas.contar("tareas_" + estado.registrar_tarea(id_tarea(lista_de_tareas[dato]), productos_en_tarea,
+                                                                inicio, duracion, completa))
+            salida.fin_de_tarea()
+            tareas_terminadas += 1
+            if not completa:
+                tareas_con_error += 1
+            elif productos_en_tarea > 0:
+                tareas_exitosas += 1
+            else:
+                tareas_saltadas += 1
+            log_message(f"📊 Tareas terminadas: {tareas_terminadas}/{len(lista_de_tareas)}")
+        elif tipo == 'huella':
+            salida.guardar_huella(dato, *valor)
+        elif tipo == 'eliminadas':
+            salida.eliminar_compatibilidades(valor)
+        elif tipo == 'pendiente':
+            salida.anotar_pendiente(dato, *valor)
+        elif tipo == 'metricas':
+            metricas.incorporar(dato, valor)
+        elif tipo == 'fin':
+            activos -= 1
+    
+    for proceso in procesos:
+        proceso.join()
+    salida.cerrar()
+    return total_productos_procesados, tareas_exitosas, tareas_con_error, tareas_saltadas
+
+# --- REPARTO DE LA FASE 2 ENTRE MÁQUINAS (SHARDS) ---
+def parsear_shard(texto):
+    """Convierte "i/N" (0 <= i < N) en (i, N) para --shard."""
+    try:
+        indice, total = (int(parte) for parte in texto.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"formato esperado i/N, p.ej. 0/4: {texto!r}")
+    if not 0 <= indice < total:
+        raise argparse.ArgumentTypeError(f"el índice debe estar entre 0 y {total - 1}: {texto!r}")
+    return indice, total
+
+def tarea_en_shard(tarea, indice, total):
+    """Reparto estable: la tarea va siempre al mismo shard mientras no cambie N."""
+    resumen = hashlib.md5(id_tarea(tarea).encode('utf-8')).digest()
+    return int.from_bytes(resumen[:8], 'big') % total == indice
+
+def nombre_shard(ruta, indice, total):
+    """'repuestos.csv' -> 'repuestos.shard0-4.csv' (el sufijo va antes de la primera extensión)."""
+    directorio, nombre = os.path.split(ruta)
+    base, punto, extension = nombre.partition('.')
+    return os.path.join(directorio, f"{base}.shard{indice}-{total}{punto}{extension}")
+
+def combinar_shards(total):
+    """Une en OUTPUT_FILE y STATE_DB los resultados de los shards 0..total-1 del directorio actual.
+
+    Las filas se añaden sin repetir la clave de crear_clave_unica (comprobada contra
+    el estado, así que se puede repetir la combinación al llegar más resultados) y se
+    omiten las compatibilidades que el shard tiene marcadas como eliminadas. El CSV de
+    cada shard puede estar en texto plano o comprimido."""
+    estado = EstadoSQLite(STATE_DB)
+    estado.sincronizar_con_csv(OUTPUT_FILE)
+    salida = SalidaLocal(estado)
+    formato = formato_compresion(OUTPUT_FILE)
+    csv_plano = OUTPUT_FILE[:-len(EXTENSIONES_COMPRESION[formato])] if formato else OUTPUT_FILE
+    total_nuevas = total_repetidas = 0
+    try:
+        for indice in range(total):
+            base = nombre_shard(csv_plano, indice, total)
+            candidatos = [base] + [base + extension for extension in EXTENSIONES_COMPRESION.values()]
+            csv_shard = next((ruta for ruta in candidatos if os.path.exists(ruta)), None)
+            estado_shard = nombre_shard(STATE_DB, indice, total)
+            if csv_shard is None:
+                log_message(f"⚠️ Shard {indice}/{total}: no existe '{base}' (ni comprimido), se omite")
+                continue
+            
+            eliminadas = claves_eliminadas(estado_shard)
+            nuevas = repetidas = 0
+            with abrir_csv(csv_shard) as f:
+                for row in csv.DictReader(f):
+                    clave = f"{row.get('URL DEL PRODUCTO')}|{row.get('MARCA')}|{row.get('MODELO')}|{row.get('AÑO')}"
+                    if clave in eliminadas:
+                        continue
+                    if clave in estado:
+                        repetidas += 1
+                        continue
+                    salida.guardar_fila(clave, [row.get(columna, '') for columna in CABECERA_CSV])
+                    estado.add(clave)
+                    nuevas += 1
+            salida.fin_de_tarea()
+            if os.path.exists(estado_shard):
+                estado.incorporar_shard(estado_shard)
+            log_message(f"🧩 Shard {indice}/{total}: {nuevas} filas nuevas, {repetidas} repetidas ({csv_shard})")
+            total_nuevas += nuevas
+            total_repetidas += repetidas
+    finally:
+        salida.cerrar()
+        estado.cerrar()
+    log_message(f"✅ Combinación terminada en '{OUTPUT_FILE}': {total_nuevas} filas nuevas, {total_repetidas} repetidas descartadas")
+    return True
+
+
 # --- SCRIPT PRINCIPAL CON MANEJO MEJORADO DE ERRORES ---
 # <--- REEMPLAZA TU BLOQUE PRINCIPAL CON ESTE ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scraper de repuestos de euromoto85.com")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="Procesos paralelos para la Fase 2, cada uno con su propio Chrome")
+    parser.add_argument('--fase1', choices=["navegador", "endpoints"], default=PHASE1_MODE,
+                        help="Cómo recorrer los selectores en la Fase 1")
+    parser.add_argument('--actualizar-tareas', action='store_true',
+                        help="Recorrer de nuevo el catálogo, guardar solo los modelos nuevos y eliminados y procesar los nuevos")
+    parser.add_argument('--solo-nuevas', action='store_true',
+                        help=f"Procesar en la Fase 2 solo las tareas de '{TASKS_ADDED_FILE}'")
+    parser.add_argument('--repetir-tareas', action='store_true',
+                        help="Procesar también las tareas que el diario marca como hechas o vacías")
+    parser.add_argument('--refrescar', action='store_true',
+                        help="Releer directamente los listados ya visitados (sin selectores) y entrar en los detalles solo de los que cambiaron")
+    parser.add_argument('--exportar', choices=["parquet", "arrow"],
+                        help=f"Solo exportar '{OUTPUT_FILE}' a tablas products/fitment en '{EXPORT_DIR}' y salir")
+    parser.add_argument('--log-nivel', choices=["DEBUG", "INFO", "WARNING", "ERROR"], default=LOG_LEVEL,
+                        help="Nivel mínimo de los mensajes del log (DEBUG incluye una línea por producto)")
+    parser.add_argument('--metricas-puerto', type=int, default=METRICS_PORT,
+                        help="Servir métricas por etapa en http://127.0.0.1:PUERTO/metrics (Prometheus) y /metrics.json")
+    parser.add_argument('--perfilar', type=float, default=PROFILE_SAMPLE_RATE, metavar='FRACCION',
+                        help=f"Perfilar con cProfile esta fracción de tareas (0-1) y dejar los resultados en '{PROFILE_DIR}'")
+    parser.add_argument('--shard', type=parsear_shard, metavar='i/N',
+                        help="Procesar solo el shard i (0..N-1) de las tareas, con resultados y estado propios")
+    parser.add_argument('--combinar', type=int, metavar='N',
+                        help=f"Solo unir en '{OUTPUT_FILE}' los resultados de los shards 0..N-1 (sin repetir filas) y salir")
+    parser.add_argument('--comprimir', choices=["gzip", "zstd"], default=OUTPUT_COMPRESSION,
+                        help=f"Escribir el CSV de resultados comprimido ('{OUTPUT_FILE}.gz' / '.zst'); un CSV plano existente se convierte "
+                             f"o se añade. Si ya existe uno comprimido se sigue usando aunque falte esta opción")
+    args = parser.parse_args()
+    if args.shard:
+        if args.combinar or args.actualizar_tareas:
+            parser.error("--shard reparte una lista de tareas ya creada; no se combina con --combinar ni --actualizar-tareas")
+        # Cada shard escribe sus propios resultados, estado, log y métricas
+        OUTPUT_FILE, STATE_DB, LOG_FILE, METRICS_FILE, TOMBSTONES_FILE, PROFILE_DIR = (
+            nombre_shard(ruta, *args.shard) for ruta in (OUTPUT_FILE, STATE_DB, LOG_FILE, METRICS_FILE, TOMBSTONES_FILE, PROFILE_DIR))
+    configurar_log(args.log_nivel)
+    PROFILE_SAMPLE_RATE = args.perfilar
+    if PROFILE_SAMPLE_RATE > 0 and os.path.isdir(PROFILE_DIR):
+        shutil.rmtree(PROFILE_DIR, ignore_errors=True)  # El resumen final es solo de esta ejecución
+    
+    # Una salida comprimida de otra ejecución se sigue usando aunque ahora falte --comprimir
+    existentes = [formato for formato in EXTENSIONES_COMPRESION
+                  if os.path.exists(nombre_con_compresion(OUTPUT_FILE, formato))]
+    if len(existentes) > 1 or (args.comprimir and existentes and existentes != [args.comprimir]):
+        log_message(f"❌ Ya hay una salida comprimida con otro formato ({', '.join(existentes)}); "
+                    f"usa ese formato o mueve el archivo")
+        exit(1)
+    OUTPUT_COMPRESSION = args.comprimir or (existentes[0] if existentes else None)
+    if OUTPUT_COMPRESSION and not args.comprimir:
+        log_message(f"🗜️ Se sigue escribiendo en {nombre_con_compresion(OUTPUT_FILE, OUTPUT_COMPRESSION)}")
+    if OUTPUT_COMPRESSION:
+        if OUTPUT_COMPRESSION == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                log_message("❌ El formato zstd necesita el paquete zstandard (pip install zstandard)")
+                exit(1)
+        csv_plano, OUTPUT_FILE = OUTPUT_FILE, nombre_con_compresion(OUTPUT_FILE, OUTPUT_COMPRESSION)
+        if csv_plano != OUTPUT_FILE and os.path.exists(csv_plano):
+            convertir_csv_comprimido(csv_plano, OUTPUT_FILE)  # Convierte o añade las filas sueltas
+    
+    if args.combinar:
+        exit(0 if combinar_shards(args.combinar) else 1)
+    
+    if args.exportar:
+        exit(0 if exportar_normalizado(OUTPUT_FILE, args.exportar) else 1)
+    
     log_message("=== INICIANDO SCRAPER EUROMOTO85 CON PRODUCTOS POR AÑO ===")
+    limpiar_perfiles_huerfanos()
+    iniciar_exportacion_metricas(args.metricas_puerto)
     
     if FORCE_FRESH_START:
         log_message("🔄 MODO RESET ACTIVADO - Iniciando proceso limpio")
@@ -923,34 +3439,49 @@ if __name__ == "__main__":
                 log_message(f"⚠️ Error eliminando archivo anterior: {e}")
     
     lista_de_tareas = []
-    if SKIP_PHASE_1 and os.path.exists(TASKS_FILE):
+    if args.actualizar_tareas:
+        lista_de_tareas = actualizar_catalogo(args.fase1)
+        if lista_de_tareas is None:
+            exit()
+        log_message(f"📋 La Fase 2 procesará solo los {len(lista_de_tareas)} modelos nuevos")
+    elif args.solo_nuevas:
+        if not os.path.exists(TASKS_ADDED_FILE):
+            log_message(f"ℹ️ No existe '{TASKS_ADDED_FILE}': no hay modelos nuevos que procesar")
+            exit()
+        lista_de_tareas = cargar_tareas(TASKS_ADDED_FILE)
+        log_message(f"📋 Se cargaron {len(lista_de_tareas)} tareas nuevas desde '{TASKS_ADDED_FILE}'")
+    elif SKIP_PHASE_1 and os.path.exists(TASKS_FILE):
         log_message(f"⏭️ SALTANDO FASE 1 - Cargando tareas existentes desde '{TASKS_FILE}'")
+        if os.path.exists(PHASE1_CHECKPOINT_FILE):
+            log_message(f"⚠️ La última Fase 1 no terminó todas las marcas ('{PHASE1_CHECKPOINT_FILE}'): "
+                        f"con SKIP_PHASE_1 = False se reanuda")
         try:
-            with open(TASKS_FILE, 'r', newline='', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                lista_de_tareas = list(reader)
+            lista_de_tareas = cargar_tareas()
             log_message(f"✅ Se cargaron {len(lista_de_tareas)} tareas")
         except Exception as e:
             log_message(f"❌ Error cargando tareas: {e}")
             exit()
     elif not SKIP_PHASE_1:
-        if os.path.exists(TASKS_FILE):
+        if os.path.exists(PHASE1_CHECKPOINT_FILE):
+            log_message(f"🔄 La última Fase 1 quedó a medias ('{PHASE1_CHECKPOINT_FILE}'): se reanuda")
+        elif os.path.exists(TASKS_FILE):
             log_message(f"📋 Cargando tareas existentes desde '{TASKS_FILE}'")
             try:
-                with open(TASKS_FILE, 'r', newline='', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    lista_de_tareas = list(reader)
+                lista_de_tareas = cargar_tareas()
                 log_message(f"✅ Se cargaron {len(lista_de_tareas)} tareas")
             except Exception as e:
                 log_message(f"❌ Error cargando tareas: {e}")
         if not lista_de_tareas:
             log_message("🔄 Creando nueva lista de tareas...")
-            driver_fase1 = configurar_driver()
-            if not driver_fase1:
-                log_message("❌ ERROR: No se pudo iniciar driver para Fase 1")
-                exit()
-            lista_de_tareas = recopilar_todas_las_tareas_seguro(driver_fase1)
-            driver_fase1.quit()
+            if args.fase1 == "endpoints":
+                lista_de_tareas = recopilar_tareas_por_endpoints()
+            else:
+                driver_fase1 = configurar_driver()
+                if not driver_fase1:
+                    log_message("❌ ERROR: No se pudo iniciar driver para Fase 1")
+                    exit()
+                lista_de_tareas = recopilar_todas_las_tareas_seguro(driver_fase1)
+                cerrar_driver(driver_fase1)
             if not lista_de_tareas:
                 log_message("❌ ERROR: No se pudieron recopilar tareas")
                 exit()
@@ -959,56 +3490,49 @@ if __name__ == "__main__":
         log_message("Opciones:\n1. Cambiar SKIP_PHASE_1 = False para crear tareas\n2. Asegurarse de que existe el archivo de tareas")
         exit()
     
-    if START_AFTER_BRAND:
-        try:
-            indices = [i for i, task in enumerate(lista_de_tareas) if task['marca_text'] == START_AFTER_BRAND]
-            if indices:
-                lista_de_tareas = lista_de_tareas[indices[-1] + 1:]
-                log_message(f"🔍 Continuando desde después de la marca: {START_AFTER_BRAND}")
-                log_message(f"📊 Tareas restantes: {len(lista_de_tareas)}")
-        except Exception as e:
-            log_message(f"⚠️ Error aplicando filtro de marca de inicio: {e}")
+    if args.shard:
+        indice, total = args.shard
+        lista_de_tareas = [t for t in lista_de_tareas if tarea_en_shard(t, indice, total)]
+        log_message(f"🧩 Shard {indice}/{total}: {len(lista_de_tareas)} tareas asignadas")
     
-    processed_keys = leer_registros_procesados(OUTPUT_FILE) if not FORCE_FRESH_START else set()
+    if FORCE_FRESH_START and os.path.exists(STATE_DB):
+        for sufijo in ("", "-wal", "-shm"):
+            if os.path.exists(STATE_DB + sufijo):
+                os.remove(STATE_DB + sufijo)
+        log_message(f"🗑️ Estado anterior eliminado: {STATE_DB}")
+    estado = EstadoSQLite(STATE_DB)
+    if estado.sincronizar_con_csv(OUTPUT_FILE) == "completa":
+        # Los productos del CSV importado pasan también a la caché de detalles
+        sembrar_cache_desde_csv(OUTPUT_FILE)
     
-    log_message(f"=== FASE 2: Procesando {len(lista_de_tareas)} tareas con productos por año ===")
-    total_productos_procesados, tareas_exitosas, tareas_con_error, tareas_saltadas = 0, 0, 0, 0
+    if args.refrescar:
+        # Las "tareas" del resumen final son aquí los listados guardados
+        lista_de_tareas = estado.listados_guardados()
+        log_message(f"=== REFRESCO: releyendo directamente {len(lista_de_tareas)} listados con huella ===")
+        resultado_fase2 = refrescar_listados(lista_de_tareas, estado)
+    elif not args.repetir_tareas:
+        # Se saltan las tareas cuyo último estado es "hecha" o "vacia"; las fallidas se reintentan
+        estados = estado.estados_tareas()
+        pendientes = [t for t in lista_de_tareas if estados.get(id_tarea(t)) not in ('hecha', 'vacia')]
+        reintentos = sum(1 for t in pendientes if estados.get(id_tarea(t)) == 'fallida')
+        if len(pendientes) < len(lista_de_tareas) or reintentos:
+            log_message(f"⏭️ Diario de tareas: {len(lista_de_tareas) - len(pendientes)} ya terminadas, "
+                        f"{reintentos} fallidas que se reintentan")
+        lista_de_tareas = pendientes
     
-    for i, tarea in enumerate(lista_de_tareas):
-        log_message(f"\n>>> TAREA {i+1}/{len(lista_de_tareas)} <<<")
-        driver = None
-        try:
-            driver = configurar_driver()
-            if not driver:
-                log_message("❌ ERROR: No se pudo iniciar el driver. Saltando tarea.")
-                tareas_con_error += 1
-                continue
-            
-            productos_en_tarea = procesar_tarea_seguro(driver, tarea, processed_keys)
-            
-            if productos_en_tarea > 0:
-                total_productos_procesados += productos_en_tarea
-                tareas_exitosas += 1
-                log_message(f"✅ Tarea {i+1} exitosa: {productos_en_tarea} productos procesados")
-            elif productos_en_tarea == 0:
-                log_message("⚠️ Tarea completada pero sin productos nuevos")
-                tareas_saltadas += 1
-            else:
-                log_message("❌ Tarea falló")
-                tareas_con_error += 1
-        except Exception as e:
-            log_message(f"❌ ERROR CRÍTICO en tarea {i+1}: {e}")
-            tareas_con_error += 1
-        finally:
-            if driver:
-                try:
-                    driver.quit()
-                    log_message(f"🔧 Driver cerrado para tarea {i+1}")
-                except:
-                    log_message(f"⚠️ Error cerrando driver para tarea {i+1}")
-            if i < len(lista_de_tareas) - 1:
-                log_message("⏳ Pausa entre tareas...")
-                time.sleep(3)
+    if not args.refrescar:
+        log_message(f"=== FASE 2: Procesando {len(lista_de_tareas)} tareas con productos por año ===")
+        if args.workers > 1 and not _FORK_DISPONIBLE:
+            log_message("⚠️ Este sistema no crea procesos con fork: la Fase 2 se ejecuta con un solo proceso")
+            args.workers = 1
+        if args.workers > 1:
+            resultado_fase2 = ejecutar_fase2_paralela(lista_de_tareas, estado, args.workers)
+        else:
+            resultado_fase2 = ejecutar_fase2_secuencial(lista_de_tareas, estado)
+    detalles_recuperados, detalles_pendientes = reintentar_detalles_pendientes(estado)
+    estado.cerrar()
+    total_productos_procesados, tareas_exitosas, tareas_con_error, tareas_saltadas = resultado_fase2
+    total_productos_procesados += detalles_recuperados
     
     log_message(f"\n" + "="*60)
     log_message(f"=== PROCESO COMPLETADO CON PRODUCTOS POR AÑO ===")
@@ -1019,12 +3543,19 @@ if __name__ == "__main__":
     log_message(f"   • Tareas saltadas (sin productos): {tareas_saltadas}")
     log_message(f"   • Tareas con error: {tareas_con_error}")
     log_message(f"   • Total de productos procesados: {total_productos_procesados}")
+    if detalles_recuperados or detalles_pendientes:
+        log_message(f"   • Detalles pendientes: {detalles_recuperados} recuperados, {detalles_pendientes} para la próxima ejecución")
     log_message(f"   • Tasa de éxito: {(tareas_exitosas/len(lista_de_tareas)*100 if len(lista_de_tareas) > 0 else 0):.1f}%")
     log_message(f"")
     log_message(f"📁 ARCHIVOS GENERADOS:")
     log_message(f"   • Datos CSV: {OUTPUT_FILE}")
     log_message(f"   • Lista de tareas: {TASKS_FILE}")
     log_message(f"   • Archivo de log: {LOG_FILE}")
+    log_message(f"   • Métricas por etapa: {METRICS_FILE}")
+    volcar_metricas()
+    resumen_metricas()
+    if PROFILE_SAMPLE_RATE > 0:
+        resumir_perfiles()
     
     if total_productos_procesados > 0 or (os.path.exists(OUTPUT_FILE) and os.path.getsize(OUTPUT_FILE) > 0):
         log_message(f"\n🔍 VERIFICANDO RESULTADO FINAL...")
@@ -1036,5 +3567,8 @@ if __name__ == "__main__":
         log_message(f"\n⚠️ SCRAPING COMPLETADO PERO SIN NUEVOS PRODUCTOS")
         log_message(f"   Es posible que todos los productos ya hayan sido procesados")
     
+    if EXPORT_FORMAT and os.path.exists(OUTPUT_FILE):
+        exportar_normalizado(OUTPUT_FILE, EXPORT_FORMAT)
+    
     log_message(f"\n" + "="*60)
     print(f"\n🏁 ¡PROCESO TERMINADO! Revisa el archivo '{OUTPUT_FILE}' para ver los resultados.")
\ No newline at end of file
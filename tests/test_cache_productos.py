@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import scraper
+
+from test_estado import DATOS_MOTO
+
+
+class CacheProductos(unittest.TestCase):
+    """Detalles de producto reutilizados entre tareas y ejecuciones mientras no caduquen."""
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        scraper.LOG_FILE = os.path.join(self.directorio.name, 'log.txt')
+        self.addCleanup(scraper.detener_log)
+        for nombre, valor in (('PRODUCT_CACHE_FILE', os.path.join(self.directorio.name, 'cache.jsonl')),
+                              ('PRODUCT_CACHE_TTL_DAYS', 30), ('FETCH_BACKEND', "http"), ('_cache_productos', None)):
+            self.addCleanup(setattr, scraper, nombre, getattr(scraper, nombre))
+            setattr(scraper, nombre, valor)
+
+    def test_acierto_sin_descargar(self):
+        scraper.guardar_detalle_cache('https://x/p1', 'Filtro', 'REF-1', 'HIFLO')
+        with mock.patch.object(scraper, 'leer_detalle_http', side_effect=AssertionError("no debe descargar")):
+            registro = scraper.extraer_detalle_producto(None, 'https://x/p1', 'N/A', DATOS_MOTO)
+        self.assertEqual(registro[6:9], ['Filtro', 'HIFLO', 'REF-1'])
+
+    def test_fallo_de_cache_descarga_y_guarda(self):
+        with mock.patch.object(scraper, 'leer_detalle_http', return_value=('Filtro', 'REF-2')) as leer:
+            scraper.extraer_detalle_producto(None, 'https://x/p2', 'NGK', DATOS_MOTO)
+            scraper.extraer_detalle_producto(None, 'https://x/p2', 'NGK', DATOS_MOTO)
+        self.assertEqual(leer.call_count, 1)
+
+    def test_persistencia_y_caducidad(self):
+        ahora = time.time()
+        scraper.guardar_detalle_cache('https://x/vigente', 'A', 'REF-A', 'NGK', ts=ahora - 29 * 86400)
+        scraper.guardar_detalle_cache('https://x/caducada', 'B', 'REF-B', 'NGK', ts=ahora - 31 * 86400)
+        self.assertIsNone(scraper.obtener_detalle_cache('https://x/caducada'))
+
+        # Otra ejecución: la caché se vuelve a leer del disco sin las entradas caducadas
+        scraper._cache_productos = None
+        self.assertEqual(scraper.obtener_detalle_cache('https://x/vigente')['referencia'], 'REF-A')
+        self.assertNotIn('https://x/caducada', scraper._cache_productos)
+
+
+if __name__ == '__main__':
+    unittest.main()
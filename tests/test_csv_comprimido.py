@@ -0,0 +1,82 @@
+import csv
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import scraper
+
+
+def fila(n):
+    return ['T', 'M', 'Mod', '125', '2001', 'g', f'Producto {n}', 'b', 'r', 'N/A', 'N/A', f'https://x/p{n}']
+
+
+class CorteYReanudacion(unittest.TestCase):
+    """Corte a mitad de un volcado -> reanudar -> añadir filas -> leer el CSV comprimido."""
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        scraper.LOG_FILE = os.path.join(self.directorio.name, 'log.txt')
+        self.addCleanup(scraper.detener_log)
+
+    def comprobar(self, extension):
+        csv_salida = os.path.join(self.directorio.name, 'salida.csv' + extension)
+        ruta_estado = os.path.join(self.directorio.name, f'estado{extension}.sqlite3')
+
+        # Primera ejecución: una tarea confirmada, más filas volcadas sin confirmar
+        estado = scraper.EstadoSQLite(ruta_estado)
+        salida = scraper.SalidaLocal(estado, csv_salida)
+        for n in range(3):
+            salida.guardar_fila(None, fila(n))
+        salida.fin_de_tarea()
+        salida.guardar_fila(None, fila(3))
+        salida.escritor.volcar()
+        # Corte a mitad del siguiente volcado: medio miembro al final del archivo
+        miembro = scraper.compresor_miembros(scraper.formato_compresion(csv_salida))(os.urandom(256).hex().encode())
+        salida.escritor._archivo.write(miembro[:len(miembro) // 2])
+        salida.escritor._archivo.close()
+        estado.conexion.close()
+
+        # Reanudación, como en el programa principal
+        estado = scraper.EstadoSQLite(ruta_estado)
+        estado.sincronizar_con_csv(csv_salida)
+        self.assertEqual(estado.posicion_csv(csv_salida), os.path.getsize(csv_salida))
+        salida = scraper.SalidaLocal(estado, csv_salida)
+        salida.guardar_fila(None, fila(4))
+        salida.cerrar()
+        self.assertEqual(estado.posicion_csv(csv_salida), os.path.getsize(csv_salida))
+        estado.cerrar()
+
+        with scraper.abrir_csv(csv_salida) as f:
+            productos = [row['Producto'] for row in csv.DictReader(f)]
+        self.assertEqual(productos, [f'Producto {n}' for n in range(5)])
+
+    def test_filas_planas_junto_al_comprimido(self):
+        """Las filas de un CSV plano escrito después del comprimido se le añaden al final."""
+        csv_plano = os.path.join(self.directorio.name, 'salida.csv')
+        for filas in (range(2), range(2, 4)):
+            escritor = scraper.EscritorCSV(csv_plano)
+            for n in filas:
+                escritor.escribir(fila(n))
+            escritor.cerrar()
+            scraper.convertir_csv_comprimido(csv_plano, csv_plano + '.gz')
+        self.assertFalse(os.path.exists(csv_plano))
+        with scraper.abrir_csv(csv_plano + '.gz') as f:
+            productos = [row['Producto'] for row in csv.DictReader(f)]
+        self.assertEqual(productos, [f'Producto {n}' for n in range(4)])
+
+    def test_gzip(self):
+        self.comprobar('.gz')
+
+    def test_zstd(self):
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            self.skipTest("zstandard no está instalado")
+        self.comprobar('.zst')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import csv
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import scraper
+
+from test_csv_comprimido import fila
+
+DATOS_MOTO = {'tipo_text': 'Moto', 'marca_text': 'M', 'modelo_parseado': 'Mod', 'cc_parseado': '125',
+              'anio': '2001', 'url_general': 'https://x/listado'}
+
+
+class DetallesPendientes(unittest.TestCase):
+    """Un detalle que falla no deja la tarea a medias: se guarda el resto y se reintenta suelto."""
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        scraper.LOG_FILE = os.path.join(self.directorio.name, 'log.txt')
+        self.addCleanup(scraper.detener_log)
+        self.addCleanup(setattr, scraper, 'FETCH_BACKEND', scraper.FETCH_BACKEND)
+        scraper.FETCH_BACKEND = "http"
+        self.csv_salida = os.path.join(self.directorio.name, 'salida.csv')
+        self.estado = scraper.EstadoSQLite(os.path.join(self.directorio.name, 'estado.sqlite3'))
+        self.addCleanup(self.estado.cerrar)
+
+    def detalle(self, falla):
+        """Sustituye la descarga del detalle: falla con las URLs de `falla` y anota las pedidas."""
+        self.pedidos = []
+
+        def extraer(driver, url_producto, marca_producto, datos_moto):
+            self.pedidos.append(url_producto)
+            if url_producto in falla:
+                return None
+            return scraper.construir_registro(datos_moto, 'Producto', marca_producto, 'REF', url_producto)
+        return mock.patch.object(scraper, 'extraer_detalle_producto', extraer)
+
+    def test_reintento_solo_del_detalle_fallido(self):
+        productos = [{'url': f'https://x/p{n}', 'marca_producto': 'b'} for n in range(3)]
+        salida = scraper.SalidaLocal(self.estado, self.csv_salida)
+        with self.detalle({'https://x/p1'}):
+            guardados = scraper.procesar_listado(None, productos, DATOS_MOTO, self.estado, salida)
+        salida.cerrar()
+        self.assertEqual(guardados, 2)
+        self.assertEqual([p[0] for p in self.estado.detalles_pendientes()], ['https://x/p1|M|Mod|2001'])
+        # La huella se guarda: el listado no se repite, solo el detalle que falta
+        self.assertIsNotNone(self.estado.leer_huella('https://x/listado'))
+
+        with mock.patch.object(scraper, 'OUTPUT_FILE', self.csv_salida), self.detalle(set()):
+            self.assertEqual(scraper.reintentar_detalles_pendientes(self.estado), (1, 0))
+        self.assertEqual(self.pedidos, ['https://x/p1'])
+        self.assertIn('https://x/p1|M|Mod|2001', self.estado)
+        with scraper.abrir_csv(self.csv_salida) as f:
+            urls = [row['URL DEL PRODUCTO'] for row in csv.DictReader(f)]
+        self.assertEqual(sorted(urls), [f'https://x/p{n}' for n in range(3)])
+
+    def test_diario_con_filas_de_una_tarea_fallida(self):
+        self.assertEqual(self.estado.registrar_tarea('t1', 5, 0, 1, completa=False), 'fallida')
+        self.assertEqual(self.estado.registrar_tarea('t2', 0, 0, 1), 'vacia')
+        self.assertEqual(self.estado.registrar_tarea('t1', 3, 2, 1), 'hecha')
+        self.assertEqual(self.estado.estados_tareas(), {'t1': 'hecha', 't2': 'vacia'})
+        productos = self.estado.conexion.execute("SELECT productos FROM diario_tareas ORDER BY id").fetchall()
+        self.assertEqual([p[0] for p in productos], [5, 0, 3])
+
+
+class SincronizacionConCSV(unittest.TestCase):
+    """Estado SQLite y CSV de resultados tras un corte: solo se lee la parte del CSV no confirmada."""
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        scraper.LOG_FILE = os.path.join(self.directorio.name, 'log.txt')
+        self.addCleanup(scraper.detener_log)
+        self.csv_salida = os.path.join(self.directorio.name, 'salida.csv')
+        self.ruta_estado = os.path.join(self.directorio.name, 'estado.sqlite3')
+
+    def clave(self, n):
+        return f'https://x/p{n}|M|Mod|2001'
+
+    def test_importacion_inicial(self):
+        escritor = scraper.EscritorCSV(self.csv_salida)
+        for n in range(3):
+            escritor.escribir(fila(n))
+        escritor.cerrar()
+        estado = scraper.EstadoSQLite(self.ruta_estado)
+        self.addCleanup(estado.cerrar)
+        self.assertEqual(estado.sincronizar_con_csv(self.csv_salida), "completa")
+        self.assertEqual(len(estado), 3)
+        self.assertIsNone(estado.sincronizar_con_csv(self.csv_salida))
+
+    def test_corte_tras_confirmar(self):
+        estado = scraper.EstadoSQLite(self.ruta_estado)
+        salida = scraper.SalidaLocal(estado, self.csv_salida)
+        salida.guardar_fila(self.clave(0), fila(0))
+        estado.add(self.clave(0))
+        estado.registrar_tarea('t1', 1, 0, 1)
+        salida.fin_de_tarea()
+        # Segunda tarea: la fila llega al disco pero el corte llega antes de confirmar
+        salida.guardar_fila(self.clave(1), fila(1))
+        estado.add(self.clave(1))
+        estado.registrar_tarea('t2', 1, 0, 1)
+        salida.escritor.volcar()
+        salida.escritor._archivo.close()
+        with open(self.csv_salida, 'ab') as f:
+            f.write(b'T,M,Mod,125,20')  # Línea a medio escribir
+        estado.conexion.close()
+
+        estado = scraper.EstadoSQLite(self.ruta_estado)
+        self.addCleanup(estado.cerrar)
+        self.assertEqual(estado.estados_tareas(), {'t1': 'hecha'})
+        self.assertNotIn(self.clave(1), estado)
+        self.assertEqual(estado.sincronizar_con_csv(self.csv_salida), "parcial")
+        self.assertIn(self.clave(1), estado)
+        self.assertEqual(len(estado), 2)
+        self.assertEqual(estado.posicion_csv(self.csv_salida), os.path.getsize(self.csv_salida))
+        with open(self.csv_salida, 'rb') as f:
+            self.assertTrue(f.read().endswith(b'https://x/p1\r\n'))
+
+    def test_csv_distinto_se_importa_entero(self):
+        estado = scraper.EstadoSQLite(self.ruta_estado)
+        self.addCleanup(estado.cerrar)
+        salida = scraper.SalidaLocal(estado, self.csv_salida)
+        for n in range(3):
+            salida.guardar_fila(self.clave(n), fila(n))
+            estado.add(self.clave(n))
+        salida.cerrar()
+        self.assertIsNone(estado.sincronizar_con_csv(self.csv_salida))
+        # El CSV se sustituye por otro más corto: la posición registrada ya no vale
+        os.remove(self.csv_salida)
+        escritor = scraper.EscritorCSV(self.csv_salida)
+        escritor.escribir(fila(7))
+        escritor.cerrar()
+        self.assertEqual(estado.sincronizar_con_csv(self.csv_salida), "completa")
+        self.assertIn(self.clave(7), estado)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import scraper
+
+from test_csv_comprimido import fila
+
+
+class ExportacionNormalizada(unittest.TestCase):
+    """Tablas products/fitment desde el CSV; un error no deja archivos .tmp."""
+
+    def setUp(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            self.skipTest("pyarrow no está instalado")
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        scraper.LOG_FILE = os.path.join(self.directorio.name, 'log.txt')
+        self.addCleanup(scraper.detener_log)
+        self.exportacion = os.path.join(self.directorio.name, 'exportacion')
+
+    def test_error_a_mitad_no_deja_temporales(self):
+        csv_salida = os.path.join(self.directorio.name, 'salida.csv')
+        escritor = scraper.EscritorCSV(csv_salida)
+        escritor.escribir(fila(0))
+        escritor.cerrar()
+        with open(csv_salida, 'ab') as f:
+            f.write(b'\xff\xfe no es utf-8\n')
+        self.assertFalse(scraper.exportar_normalizado(csv_salida, 'parquet', self.exportacion))
+        self.assertEqual(os.listdir(self.exportacion), [])
+
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+        csv_salida = os.path.join(self.directorio.name, 'salida.csv')
+        escritor = scraper.EscritorCSV(csv_salida)
+        for registro in (fila(0), fila(1), fila(0)):
+            escritor.escribir(registro)
+        escritor.cerrar()
+        self.assertTrue(scraper.exportar_normalizado(csv_salida, 'parquet', self.exportacion))
+        self.assertEqual(sorted(os.listdir(self.exportacion)), ['fitment.parquet', 'products.parquet'])
+        self.assertEqual(pq.read_table(os.path.join(self.exportacion, 'products.parquet')).num_rows, 2)
+        self.assertEqual(pq.read_table(os.path.join(self.exportacion, 'fitment.parquet')).num_rows, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import scraper
+
+
+def tarea(marca, modelo):
+    return {'tipo_value': '1', 'tipo_text': 'Moto', 'marca_value': marca, 'marca_text': marca,
+            'cc_value': '125', 'cc_text': '125', 'modelo_value': modelo, 'modelo_text': modelo}
+
+
+class MarcasIncompletas(unittest.TestCase):
+    """Una Fase 1 con marcas sin terminar no borra el progreso ni pierde modelos de TASKS_FILE."""
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        scraper.LOG_FILE = os.path.join(self.directorio.name, 'log.txt')
+        self.addCleanup(scraper.detener_log)
+        for nombre, archivo in (('TASKS_FILE', 'tareas.csv'), ('PHASE1_CHECKPOINT_FILE', 'progreso.jsonl')):
+            self.addCleanup(setattr, scraper, nombre, getattr(scraper, nombre))
+            setattr(scraper, nombre, os.path.join(self.directorio.name, archivo))
+
+    def test_incompleta_y_despues_completa(self):
+        scraper.guardar_tareas([tarea('A', 'a1'), tarea('A', 'a2'), tarea('B', 'b1'), tarea('B', 'b2')])
+        # Marca A completa (con un modelo que ya no existe); de la B solo se llegó a ver b1
+        scraper.guardar_progreso_marca({'value': '1'}, {'value': 'A', 'text': 'A'}, [tarea('A', 'a1')],
+                                       scraper.PHASE1_CHECKPOINT_FILE)
+        guardadas = scraper.finalizar_fase1([tarea('A', 'a1'), tarea('B', 'b1')], 1)
+        modelos = sorted(t['modelo_value'] for t in scraper.cargar_tareas())
+        self.assertEqual(modelos, ['a1', 'b1', 'b2'])
+        self.assertEqual(len(guardadas), 3)
+        self.assertTrue(os.path.exists(scraper.PHASE1_CHECKPOINT_FILE))
+
+        guardadas = scraper.finalizar_fase1([tarea('A', 'a1'), tarea('B', 'b1')], 0)
+        self.assertEqual(sorted(t['modelo_value'] for t in scraper.cargar_tareas()), ['a1', 'b1'])
+        self.assertFalse(os.path.exists(scraper.PHASE1_CHECKPOINT_FILE))
+
+
+if __name__ == '__main__':
+    unittest.main()
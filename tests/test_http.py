@@ -0,0 +1,144 @@
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import scraper
+
+
+def pagina_listado(ids, paginas=()):
+    fichas = "".join(f'<div class="producte"><a href="/producto?id={i}"><div class="nom_producte">PIEZA {i}</div></a>'
+                     f'<div class="marca"><img class="marcaprod" title="NGK"></div></div>' for i in ids)
+    enlaces = "".join(f'<a class="num" href="{p}">{n}</a>' for n, p in enumerate(paginas, start=1))
+    return f'<html><body><div class="vista_fitxes">{fichas}</div><div class="paginacio">{enlaces}</div></body></html>'
+
+
+class ServidorLocal:
+    """Sirve `paginas` ({ruta: html} o {ruta: código de error}) con ETag y 304, y anota las peticiones."""
+
+    def __init__(self, paginas):
+        self.paginas = paginas
+        self.peticiones = []
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                servidor.peticiones.append((self.path, self.headers.get('If-None-Match')))
+                pagina = servidor.paginas.get(self.path, 404)
+                if isinstance(pagina, int):
+                    self.send_response(pagina)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                datos = pagina.encode('utf-8')
+                etag = '"%s"' % hashlib.md5(datos).hexdigest()
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(datos)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(datos)
+
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+        self.servidor.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.servidor.server_address[1]}"
+        threading.Thread(target=self.servidor.serve_forever, args=(0.01,), daemon=True).start()
+
+    def cerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+class PruebaHTTP(unittest.TestCase):
+    """Configuración común: caché HTTP en un directorio temporal, sin esperas entre peticiones."""
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        scraper.LOG_FILE = os.path.join(self.directorio.name, 'log.txt')
+        self.addCleanup(scraper.detener_log)
+        for nombre, valor in (('HTTP_CACHE_FILE', os.path.join(self.directorio.name, 'cache_http.sqlite3')),
+                              ('_cache_http', None), ('REQUESTS_PER_SECOND', 1000), ('RATE_LIMIT_BURST', 1000),
+                              ('MAX_RETRIES', 1)):
+            self.addCleanup(setattr, scraper, nombre, getattr(scraper, nombre))
+            setattr(scraper, nombre, valor)
+
+    def servidor(self, paginas):
+        servidor = ServidorLocal(paginas)
+        self.addCleanup(servidor.cerrar)
+        return servidor
+
+
+class ListadosSinNavegador(PruebaHTTP):
+    """extraer_productos_de_url_http: [] si no hay productos, None si el listado no se pudo leer entero."""
+
+    def test_paginas_y_duplicados(self):
+        servidor = self.servidor({
+            '/listado': pagina_listado([1, 2, 3], ['/listado', '/listado?pag=2']),
+            '/listado?pag=2': pagina_listado([3, 4], ['/listado', '/listado?pag=2']),
+        })
+        productos = scraper.extraer_productos_de_url_http(servidor.url + '/listado')
+        self.assertEqual([p['url'] for p in productos], [f'{servidor.url}/producto?id={i}' for i in (1, 2, 3, 4)])
+        self.assertEqual({p['marca_producto'] for p in productos}, {'NGK'})
+
+    def test_sin_productos(self):
+        servidor = self.servidor({'/listado': '<html><body><p>No se han encontrado productos</p></body></html>'})
+        self.assertEqual(scraper.extraer_productos_de_url_http(servidor.url + '/listado'), [])
+
+    def test_listado_ilegible(self):
+        servidor = self.servidor({
+            '/sin-contenedor': '<html><body><h1>Mantenimiento</h1></body></html>',
+            '/listado': pagina_listado([1], ['/listado', '/listado?pag=2']),
+            '/listado?pag=2': 503,
+        })
+        self.assertIsNone(scraper.extraer_productos_de_url_http(servidor.url + '/sin-contenedor'))
+        self.assertIsNone(scraper.extraer_productos_de_url_http(servidor.url + '/listado'))
+
+
+class PeticionesCondicionales(PruebaHTTP):
+    """descargar_y_parsear: con un 304 se reutiliza el resultado guardado sin volver a parsear."""
+
+    def test_304_reutiliza_el_resultado(self):
+        servidor = self.servidor({'/producto': '<html><body>v1</body></html>'})
+        url = servidor.url + '/producto'
+        parseadas = []
+
+        def parsear(contenido):
+            parseadas.append(contenido)
+            return {'texto': contenido.decode('utf-8')}
+
+        primero = scraper.descargar_y_parsear(url, parsear)
+        segundo = scraper.descargar_y_parsear(url, parsear)
+        self.assertEqual(segundo, primero)
+        self.assertEqual(len(parseadas), 1)
+        self.assertIsNone(servidor.peticiones[0][1])
+        self.assertIsNotNone(servidor.peticiones[1][1])  # If-None-Match con el ETag guardado
+
+        # Otra ejecución (caché reabierta desde disco): sigue valiendo el 304
+        scraper._cache_http = None
+        self.assertEqual(scraper.descargar_y_parsear(url, parsear), primero)
+        self.assertEqual(len(parseadas), 1)
+
+        # Si la página cambia se descarga y se parsea de nuevo
+        servidor.paginas['/producto'] = '<html><body>v2</body></html>'
+        self.assertEqual(scraper.descargar_y_parsear(url, parsear), {'texto': '<html><body>v2</body></html>'})
+        self.assertEqual(len(parseadas), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import csv
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import scraper
+
+from test_csv_comprimido import fila
+from test_estado import DATOS_MOTO
+
+
+class EliminadasYReimportacion(unittest.TestCase):
+    """Las compatibilidades eliminadas no vuelven al reimportar el CSV."""
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        scraper.LOG_FILE = os.path.join(self.directorio.name, 'log.txt')
+        self.addCleanup(scraper.detener_log)
+        self.ruta_estado = os.path.join(self.directorio.name, 'estado.sqlite3')
+
+    def test_conversion_y_sincronizacion(self):
+        csv_plano = os.path.join(self.directorio.name, 'salida.csv')
+        estado = scraper.EstadoSQLite(self.ruta_estado)
+        salida = scraper.SalidaLocal(estado, csv_plano)
+        for n in range(2):
+            salida.guardar_fila('https://x/p%d|M|Mod|2001' % n, fila(n))
+        salida.fin_de_tarea()
+        salida.escritor.cerrar()
+        estado.eliminar_compatibilidad('https://x/p1|M|Mod|2001')
+        estado.confirmar()
+        self.assertEqual(scraper.claves_eliminadas(self.ruta_estado), {'https://x/p1|M|Mod|2001'})
+
+        # Pasar a CSV comprimido obliga a reimportar todas las claves del CSV
+        scraper.convertir_csv_comprimido(csv_plano, csv_plano + '.gz')
+        estado.sincronizar_con_csv(csv_plano + '.gz')
+        estado.confirmar()
+        self.assertNotIn('https://x/p1|M|Mod|2001', estado)
+        self.assertIn('https://x/p0|M|Mod|2001', estado)
+        self.assertEqual(scraper.claves_eliminadas(self.ruta_estado), {'https://x/p1|M|Mod|2001'})
+
+        # Si vuelve a aparecer deja de estar eliminada
+        estado.add('https://x/p1|M|Mod|2001')
+        estado.confirmar()
+        self.assertEqual(scraper.claves_eliminadas(self.ruta_estado), set())
+        estado.cerrar()
+
+
+class HuellaDeListado(unittest.TestCase):
+    """Listado sin cambios -> no se entra en los detalles; listado cambiado -> solo los nuevos y los eliminados."""
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        scraper.LOG_FILE = os.path.join(self.directorio.name, 'log.txt')
+        self.addCleanup(scraper.detener_log)
+        self.addCleanup(setattr, scraper, 'TOMBSTONES_FILE', scraper.TOMBSTONES_FILE)
+        scraper.TOMBSTONES_FILE = os.path.join(self.directorio.name, 'eliminadas.csv')
+        self.ruta_estado = os.path.join(self.directorio.name, 'estado.sqlite3')
+        self.pedidos = []
+
+    def extraer(self, driver, url_producto, marca_producto, datos_moto):
+        self.pedidos.append(url_producto)
+        return fila(url_producto.rsplit('p', 1)[1])
+
+    def procesar(self, estado, salida, numeros):
+        productos = [{'url': f'https://x/p{n}', 'marca_producto': 'b'} for n in numeros]
+        self.pedidos = []
+        with mock.patch.object(scraper, 'extraer_detalle_producto', self.extraer):
+            guardados = scraper.procesar_listado(None, productos, DATOS_MOTO, estado, salida)
+        salida.fin_de_tarea()
+        return guardados
+
+    def test_sin_cambios_y_con_cambios(self):
+        estado = scraper.EstadoSQLite(self.ruta_estado)
+        salida = scraper.SalidaLocal(estado, os.path.join(self.directorio.name, 'salida.csv'))
+        self.assertEqual(self.procesar(estado, salida, [0, 1, 2]), 3)
+        self.assertEqual(self.pedidos, ['https://x/p0', 'https://x/p1', 'https://x/p2'])
+
+        # Mismo conjunto en otro orden: la huella coincide y no se pide ningún detalle
+        self.assertEqual(self.procesar(estado, salida, [2, 0, 1, 0]), 0)
+        self.assertEqual(self.pedidos, [])
+        self.assertFalse(os.path.exists(scraper.TOMBSTONES_FILE))
+
+        # p1 desaparece y aparece p3: solo se pide p3 y p1 queda eliminada
+        self.assertEqual(self.procesar(estado, salida, [0, 2, 3]), 1)
+        self.assertEqual(self.pedidos, ['https://x/p3'])
+        self.assertNotIn('https://x/p1|M|Mod|2001', estado)
+        self.assertIn('https://x/p3|M|Mod|2001', estado)
+        self.assertEqual(scraper.claves_eliminadas(self.ruta_estado), {'https://x/p1|M|Mod|2001'})
+        with open(scraper.TOMBSTONES_FILE, newline='', encoding='utf-8') as f:
+            eliminadas = list(csv.DictReader(f))
+        self.assertEqual([(e['URL GENERAL'], e['URL DEL PRODUCTO'], e['AÑO']) for e in eliminadas],
+                         [('https://x/listado', 'https://x/p1', '2001')])
+        salida.cerrar()
+        estado.cerrar()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import scraper
+
+
+def consumir(limitador, veces):
+    for _ in range(veces):
+        limitador.esperar()
+
+
+class CuboDeFichas(unittest.TestCase):
+    """LimitadorTasa: ráfaga inicial sin esperas y después `tasa` peticiones por segundo,
+    también repartidas entre procesos."""
+
+    def test_rafaga_y_ritmo(self):
+        limitador = scraper.LimitadorTasa(tasa=20, rafaga=3)
+        inicio = time.monotonic()
+        consumir(limitador, 3)
+        self.assertLess(time.monotonic() - inicio, 0.05)
+        consumir(limitador, 10)
+        transcurrido = time.monotonic() - inicio
+        self.assertGreaterEqual(transcurrido, 0.45)  # 10 fichas a 20/s
+        self.assertLess(transcurrido, 0.9)
+
+    def test_compartido_entre_procesos(self):
+        if not scraper._FORK_DISPONIBLE:
+            self.skipTest("sin fork los procesos no comparten el cubo")
+        limitador = scraper.LimitadorTasa(tasa=20, rafaga=1)
+        procesos = [scraper._procesos.Process(target=consumir, args=(limitador, 5)) for _ in range(2)]
+        inicio = time.monotonic()
+        for proceso in procesos:
+            proceso.start()
+        for proceso in procesos:
+            proceso.join()
+        # 10 peticiones entre los dos procesos, con una sola de ráfaga: 9 esperas de 1/20 s
+        self.assertGreaterEqual(time.monotonic() - inicio, 0.4)
+
+    def test_un_limitador_por_host(self):
+        self.assertIs(scraper.obtener_limitador('https://a.test/x'), scraper.obtener_limitador('https://a.test/y'))
+        self.assertIsNot(scraper.obtener_limitador('https://a.test/x'), scraper.obtener_limitador('https://b.test/x'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import gzip
+import os
+import random
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import scraper
+
+from test_csv_comprimido import fila
+
+
+class VerificacionEnStreaming(unittest.TestCase):
+    """verificar_resultado_final agrupa por URL con ordenación externa y da los mismos recuentos."""
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        scraper.LOG_FILE = os.path.join(self.directorio.name, 'log.txt')
+        self.addCleanup(scraper.detener_log)
+
+    def verificar(self, csv_file):
+        mensajes = []
+        with mock.patch.object(scraper, 'log_message', lambda mensaje, *args: mensajes.append(mensaje)):
+            self.assertTrue(scraper.verificar_resultado_final(csv_file))
+        return [linea.strip() for mensaje in mensajes for linea in mensaje.splitlines()]
+
+    def test_recuentos_y_ejemplos(self):
+        # 8 productos; los pares salen en 2 o 3 años y en desorden, p1 además sin año
+        filas = []
+        for n in range(8):
+            for anio in (['2003', '2001', '2002'][:2 + n % 4 // 2] if n % 2 == 0 else ['2001']):
+                filas.append(fila(n)[:4] + [anio] + fila(n)[5:])
+        filas.append(fila(1)[:4] + ['N/A'] + fila(1)[5:])
+        random.Random(1).shuffle(filas)
+        csv_salida = os.path.join(self.directorio.name, 'salida.csv.gz')
+        escritor = scraper.EscritorCSV(csv_salida)
+        for registro in filas:
+            escritor.escribir(registro)
+        escritor.cerrar()
+
+        with mock.patch.object(scraper, 'VERIFY_SORT_CHUNK_ROWS', 3):
+            lineas = self.verificar(csv_salida)
+        self.assertIn(f'• Total de registros: {len(filas)}', lineas)
+        self.assertIn('• Productos únicos (por URL): 8', lineas)
+        self.assertIn('• Productos con múltiples años: 5', lineas)
+        self.assertIn('• Registros sin año específico: 1', lineas)
+        # Ejemplos en orden de URL, con los años ordenados
+        self.assertEqual([l for l in lineas if l.startswith('URL:')], ['URL: p0', 'URL: p1', 'URL: p2', 'URL: p4', 'URL: p6'])
+        self.assertIn('Años compatibles: 2001, 2003', lineas)
+        self.assertIn('Años compatibles: 2001, 2002, 2003', lineas)
+        self.assertIn('Años compatibles: 2001', lineas)
+
+    def test_csv_vacio(self):
+        csv_salida = os.path.join(self.directorio.name, 'salida.csv')
+        scraper.EscritorCSV(csv_salida).cerrar()
+        lineas = self.verificar(csv_salida)
+        self.assertIn('• Productos únicos (por URL): 0', lineas)
+        self.assertIn('• Promedio de años por producto: 0.0', lineas)
+
+    def test_ordenacion_externa(self):
+        filas = [(f'https://x/p{random.Random(n).randrange(50)}', str(n), 'M', 'Mod', 'P') for n in range(200)]
+        for tam_bloque in (7, 200, 1000):
+            self.assertEqual(list(scraper.ordenar_por_url(iter(filas), tam_bloque)), sorted(filas))
+        self.assertEqual(list(scraper.ordenar_por_url(iter([]), 7)), [])
+
+
+class CopiaDeBackup(unittest.TestCase):
+    """copiar_para_backup no carga el archivo en memoria y conserva el contenido."""
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        self.origen = os.path.join(self.directorio.name, 'salida.csv')
+        self.contenido = b''.join(b'fila %d\r\n' % n for n in range(5000))
+        with open(self.origen, 'wb') as f:
+            f.write(self.contenido)
+
+    def test_enlace_duro_si_se_reemplaza(self):
+        destino = scraper.copiar_para_backup(self.origen, self.origen + '.bak', se_reemplaza=True)
+        self.assertEqual(destino, self.origen + '.bak')
+        self.assertTrue(os.path.samefile(destino, self.origen))
+
+    def test_copia_si_se_conserva(self):
+        destino = scraper.copiar_para_backup(self.origen, self.origen + '.bak')
+        self.assertFalse(os.path.samefile(destino, self.origen))
+        if destino.endswith('.gz'):
+            with gzip.open(destino, 'rb') as f:
+                self.assertEqual(f.read(), self.contenido)
+        else:
+            self.assertEqual(destino, self.origen + '.bak')  # Reflink
+            with open(destino, 'rb') as f:
+                self.assertEqual(f.read(), self.contenido)
+
+
+if __name__ == '__main__':
+    unittest.main()